@@ -1,5 +1,6 @@
 from .files import get_path
 from .files import Parameters
+from .files import ParameterGrid
 from .files import calc_ML
 from .files import write_fort5
 from .files import write_fort55
@@ -7,11 +8,34 @@ from .files import write_fort56
 from .files import write_aux
 from .files import read_abn_file
 from .files import add_header
+from .files import make_header
 from .files import get_linelist
 from .files import move
 from .tluspy import tlusty
 from .tluspy import synspec
+from .execute import Job
+from .execute import submit
+from .execute import run_async
+from .grid import run_model
+from .grid import run_grid
+from .cache import ResultCache
+from .warmstart import AtmosphereIndex
+from .monitor import run_tlusty
+from .store import SpectrumStore
+from .shard import synspec_sharded
+from .sweep import abundance_sweep
+from .report import convergence_report
+from .jobqueue import JobQueue
+from .jobqueue import run_queue
+from .pipeline import run_pipeline
+from .interpolate import GridInterpolator
+from .fit import fit_many
+from .fit import refine_abundances
+from .profiles import calibrate
 from . import config
 from .pconv import pconv
 
-print('Loading...\nTlusty %i\nSynspec %i' % (config.tl_version,config.syn_version))
+import os as _os
+#the versions are printed on import unless the environment variable DAZSPEC_BANNER is 0
+if _os.environ.get('DAZSPEC_BANNER','1') != '0':
+    print('Loading...\nTlusty %i\nSynspec %i' % (config.tl_version,config.syn_version))
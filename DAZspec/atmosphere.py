@@ -0,0 +1,131 @@
+"""
+Read and write Tlusty model atmospheres (fort.7 written by Tlusty, fort.8 read by Tlusty and Synspec).
+
+The text format is:
+    ND  NUMPAR
+    ND values of the depth grid (column mass)
+    ND blocks of NUMPAR values, the state at each depth (T, ne, rho, populations...)
+all in free format with Fortran D exponents. Atmospheres can be saved in a binary .npz so that large numbers
+of them load without parsing text, and converted back to fort.8 for a warm start.
+"""
+import numpy as np
+
+
+_fortran_exp = bytes.maketrans(b'Dd', b'Ee')
+
+def read_fort7(filename='fort.7'):
+    """
+    Parse both blocks of a Tlusty atmosphere.
+
+    filename = 'fort.7': str
+
+    returns (dm, state, numpar) where dm is the depth grid with shape (ND,), state has shape (ND, |NUMPAR|)
+    and numpar is NUMPAR as written in the file
+    """
+    with open(filename,'rb') as file:
+        nd, numpar = [int(x) for x in file.readline().split()[:2]]
+        data = file.read().translate(_fortran_exp)
+    values = np.fromstring(data, dtype='float64', sep=' ')
+    n = nd * (1 + abs(numpar))
+    if len(values) < n:
+        raise ValueError('%s has %i numbers but ND=%i and NUMPAR=%i need %i' % (filename, len(values), nd, numpar, n))
+    dm = values[:nd]
+    state = values[nd:n].reshape(nd, abs(numpar))
+    return dm, state, numpar
+
+
+def write_fort8(dm, state, **kwargs):
+    """
+    Write an atmosphere in the Tlusty text format, e.g. as the starting model fort.8.
+    Numbers are written with the shortest digits that read back as exactly the same values.
+
+    dm: array (ND,), depth grid
+    state: array (ND, NUMPAR), state at each depth
+
+    kwargs:
+    filename = 'fort.8': str
+    numpar = state.shape[1]: int, NUMPAR as it should appear in the header (keeps the sign of the original file)
+    """
+    filename = kwargs.get('filename','fort.8')
+    numpar = kwargs.get('numpar',state.shape[1])
+
+    nd = len(dm)
+    with open(filename,'w') as file:
+        file.write('%5i%6i\n' % (nd, numpar))
+        file.write(_format_block(dm, 4))
+        for i in range(nd):
+            file.write(_format_block(state[i], 4))
+
+
+def _format_block(values, per_line):
+    values = ['%24s' % np.format_float_scientific(x, unique=True, exp_digits=2) for x in values]
+    lines = [''.join(values[i:i+per_line]) for i in range(0, len(values), per_line)]
+    return '\n'.join(lines).replace('e','D') + '\n'
+
+
+def save_atmosphere(filename, dm, state, **kwargs):
+    """
+    Save an atmosphere in the binary .npz format.
+
+    filename: str, the .npz file
+    dm: array (ND,), depth grid
+    state: array (ND, NUMPAR), state at each depth
+
+    kwargs:
+    numpar = state.shape[1]: int, NUMPAR of the original text file
+    any other kwargs (e.g. teff, log_g) are stored alongside the arrays
+    """
+    numpar = kwargs.pop('numpar',state.shape[1])
+    np.savez(filename, dm=dm, state=state, numpar=numpar, **kwargs)
+
+
+def load_atmosphere(filename):
+    """
+    Load an atmosphere saved with save_atmosphere.
+    returns (dm, state, numpar)
+    """
+    with np.load(filename) as data:
+        return data['dm'], data['state'], int(data['numpar'])
+
+
+def fort7_to_npz(filename, **kwargs):
+    """
+    Convert a Tlusty text atmosphere to the binary .npz format.
+
+    filename: str, the .npz file to write
+
+    kwargs:
+    fort7 = 'fort.7': str, the text atmosphere
+    any other kwargs are passed to save_atmosphere
+    """
+    fort7 = kwargs.pop('fort7','fort.7')
+    dm, state, numpar = read_fort7(fort7)
+    save_atmosphere(filename, dm, state, numpar=numpar, **kwargs)
+
+
+def npz_to_fort8(filename, **kwargs):
+    """
+    Write an atmosphere saved as .npz back out as text so that Tlusty or Synspec can use it.
+
+    filename: str, the .npz file
+
+    kwargs:
+    fort8 = 'fort.8': str, the text file to write
+    """
+    fort8 = kwargs.get('fort8','fort.8')
+    dm, state, numpar = load_atmosphere(filename)
+    write_fort8(dm, state, filename=fort8, numpar=numpar)
+
+
+def load_atmospheres(filenames):
+    """
+    Load many .npz atmospheres with the same number of depth points and parameters into single arrays.
+    returns (dm, state) with shapes (n_models, ND) and (n_models, ND, NUMPAR)
+    """
+    dms = []
+    states = []
+    for filename in filenames:
+        dm, state, numpar = load_atmosphere(filename)
+        dms.append(dm)
+        states.append(state)
+    return np.array(dms), np.array(states)
@@ -0,0 +1,376 @@
+"""
+Benchmarks of DAZspec itself.
+
+The Fortran codes are replaced by the stand-in executables of DAZspec.fake, so what is timed is everything
+DAZspec does around them: writing the input files, parsing the output, and pushing a grid through the
+process pool. Results are saved as JSON and two saved runs can be compared to catch regressions.
+
+Run with
+    python -m DAZspec.bench [--quick] [--save results.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from datetime import datetime
+
+from . import config
+from . import fake
+
+# modules that only plotting and DataFrame functions should pull in
+heavy_modules = ('pandas', 'matplotlib', 'colorama')
+
+_import_script = """
+import sys, time, json
+t = time.perf_counter()
+import DAZspec
+t = time.perf_counter() - t
+print(json.dumps({'time': t, 'heavy': [m for m in %r if m in sys.modules]}))
+""" % (heavy_modules,)
+
+
+def import_time(**kwargs):
+    """
+    Time import DAZspec in fresh interpreters, the cost every worker process and CLI call pays.
+
+    kwargs:
+    repeat = 5: int, number of interpreters to start
+
+    returns a dict with the best and all times in seconds and the heavy modules that got imported
+    """
+    repeat = kwargs.get('repeat',5)
+
+    parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DAZSPEC_BANNER='0')
+    env['PYTHONPATH'] = os.pathsep.join([parent] + [p for p in env.get('PYTHONPATH','').split(os.pathsep) if p])
+    times = []
+    heavy = set()
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _import_script], env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        times.append(result['time'])
+        heavy.update(result['heavy'])
+    return {'best': min(times), 'times': times, 'heavy': sorted(heavy)}
+
+
+def check_import_time(**kwargs):
+    """
+    Raise a RuntimeError if import DAZspec takes longer than the budget or imports pandas, matplotlib or colorama.
+
+    kwargs:
+    budget = config.import_budget: float, seconds
+    repeat = 5: int, number of interpreters to start
+
+    returns the result of import_time
+    """
+    budget = kwargs.get('budget',config.import_budget)
+    result = import_time(repeat=kwargs.get('repeat',5))
+    if result['heavy']:
+        raise RuntimeError('import DAZspec imported %s' % ', '.join(result['heavy']))
+    if result['best'] > budget:
+        raise RuntimeError('import DAZspec took %.3f s, the budget is %.3f s' % (result['best'], budget))
+    print('import DAZspec: %.3f s (budget %.3f s)' % (result['best'], budget))
+    return result
+
+
+def _best(func, repeat):
+    """
+    Best wall time of repeat calls of func in seconds.
+    """
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+class _Config:
+    """
+    Point config.tlpath and config.synpath to other executables inside a with block.
+    """
+    def __init__(self, tlpath, synpath):
+        self.paths = (tlpath, synpath)
+
+    def __enter__(self):
+        self.old = (config.tlpath, config.synpath)
+        config.tlpath, config.synpath = self.paths
+
+    def __exit__(self, *args):
+        config.tlpath, config.synpath = self.old
+
+
+def bench_parsers(**kwargs):
+    """
+    Time the parsers on synthetic Tlusty and Synspec output.
+
+    kwargs:
+    nd = 70: int, depth points of the atmosphere
+    niter = 30: int, iterations in fort.9
+    lines = 2000: int, lines of iteration output per iteration in fort.6
+    npts = 400000: int, points of the spectrum
+    repeat = 5: int
+
+    returns a dict {parser: best time in seconds}
+    """
+    from .pconv import load_fort7, read_fort9, load_fort9, iteration_max, load_fort6, load_fort69
+    from .atmosphere import read_fort7
+    from .store import read_spectrum
+    nd = kwargs.get('nd',70)
+    niter = kwargs.get('niter',30)
+    lines = kwargs.get('lines',2000)
+    npts = kwargs.get('npts',400000)
+    repeat = kwargs.get('repeat',5)
+
+    original_cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix='dazspec_bench_')
+    try:
+        os.chdir(tmp)
+        fake.write_fort7('fort.7', 12000, nd=nd)
+        fake.write_fort9('fort.9', nd=nd, niter=niter)
+        fake.write_fort69('fort.69', niter=niter)
+        fake.write_fort6('fort.6', 12000, nd=nd, niter=niter, lines=lines)
+        wave = np.linspace(3000, 7000, npts)
+        np.savetxt('spectrum.7', np.column_stack([wave, 1e8 * (wave / 4000)**-2]), fmt=['%10.3f', '%12.4E'])
+        times = {
+            'load_fort7': _best(load_fort7, repeat),
+            'read_fort7': _best(read_fort7, repeat),
+            'read_fort9': _best(read_fort9, repeat),
+            'load_fort9': _best(load_fort9, repeat),
+            'iteration_max': _best(iteration_max, repeat),
+            'load_fort6': _best(load_fort6, repeat),
+            'load_fort69': _best(load_fort69, repeat),
+            'read_spectrum': _best(lambda: read_spectrum('spectrum.7'), repeat),
+            }
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return times
+
+
+def bench_writers(**kwargs):
+    """
+    Time writing the input files of one model and of a whole grid.
+
+    kwargs:
+    n_models = 1000: int, models in the grid
+    repeat = 5: int
+
+    returns a dict {writer: best time in seconds}
+    """
+    from .files import Parameters, ParameterGrid, write_fort5, write_fort55, write_fort56, write_aux
+    n_models = kwargs.get('n_models',1000)
+    repeat = kwargs.get('repeat',5)
+
+    params = Parameters('bench', 12000, 8.0, {12: 1e-6, 20: 1e-8, 26: 1e-7})
+    rng = np.random.default_rng(0)
+    abns = np.zeros((n_models, 30))
+    abns[:,[11, 19, 25]] = 10**rng.uniform(-10, -5, (n_models, 3))
+    grid = ParameterGrid(['m%05i' % i for i in range(n_models)], rng.choice(np.arange(10000, 20001, 1000), n_models),
+                         rng.choice(np.arange(7.0, 9.01, 0.25), n_models), abns)
+
+    def one_model():
+        write_aux('aux', params.teff, params.log_g)
+        write_fort5(params.teff, params.log_g, 'aux')
+        write_fort55(3000, 7000)
+        write_fort56(params.abns)
+
+    original_cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix='dazspec_bench_')
+    try:
+        os.chdir(tmp)
+        times = {
+            'one_model': _best(one_model, repeat),
+            'write_decks': _best(lambda: grid.write_decks('decks', w1=3000, w2=7000), max(repeat // 2, 1)),
+            }
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    times['write_decks_per_model'] = times['write_decks'] / n_models
+    return times
+
+
+def bench_grid(**kwargs):
+    """
+    Time one model stage by stage and a whole grid end to end, with the fake executables.
+
+    kwargs:
+    n_models = 16: int, models in the grid
+    processes = os.cpu_count(): int, worker processes of the grid
+    w1 = 3900, w2 = 4400: wavelength range of the spectra in angstroms
+    n_lines = 100000: int, lines in the synthetic linelist
+    tlusty = {'delay': 0.1}: dict, kwargs of fake.tlusty
+    synspec = {'delay': 0.1}: dict, kwargs of fake.synspec
+
+    returns a dict with the time of every stage of one model, the wall time of the grid and its throughput
+    """
+    from .files import Parameters, write_fort5, write_fort55, write_fort56, write_aux, get_linelist, add_header, move
+    from .tluspy import tlusty, synspec
+    from .store import SpectrumStore
+    from .grid import run_grid, failed
+    n_models = kwargs.get('n_models',16)
+    processes = kwargs.get('processes',os.cpu_count())
+    w1 = kwargs.get('w1',3900)
+    w2 = kwargs.get('w2',4400)
+    n_lines = kwargs.get('n_lines',100000)
+
+    original_cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix='dazspec_bench_')
+    try:
+        paths = fake.install(os.path.join(tmp, 'bin'), tlusty=kwargs.get('tlusty',{'delay': 0.1}), synspec=kwargs.get('synspec',{'delay': 0.1}))
+        linelist = os.path.join(tmp, 'lines.dat')
+        fake.write_linelist(linelist, w1 - 100, w2 + 100, n=n_lines)
+        params_list = [Parameters('m%03i' % i, 10000 + 500 * i, 8.0, {20: 1e-8}) for i in range(n_models)]
+        with _Config(*paths):
+            # one model, stage by stage
+            params = params_list[0]
+            os.makedirs(os.path.join(tmp, 'stages'))
+            os.chdir(os.path.join(tmp, 'stages'))
+            store = SpectrumStore('store')
+            times = {}
+            stages = [
+                ('write_tlusty_input', lambda: (write_aux('aux', params.teff, params.log_g), write_fort5(params.teff, params.log_g, 'aux'))),
+                ('tlusty', tlusty),
+                ('write_synspec_input', lambda: (move(), write_fort55(w1, w2), write_fort56(params.abns))),
+                ('get_linelist', lambda: get_linelist(linelist, w1=w1, w2=w2)),
+                ('synspec', synspec),
+                ('add_header', lambda: add_header(params.name, params)),
+                ('store_append', lambda: store.append(params)),
+                ]
+            for name, func in stages:
+                if name == 'add_header':
+                    shutil.copyfile('fort.7', 'spectrum.7')
+                elif name == 'store_append':
+                    shutil.copyfile('spectrum.7', 'fort.7')
+                t = time.perf_counter()
+                func()
+                times[name] = time.perf_counter() - t
+            os.chdir(tmp)
+
+            # the whole grid
+            t = time.perf_counter()
+            results = run_grid(params_list, os.path.join(tmp, 'grid'), processes=processes, w1=w1, w2=w2, linelist=linelist,
+                               store=os.path.join(tmp, 'grid_store'), tl=False)
+            times['grid'] = time.perf_counter() - t
+        if failed(results):
+            raise RuntimeError('%i models of the benchmark grid failed: %s' % (len(failed(results)), failed(results)[0]['error']))
+        times['grid_models_per_second'] = n_models / times['grid']
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return times
+
+
+def run(**kwargs):
+    """
+    Run all the benchmarks.
+
+    kwargs:
+    quick = False: bool, smaller inputs and fewer repeats, for a fast check
+    import_time = True: bool, also time import DAZspec
+
+    returns a dict with the machine and versions under 'meta' and {benchmark.name: value} under 'results'.
+    Values are seconds, except the ones ending in _per_second.
+    """
+    quick = kwargs.get('quick',False)
+    repeat = 2 if quick else 5
+    benchmarks = {
+        'parsers': lambda: bench_parsers(repeat=repeat, niter=10 if quick else 30, lines=500 if quick else 2000, npts=100000 if quick else 400000),
+        'writers': lambda: bench_writers(repeat=repeat, n_models=200 if quick else 1000),
+        'grid': lambda: bench_grid(n_models=4 if quick else 16, n_lines=20000 if quick else 100000),
+        }
+    if kwargs.get('import_time',True):
+        benchmarks['import'] = lambda: {'import_time': import_time(repeat=repeat)['best']}
+
+    results = {}
+    for bench, func in benchmarks.items():
+        print('Running the %s benchmark' % bench)
+        for name, value in func().items():
+            results['%s.%s' % (bench, name)] = value
+    return {
+        'meta': {
+            'date': datetime.now().strftime('%Y%m%d-%H%M%S'),
+            'quick': quick,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'node': platform.node(),
+            'cpu_count': os.cpu_count(),
+            },
+        'results': results,
+        }
+
+
+def save(result, filename):
+    """
+    Save the result of run() as JSON.
+    """
+    with open(filename,'w') as file:
+        json.dump(result, file, indent=1, sort_keys=True)
+    print('Saved benchmark results to %s' % filename)
+
+
+def load(filename):
+    with open(filename,'r') as file:
+        return json.load(file)
+
+
+def compare(old, new, **kwargs):
+    """
+    Compare two results of run() (or the names of saved ones).
+
+    kwargs:
+    threshold = 0.2: float, a benchmark regressed if it got slower by more than this fraction
+
+    returns a list of (name, old value, new value, ratio) of the benchmarks that regressed, where ratio > 1 is worse
+    """
+    threshold = kwargs.get('threshold',0.2)
+    if isinstance(old, str):
+        old = load(old)
+    if isinstance(new, str):
+        new = load(new)
+    if old['meta'].get('quick') != new['meta'].get('quick'):
+        print('Warning: comparing a quick run with a full run')
+
+    regressions = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        a = old['results'][name]
+        b = new['results'][name]
+        if name.endswith('_per_second'):
+            ratio = a / b if b > 0 else np.inf
+        else:
+            ratio = b / a if a > 0 else np.inf
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append((name, a, b, ratio))
+            flag = '  <-- regression'
+        print('%-40s %12.4g %12.4g %8.2f%s' % (name, a, b, ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m DAZspec.bench', description='Benchmarks of DAZspec with stand-in Tlusty and Synspec executables')
+    parser.add_argument('--quick', action='store_true', help='smaller inputs and fewer repeats')
+    parser.add_argument('--save', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results saved in this JSON file, exit with status 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=0.2, help='fractional slowdown counted as a regression')
+    parser.add_argument('--import-only', action='store_true', help='only check the import time against config.import_budget')
+    args = parser.parse_args()
+
+    if args.import_only:
+        check_import_time()
+        sys.exit(0)
+    result = run(quick=args.quick)
+    for name, value in sorted(result['results'].items()):
+        print('%-40s %12.4g' % (name, value))
+    if args.save:
+        save(result, args.save)
+    if args.compare:
+        if compare(args.compare, result, threshold=args.threshold):
+            sys.exit(1)
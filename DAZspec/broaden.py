@@ -0,0 +1,195 @@
+"""
+Resample and broaden many spectra at once.
+
+Synspec writes spectra on its own irregular wavelength mesh (set by space in write_fort55). To compare
+them with data they have to be convolved with the rotational and instrumental profiles and put on the
+wavelength grid of the observation. Everything here works on 2d arrays (one spectrum per row) that share
+one wavelength grid, as returned by SpectrumStore.fluxes or GridInterpolator.evaluate:
+    - velocity profiles (resolving power R, v sin i) are shift invariant in ln(wavelength), so the spectra
+      are put on a uniform ln(wavelength) grid, convolved by FFT and resampled,
+    - a constant FWHM in angstroms is done the same way on a uniform linear grid.
+"""
+import numpy as np
+
+
+C = 299792.458 # km/s
+
+
+def resample(wave, flux, new_wave, **kwargs):
+    """
+    Put spectra on a new wavelength grid. The interpolation weights are computed once for all rows.
+
+    wave: array (npts,), increasing, may be irregular
+    flux: array (npts,) or (n, npts)
+    new_wave: array (m,), increasing
+
+    kwargs:
+    method = 'linear': 'linear' to interpolate, 'mean' for the average flux over each new pixel (conserves
+        the integrated flux, for pixels wider than the input mesh)
+
+    returns the fluxes on new_wave, (m,) or (n, m). Outside the range of wave the edge values are used.
+    """
+    method = kwargs.get('method','linear')
+    wave = np.asarray(wave, dtype='float64')
+    new_wave = np.asarray(new_wave, dtype='float64')
+    flux = np.asarray(flux)
+    if method == 'linear':
+        return _interp(wave, flux, new_wave)
+    if method != 'mean':
+        raise ValueError("method must be 'linear' or 'mean', not %r" % method)
+    # cumulative integral of the flux, differenced between the pixel edges
+    edges = np.concatenate([[new_wave[0] - (new_wave[1] - new_wave[0]) / 2],
+                            (new_wave[1:] + new_wave[:-1]) / 2,
+                            [new_wave[-1] + (new_wave[-1] - new_wave[-2]) / 2]])
+    dw = np.diff(wave)
+    cumulative = np.zeros(flux.shape[:-1] + (len(wave),))
+    cumulative[...,1:] = np.cumsum((flux[...,1:] + flux[...,:-1]) / 2 * dw, axis=-1)
+    edges = np.clip(edges, wave[0], wave[-1])
+    integral = _interp(wave, cumulative, edges)
+    width = np.diff(edges)
+    mean = np.diff(integral, axis=-1) / np.where(width > 0, width, 1)
+    # pixels completely outside the input get the edge values
+    return np.where(width > 0, mean, _interp(wave, flux, new_wave))
+
+
+def _interp(x, y, new_x):
+    """
+    np.interp along the last axis of a 2d y, with the weights computed once.
+    """
+    i = np.clip(np.searchsorted(x, new_x, side='right') - 1, 0, len(x) - 2)
+    t = np.clip((new_x - x[i]) / (x[i+1] - x[i]), 0, 1)
+    return y[...,i] * (1 - t) + y[...,i+1] * t
+
+
+def uniform_grid(wave, **kwargs):
+    """
+    Uniform grid over the range of wave, in ln(wavelength) (constant velocity step) or in wavelength.
+
+    wave: array, the original grid
+
+    kwargs:
+    log = True: bool, uniform in ln(wavelength)
+    step = None: float, step in km/s if log else in angstroms. The median step of wave if None.
+
+    returns the grid and the step
+    """
+    log = kwargs.get('log',True)
+    step = kwargs.get('step',None)
+    wave = np.asarray(wave, dtype='float64')
+    if log:
+        if step is None:
+            step = C * np.median(np.diff(np.log(wave)))
+        n = int(np.floor(np.log(wave[-1] / wave[0]) / (step / C))) + 1
+        return wave[0] * np.exp(np.arange(n) * step / C), step
+    if step is None:
+        step = np.median(np.diff(wave))
+    n = int(np.floor((wave[-1] - wave[0]) / step)) + 1
+    return wave[0] + np.arange(n) * step, step
+
+
+def gaussian_kernel(step, fwhm):
+    """
+    Normalized Gaussian sampled at multiples of step, out to 4 sigma.
+    step and fwhm in the same units (km/s or angstroms).
+    """
+    sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    m = max(int(np.ceil(4 * sigma / step)), 1)
+    x = np.arange(-m, m + 1) * step
+    kernel = np.exp(-0.5 * (x / sigma)**2)
+    return kernel / kernel.sum()
+
+
+def rotational_kernel(step, vsini, epsilon=0.6):
+    """
+    Normalized rotational broadening profile (Gray, The Observation and Analysis of Stellar Photospheres)
+    sampled at multiples of step.
+
+    step, vsini: km/s
+    epsilon = 0.6: linear limb darkening coefficient
+    """
+    m = int(np.floor(vsini / step))
+    if m < 1:
+        return np.ones(1)
+    x = np.arange(-m, m + 1) * step / vsini
+    s = np.sqrt(np.clip(1 - x**2, 0, None))
+    kernel = 2 * (1 - epsilon) * s + np.pi * epsilon / 2 * s**2
+    return kernel / kernel.sum()
+
+
+def convolve(flux, kernel, **kwargs):
+    """
+    Convolve every row of flux with a kernel by FFT. The rows are padded with their edge values so the
+    ends of the spectra do not wrap around.
+
+    flux: array (npts,) or (n, npts) on a uniform grid
+    kernel: array of odd length, centered, on the same grid
+
+    kwargs:
+    chunk = 256: int, rows transformed at once, to bound memory
+
+    returns an array with the shape of flux
+    """
+    chunk = kwargs.get('chunk',256)
+    flux = np.asarray(flux, dtype='float64')
+    kernel = np.asarray(kernel, dtype='float64')
+    if len(kernel) == 1:
+        return flux * kernel[0]
+    squeeze = flux.ndim == 1
+    flux = np.atleast_2d(flux)
+    m = len(kernel) // 2
+    npts = flux.shape[1]
+    nfft = 1 << int(np.ceil(np.log2(npts + 2 * m + len(kernel) - 1)))
+    kernel_fft = np.fft.rfft(kernel, nfft)
+    out = np.empty_like(flux)
+    for start in range(0, len(flux), chunk):
+        rows = flux[start:start+chunk]
+        padded = np.concatenate([np.repeat(rows[:,:1], m, axis=1), rows, np.repeat(rows[:,-1:], m, axis=1)], axis=1)
+        full = np.fft.irfft(np.fft.rfft(padded, nfft, axis=1) * kernel_fft, nfft, axis=1)
+        out[start:start+chunk] = full[:, 2*m:2*m+npts]
+    return out[0] if squeeze else out
+
+
+def broaden(wave, flux, new_wave, **kwargs):
+    """
+    Broaden spectra and put them on a new wavelength grid.
+
+    wave: array (npts,), wavelengths of the spectra in angstroms, may be irregular (e.g. Synspec's mesh)
+    flux: array (npts,) or (n, npts)
+    new_wave: array (m,), wavelength grid of the result, e.g. that of an observed spectrum
+
+    kwargs:
+    resolution = None: float, resolving power R = lambda / FWHM of a Gaussian instrumental profile
+    vsini = None: float, projected rotational velocity in km/s
+    epsilon = 0.6: float, limb darkening coefficient of the rotational profile
+    fwhm = None: float, FWHM in angstroms of a Gaussian instrumental profile of constant width
+    step = None: float, step of the intermediate uniform grid (km/s for resolution and vsini, angstroms for fwhm).
+        The median step of wave if None. Pass a step well below the narrowest profile for irregular meshes.
+    method = 'linear': str, how to resample to new_wave, see resample
+    chunk = 256: int, see convolve
+
+    returns the broadened fluxes on new_wave, (m,) or (n, m)
+    """
+    resolution = kwargs.get('resolution',None)
+    vsini = kwargs.get('vsini',None)
+    epsilon = kwargs.get('epsilon',0.6)
+    fwhm = kwargs.get('fwhm',None)
+    step = kwargs.get('step',None)
+    method = kwargs.get('method','linear')
+    chunk = kwargs.get('chunk',256)
+
+    wave = np.asarray(wave, dtype='float64')
+    flux = np.asarray(flux, dtype='float64')
+    if resolution or vsini:
+        grid, dv = uniform_grid(wave, log=True, step=step)
+        kernel = np.ones(1)
+        if resolution:
+            kernel = np.convolve(kernel, gaussian_kernel(dv, C / resolution))
+        if vsini:
+            kernel = np.convolve(kernel, rotational_kernel(dv, vsini, epsilon))
+        flux = convolve(_interp(wave, flux, grid), kernel, chunk=chunk)
+        wave = grid
+    if fwhm:
+        grid, dw = uniform_grid(wave, log=False, step=step if not (resolution or vsini) else None)
+        flux = convolve(_interp(wave, flux, grid), gaussian_kernel(dw, fwhm), chunk=chunk)
+        wave = grid
+    return resample(wave, flux, new_wave, method=method)
@@ -0,0 +1,246 @@
+"""
+Content addressed cache of Tlusty atmospheres and Synspec spectra.
+
+Every entry is keyed by a hash of everything that goes into a run, so a model that has already been
+computed never has to be computed again. Tlusty only sees hydrogen, so atmospheres are keyed without
+the metal abundances and can be shared between abundance variants, while spectra are keyed by everything.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from . import config
+from .files import get_path
+
+
+_file_hashes = {} # (path, size, mtime) -> sha256, so big linelists are only hashed once
+
+def file_hash(filename):
+    """
+    Return the sha256 of the contents of a file. Returns None if the file does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        h = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                h.update(chunk)
+        _file_hashes[key] = h.hexdigest()
+    return _file_hashes[key]
+
+
+def _hash(obj):
+    s = json.dumps(obj, sort_keys=True, default=repr)
+    return hashlib.sha256(s.encode()).hexdigest()
+
+
+def atmosphere_key(params, **kwargs):
+    """
+    Hash of everything that determines the Tlusty atmosphere of a model.
+    The name and the metal abundances of params are not part of the key.
+
+    params: Parameters object
+
+    kwargs:
+    fort5 = {}: dict, kwargs passed to write_fort5
+    aux_params = {}: dict, aux parameters that replace the ones in config
+    """
+    fort5 = kwargs.get('fort5',{})
+    aux_params = kwargs.get('aux_params',{})
+    key = {
+        'teff': params.teff,
+        'log_g': params.log_g,
+        'fort5': fort5,
+        'aux_convec': config.aux_convec,
+        'aux_no_convec': config.aux_no_convec,
+        'h1_data': config.h1_data,
+        'h1_hash': file_hash(get_path('data/%s' % config.h1_data)),
+        'tl_version': config.tl_version,
+        'aux_params': aux_params,
+        }
+    return _hash(key)
+
+
+def spectrum_key(params, **kwargs):
+    """
+    Hash of everything that determines the Synspec spectrum of a model.
+
+    params: Parameters object
+
+    kwargs:
+    w1 = 3000, w2 = 7000: wavelength range in angstroms
+    linelist = None: str, name of the linelist in DAZspec/linelists
+    fort5 = {}, fort55 = {}, fort56 = {}: dicts, kwargs passed to the writers
+    shards = None: int, number of chunks of a sharded Synspec run, whose chunk edges and stitching can change the spectrum
+    """
+    linelist = kwargs.get('linelist',None)
+    return _hash({
+        'atmosphere': atmosphere_key(params, **kwargs),
+        'abns': sorted((int(elem), float(params.abns[elem])) for elem in params.abns),
+        'w1': kwargs.get('w1',3000),
+        'w2': kwargs.get('w2',7000),
+        'fort55': kwargs.get('fort55',{}),
+        'fort56': kwargs.get('fort56',{}),
+        'linelist': linelist,
+        'linelist_hash': None if linelist is None else file_hash(get_path(os.path.join('linelists', linelist))),
+        'syn_version': config.syn_version,
+        'shards': kwargs.get('shards',None),
+        })
+
+
+class ResultCache:
+    """
+    A directory of cached results with a size cap. Each entry is a subdirectory named after its key
+    holding the cached files and a meta.json. The modification time of meta.json is the last time the
+    entry was used, and the least recently used entries are evicted first once the cache is too big.
+    """
+    def __init__(self, root, **kwargs):
+        """
+        root: str, directory of the cache
+
+        kwargs:
+        max_size = config.cache_max_size: maximum size of the cache in bytes, None for no limit
+        prune_interval = 300: float, seconds between full scans of the cache by put. In between, put only prunes
+            when the size of the last scan plus what this object stored since goes over max_size.
+        """
+        self.root = os.path.abspath(root)
+        self.max_size = kwargs.get('max_size', config.cache_max_size)
+        self.prune_interval = kwargs.get('prune_interval', 300)
+        self._size = None # size at the last scan plus the puts since
+        self._scanned = 0.
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._entry(key), 'meta.json'))
+
+    def get(self, key):
+        """
+        Look up an entry. Returns a dict {file name: path in the cache} or None on a miss.
+        """
+        entry = self._entry(key)
+        meta = os.path.join(entry, 'meta.json')
+        try:
+            os.utime(meta) # mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {name: os.path.join(entry, name) for name in os.listdir(entry) if name != 'meta.json'}
+
+    def restore(self, key, dirname='.'):
+        """
+        Copy the files of an entry into dirname. Returns False on a miss.
+        """
+        files = self.get(key)
+        if files is None:
+            return False
+        for name in files:
+            shutil.copyfile(files[name], os.path.join(dirname, name))
+        return True
+
+    def put(self, key, files, **kwargs):
+        """
+        Store files in the cache. The entry is built in a temporary directory and renamed into place,
+        so readers never see half written entries and concurrent writers of the same key are harmless.
+
+        key: str
+        files: dict {name in the cache: path of the file to store}
+
+        kwargs:
+        meta = {}: dict, extra information saved in meta.json
+        """
+        meta = dict(kwargs.get('meta',{}))
+        if key in self:
+            return
+        size = 0
+        tmp = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        try:
+            for name in files:
+                shutil.copyfile(files[name], os.path.join(tmp, name))
+                size += os.path.getsize(files[name])
+            meta['key'] = key
+            meta['size'] = size
+            meta['created'] = time.time()
+            with open(os.path.join(tmp, 'meta.json'), 'w') as file:
+                json.dump(meta, file, default=repr)
+            os.rename(tmp, self._entry(key))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if key not in self:
+                raise
+        if self.max_size is not None:
+            # a full scan of the cache costs a stat of every entry, so it is only done when needed
+            self._size = None if self._size is None else self._size + size
+            if self._size is None or self._size > self.max_size or time.time() - self._scanned > self.prune_interval:
+                self.prune(max_size=self.max_size)
+
+    def info(self):
+        """
+        Return a list of dicts describing every entry, most recently used first.
+        Each dict is the contents of meta.json plus 'last_used'.
+        """
+        entries = []
+        for key in os.listdir(self.root):
+            meta = os.path.join(self._entry(key), 'meta.json')
+            try:
+                with open(meta, 'r') as file:
+                    info = json.load(file)
+                info['last_used'] = os.path.getmtime(meta)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            entries.append(info)
+        entries.sort(key=lambda info: info['last_used'], reverse=True)
+        return entries
+
+    def size(self):
+        """
+        Total size of the cached files in bytes.
+        """
+        return sum(info['size'] for info in self.info())
+
+    def prune(self, **kwargs):
+        """
+        Evict entries, least recently used first.
+
+        kwargs:
+        max_size = self.max_size: evict until the cache is at most this many bytes
+        max_age = None: also evict every entry not used in this many seconds
+
+        returns the list of evicted keys
+        """
+        max_size = kwargs.get('max_size', self.max_size)
+        max_age = kwargs.get('max_age', None)
+
+        entries = self.info()
+        total = sum(info['size'] for info in entries)
+        now = time.time()
+        evicted = []
+        for info in reversed(entries):
+            too_big = max_size is not None and total > max_size
+            too_old = max_age is not None and now - info['last_used'] > max_age
+            if not (too_big or too_old):
+                continue
+            shutil.rmtree(self._entry(info['key']), ignore_errors=True)
+            total -= info['size']
+            evicted.append(info['key'])
+        self._size = total
+        self._scanned = now
+        return evicted
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        return self.prune(max_size=0)
@@ -6,10 +6,19 @@ This file has the default tluspy configurations soft-coded into it so that they
 tlpath = 'bin/tlusty208'
 synpath = 'bin/synspec54'
 
+#kill tlusty and synspec runs after this many seconds, None to let them run
+tl_timeout = None
+syn_timeout = None
+
 #Location of H I atomic data
 h1_data = 'h1s16.dat'
 #h1_data = 'h1.dat'
 
+#angstroms per unit of the wavelengths in the linelists (Synspec linelists are in nm)
+linelist_wave_unit = 10.
+#where to save the wavelength indices of the linelists, None to keep them next to the linelists
+linelist_index_dir = None
+
 #for writting aux files
 aux_no_convec = {
     'tAUDIV': 1,
@@ -33,6 +42,53 @@ aux_convec = {
     'ICONRS':5
     }
 
+#stages of pipeline.run_pipeline, each Tlusty run starts from the atmosphere of the stage before it (except ltgray ones)
+#name: str, fort5: kwargs of write_fort5, aux_params: aux settings that replace the ones above for this stage only
+pipeline_stages = [
+    {'name': 'lte', 'fort5': {'lte': True, 'ltgray': True}}, # LTE-gray starting model, then LTE
+    {'name': 'nlte', 'fort5': {'lte': False, 'ltgray': False}},
+    ]
+
+#named bundles of settings, used with run_model(..., profile='survey') or run_grid. Settings given explicitly win.
+#fort5: kwargs of write_fort5, fort55: kwargs of write_fort55, aux_params: aux settings that replace the ones above
+#nlevels above 9 needs H I data with that many levels (h1s16.dat has 16). See profiles.calibrate for the cost and error of each.
+profiles = {
+    'survey': {
+        'fort5': {'frequencies': 300, 'nlevels': 9},
+        'fort55': {'space': 0.05, 'relop': 1e-3, 'cutof0': 2},
+        'aux_params': {'nITER': 30},
+        },
+    'standard': { # the defaults of the writers
+        'fort5': {'frequencies': 1000, 'nlevels': 9},
+        'fort55': {'space': 0.01, 'relop': 1e-4, 'cutof0': 3},
+        'aux_params': {},
+        },
+    'publication': {
+        'fort5': {'frequencies': 2000, 'nlevels': 16},
+        'fort55': {'space': 0.003, 'relop': 1e-5, 'cutof0': 10},
+        'aux_params': {'nITER': 100},
+        },
+    }
+#the most accurate profile, the other ones are compared with it by profiles.calibrate
+reference_profile = 'publication'
+
+#run_model(..., scratch=True) runs every model in its own directory under scratch_dir (tmpfs or a local disk) and
+#moves only the files matching scratch_keep back to the model directory at the end. If None, /dev/shm is used if it
+#exists, otherwise the system temporary directory.
+scratch_dir = None
+scratch_keep = ['fort.5', 'fort.6', 'fort.7', 'fort.8', 'fort.9', 'fort.17', 'fort.55', 'fort.56', 'fort.69', 'synspec.6', '*.tl']
+#files of the model directory that are linked into the scratch directory if they exist, e.g. the starting model of a retry
+scratch_inputs = ['fort.8']
+
+#a model is converged if the largest relative change of the state vector in the last iteration is below this
+conv_tol = 1e-3
+
+#maximum size of a DAZspec.cache.ResultCache in bytes, None for no limit
+cache_max_size = 10e9
+
+#import DAZspec should take less than this many seconds, see DAZspec.bench.import_time
+import_budget = 0.5
+
 tl_version = 208
 syn_version = 54
 
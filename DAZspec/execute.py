@@ -0,0 +1,172 @@
+"""
+Run Tlusty and Synspec as subprocesses that can be waited on, timed out and cancelled.
+
+A Job starts a program with fort.5 as stdin and fort.6 as stdout (like the shell redirection tlusty() used to do)
+and reaps it with os.wait4, so the exit status, wall time, CPU time and peak memory of that one run are
+recorded. Jobs work with concurrent.futures (job.future) and with asyncio (await job), so many models
+can be driven from one thread or event loop and stuck Fortran runs are killed instead of holding a worker forever.
+"""
+import os
+import time
+import signal
+import threading
+import subprocess
+from concurrent.futures import Future
+
+
+class Job:
+    """
+    Handle of one running program.
+
+    Attributes once the job is done:
+    returncode: exit status, negative if killed by a signal
+    status: 'finished', 'timeout' or 'cancelled'
+    wall_time: seconds from start to exit
+    user_time, system_time: CPU seconds used by the program
+    max_rss: peak resident memory in kB
+    """
+    def __init__(self, args, **kwargs):
+        """
+        args: list, the program and its arguments
+
+        kwargs:
+        cwd = None: str, directory to run in, the pwd if None
+        stdin = 'fort.5': str, file (relative to cwd) used as stdin, None for no stdin
+        stdout = 'fort.6': str, file (relative to cwd) stdout is written to, None to inherit stdout
+        timeout = None: float, kill the program after this many seconds
+        env = None: dict, extra environment variables
+        """
+        self.args = [str(arg) for arg in args]
+        self.cwd = kwargs.get('cwd',None)
+        self.stdin = kwargs.get('stdin','fort.5')
+        self.stdout = kwargs.get('stdout','fort.6')
+        self.timeout = kwargs.get('timeout',None)
+        self.env = kwargs.get('env',None)
+
+        self.returncode = None
+        self.status = None
+        self.wall_time = None
+        self.user_time = None
+        self.system_time = None
+        self.max_rss = None
+        self.future = Future()
+        self._process = None
+        self._reaped = False
+        self._killed_for = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _file(self, name):
+        if self.cwd is None:
+            return name
+        return os.path.join(self.cwd, name)
+
+    def start(self):
+        """
+        Start the program and return immediately.
+        """
+        env = None if self.env is None else dict(os.environ, **self.env)
+        stdin = None if self.stdin is None else open(self._file(self.stdin), 'r')
+        stdout = None if self.stdout is None else open(self._file(self.stdout), 'w')
+        try:
+            self._start = time.time()
+            self._process = subprocess.Popen(self.args, cwd=self.cwd, stdin=stdin, stdout=stdout, env=env)
+        finally:
+            for file in (stdin, stdout):
+                if file is not None:
+                    file.close()
+        self.future.set_running_or_notify_cancel()
+        threading.Thread(target=self._reap, daemon=True).start()
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._kill, args=('timeout',))
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def _reap(self):
+        pid, status, usage = os.wait4(self._process.pid, 0)
+        with self._lock:
+            self._reaped = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self.wall_time = time.time() - self._start
+        self.returncode = os.waitstatus_to_exitcode(status)
+        self._process.returncode = self.returncode # so Popen does not try to reap it again
+        self.user_time = usage.ru_utime
+        self.system_time = usage.ru_stime
+        self.max_rss = usage.ru_maxrss
+        self.status = self._killed_for or 'finished'
+        self.future.set_result(self)
+
+    def _kill(self, reason):
+        with self._lock:
+            if self._reaped or self._killed_for is not None:
+                return
+            self._killed_for = reason
+            # not Popen.send_signal, it polls and could reap the process before wait4 sees its usage
+            os.kill(self._process.pid, signal.SIGKILL)
+
+    def cancel(self):
+        """
+        Kill the program.
+        """
+        self._kill('cancelled')
+
+    def done(self):
+        return self.future.done()
+
+    def running(self):
+        return self._process is not None and not self.done()
+
+    def wait(self, timeout=None):
+        """
+        Block until the program exits.
+
+        timeout = None: float, give up waiting (the program keeps running) and raise concurrent.futures.TimeoutError
+
+        returns the exit status
+        """
+        self.future.result(timeout)
+        return self.returncode
+
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self.future).__await__()
+
+    def usage(self):
+        """
+        returns a dict of the exit status, status, wall time, CPU times and peak memory
+        """
+        return {
+            'returncode': self.returncode,
+            'status': self.status,
+            'wall_time': self.wall_time,
+            'user_time': self.user_time,
+            'system_time': self.system_time,
+            'max_rss': self.max_rss,
+            }
+
+
+def submit(args, **kwargs):
+    """
+    Start a program and return its Job without waiting.
+    The kwargs are passed to Job.
+    """
+    return Job(args, **kwargs).start()
+
+
+async def run_async(args, **kwargs):
+    """
+    Run a program from an event loop. If the calling task is cancelled the program is killed.
+    The kwargs are passed to Job.
+
+    returns the finished Job
+    """
+    import asyncio
+    job = submit(args, **kwargs)
+    try:
+        await job
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+    return job
@@ -0,0 +1,237 @@
+"""
+Stand-in Tlusty and Synspec executables for benchmarks.
+
+They read fort.5 (and fort.55) like the real programs, wait for a set time and then write synthetic output
+files with the same layout and of a chosen size: fort.6, fort.7, fort.9 and fort.69 for Tlusty, fort.7 and
+fort.17 for Synspec. This is enough to drive everything DAZspec does around the programs (writers, parsers,
+grids, caching, stores) without the Fortran codes or their run times.
+
+install() writes the executables into a directory, point config.tlpath and config.synpath to them.
+write_linelist() makes a synthetic linelist to run them with, e.g. in a temporary directory.
+"""
+import os
+import sys
+import time
+import numpy as np
+
+from . import config
+
+
+_script = """#!%(python)s
+import sys
+sys.path.insert(0, %(path)r)
+from DAZspec.fake import %(program)s
+%(program)s(**%(kwargs)r)
+"""
+
+
+def install(dirname, **kwargs):
+    """
+    Write the executables tlusty and synspec into dirname.
+
+    dirname: str
+
+    kwargs:
+    tlusty = {}: dict, kwargs of fake.tlusty
+    synspec = {}: dict, kwargs of fake.synspec
+
+    returns (tlpath, synpath), the full paths of the executables
+    """
+    os.makedirs(dirname, exist_ok=True)
+    parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = []
+    for program in ('tlusty', 'synspec'):
+        path = os.path.abspath(os.path.join(dirname, program))
+        with open(path,'w') as file:
+            file.write(_script % {'python': sys.executable, 'path': parent, 'program': program, 'kwargs': kwargs.get(program,{})})
+        os.chmod(path, 0o755)
+        paths.append(path)
+    return tuple(paths)
+
+
+def write_linelist(filename, w1, w2, **kwargs):
+    """
+    Write a synthetic linelist in the Synspec format, sorted by wavelength.
+
+    filename: str, full path of the linelist (get_linelist takes full paths)
+    w1, w2: float, wavelength range of the lines in angstroms
+
+    kwargs:
+    n = 1000: int, number of lines
+    seed = 0: int, seed of the random wavelengths
+    """
+    n = kwargs.get('n',1000)
+    seed = kwargs.get('seed',0)
+    rng = np.random.default_rng(seed)
+    wave = np.sort(rng.uniform(w1, w2, n)) / config.linelist_wave_unit
+    with open(filename,'w') as file:
+        for w in wave:
+            file.write('%10.4f  26.00  -1.000  20000.0  2.0  40000.0  3.0  0.0  0.0  0.0\n' % w)
+
+
+def _busy(seconds):
+    """
+    Use the CPU for a number of seconds, so the fake runs load the machine like the real ones.
+    """
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _read_fort5():
+    """
+    returns (teff, log_g, ltgray) from the fort.5 on stdin
+    """
+    words = sys.stdin.read().split()
+    return float(words[0]), float(words[1]), words[3].upper().startswith('T')
+
+
+def write_fort7(filename, teff, **kwargs):
+    """
+    Write a synthetic atmosphere in the Tlusty text format.
+
+    kwargs:
+    nd = 70: int, number of depth points
+    numpar = 12: int, number of values at each depth
+    """
+    nd = kwargs.get('nd',70)
+    numpar = kwargs.get('numpar',12)
+
+    dm = np.logspace(-6, 4, nd)
+    temp = teff * (0.75 * (np.log10(dm) + 7) / 7 + 0.5) ** 0.25
+    state = np.empty((nd, numpar))
+    state[:,0] = temp
+    state[:,1] = 1e10 * dm ** 0.8
+    state[:,2] = 1e-12 * dm ** 0.9
+    for j in range(3, numpar):
+        state[:,j] = state[:,1] * 10.0**-(j - 2)
+    with open(filename,'w') as file:
+        file.write('%5i%6i\n' % (nd, numpar))
+        for block in [dm] + list(state):
+            s = ''
+            for i in range(0, len(block), 6):
+                s += ''.join('%13.6E' % x for x in block[i:i+6]) + '\n'
+            file.write(s.replace('E', 'D'))
+
+
+def write_fort9(filename, **kwargs):
+    """
+    Write a synthetic convergence log with the relative changes falling by a factor of 10 every iteration.
+
+    kwargs:
+    nd = 70: int, number of depth points
+    niter = 8: int, number of iterations
+    """
+    nd = kwargs.get('nd',70)
+    niter = kwargs.get('niter',8)
+
+    depth = np.arange(1, nd + 1)
+    with open(filename,'w') as file:
+        file.write(' CONVERGENCE LOG\n')
+        file.write(' ITER   ID      TEMP         NE        MAXIMUM\n')
+        for it in range(1, niter + 1):
+            change = 10.0**-it * (1 + depth / nd)
+            rows = np.column_stack([np.full(nd, it), depth, change, -change * 0.5, -change * 1.1])
+            s = ''.join('%5i%5i%12.3E%12.3E%12.3E\n' % tuple(row) for row in rows)
+            file.write(s.replace('E', 'D'))
+
+
+def write_fort69(filename, **kwargs):
+    """
+    Write a synthetic timing file, one line per iteration with the cumulative time in the third column.
+
+    kwargs:
+    niter = 8: int, number of iterations
+    seconds = 1.0: float, total time
+    """
+    niter = kwargs.get('niter',8)
+    seconds = kwargs.get('seconds',1.0)
+    with open(filename,'w') as file:
+        for it in range(1, niter + 1):
+            file.write('%5i%5i%12.3f\n' % (it, 1, seconds * it / niter))
+
+
+def write_fort6(filename, teff, **kwargs):
+    """
+    Write a synthetic standard output of Tlusty ending with the FINAL MODEL ATMOSPHERE table.
+
+    kwargs:
+    nd = 70: int, number of depth points
+    niter = 8: int, number of iterations
+    lines = 200: int, lines of iteration output per iteration before the final table, sets the size of the file
+    """
+    nd = kwargs.get('nd',70)
+    niter = kwargs.get('niter',8)
+    lines = kwargs.get('lines',200)
+
+    with open(filename,'w') as file:
+        _fort6(file, teff, nd, niter, lines)
+
+
+def _fort6(file, teff, nd, niter, lines):
+    rng = np.random.default_rng(int(teff))
+    file.write(' TLUSTY (fake) TEFF = %9.1f\n\n' % teff)
+    for it in range(1, niter + 1):
+        file.write(' ITERATION %i\n' % it)
+        values = rng.random((lines, 6))
+        s = ''.join('%5i' % (i + 1) + ''.join('%12.4E' % x for x in row) + '\n' for i, row in enumerate(values))
+        file.write(s.replace('E', 'D'))
+    file.write('\n FINAL MODEL ATMOSPHERE\n\n')
+    file.write('   ID     DM         TAUROSS      TEMP          NE          DENS      (RAD+CON)/TOT\n\n')
+    dm = np.logspace(-6, 4, nd)
+    flux = 1 + 1e-3 * rng.standard_normal(nd)
+    rows = np.column_stack([np.arange(1, nd + 1), dm, dm * 3, teff * (1 + np.log10(dm) / 20), 1e10 * dm, 1e-12 * dm, flux])
+    s = ''.join('%5i' % row[0] + ''.join('%12.4E' % x for x in row[1:]) + '\n' for row in rows)
+    file.write(s.replace('E', 'D'))
+
+
+def tlusty(**kwargs):
+    """
+    Act as Tlusty in the pwd: read fort.5 from stdin and write fort.6 (to stdout), fort.7, fort.9 and fort.69.
+    A run from a starting model (ltgray = F) takes half as many iterations.
+
+    kwargs:
+    delay = 0.1: float, seconds of CPU time to use before writing the output
+    nd = 70: int, number of depth points
+    numpar = 12: int, number of values at each depth in fort.7
+    niter = 8: int, number of iterations of a gray start
+    lines = 200: int, lines of iteration output in fort.6 per iteration
+    fail = None: float, exit with status 1 without output if Teff is below this
+    """
+    delay = kwargs.get('delay',0.1)
+    nd = kwargs.get('nd',70)
+    niter = kwargs.get('niter',8)
+    fail = kwargs.get('fail',None)
+
+    teff, log_g, ltgray = _read_fort5()
+    if fail is not None and teff < fail:
+        sys.exit(1)
+    if not ltgray:
+        niter = max(niter // 2, 1)
+    _busy(delay)
+    write_fort7('fort.7', teff, nd=nd, numpar=kwargs.get('numpar',12))
+    write_fort9('fort.9', nd=nd, niter=niter)
+    write_fort69('fort.69', niter=niter, seconds=delay)
+    _fort6(sys.stdout, teff, nd, niter, kwargs.get('lines',200))
+
+
+def synspec(**kwargs):
+    """
+    Act as Synspec in the pwd: read fort.5 from stdin and the wavelength range and step (space) from fort.55,
+    and write the spectrum to fort.7 and the continuum to fort.17.
+
+    kwargs:
+    delay = 0.1: float, seconds of CPU time to use before writing the output
+    """
+    delay = kwargs.get('delay',0.1)
+
+    teff, log_g, ltgray = _read_fort5()
+    with open('fort.55','r') as file:
+        words = file.read().split('\n')[5].split()
+    w1, w2, space = float(words[0]), abs(float(words[1])), float(words[5])
+    _busy(delay)
+    wave = np.arange(w1, w2 + space / 2, space)
+    cont = 1e8 * (teff / 1e4)**4 * (wave / 4000)**-2
+    flux = cont * (1 - 0.5 * np.exp(-((wave - 3934) / 2)**2) - 0.6 * np.exp(-((wave - 4341) / 20)**2))
+    np.savetxt('fort.7', np.column_stack([wave, flux]), fmt=['%10.3f', '%12.4E'])
+    np.savetxt('fort.17', np.column_stack([wave, cont]), fmt=['%10.3f', '%12.4E'])
@@ -2,13 +2,13 @@
 This module is meant to quickly create the standard files needed to run tlusty 205
 and synspec 51. This file will need to be updated as new versions come out.
 """
+import os
 import pkgutil
 import warnings
 from . import config
-from shutil import copyfile
+import numpy as np
 from numpy import log10
 from numpy import exp
-from os import system
 
 from datetime import datetime
 
@@ -48,13 +48,154 @@ class Parameters:
             s = s + '%i\t%.3e\n'%(elem,self.abns[elem])
         return s
 
-def calc_ML(teff, log_g):
+class ParameterGrid:
+    """
+    Many models at once: names, Teff and log g as arrays and the abundances as a dense (n_models, n_elems) matrix
+    of N/H in number space, where column i is element i+1 and 0 means not given.
+    grid[i] gives model i as a Parameters object.
+    """
+    def __init__(self, names, teff, log_g, abns):
+        """
+        names: list of str, one per model
+        teff: array of effective temperatures / [K]
+        log_g: array of log10(g/[cm/s2])
+        abns: array (n_models, n_elems) of N/H in number space. Negative values are taken to be log(N/H) and converted, with a warning, like Parameters does.
+        """
+        self.names = np.array(names, dtype=object)
+        self.teff = np.asarray(teff).astype(int)
+        self.log_g = np.asarray(log_g, dtype='float64')
+        abns = np.array(abns, dtype='float64', ndmin=2)
+        n = len(self.names)
+        if self.teff.shape != (n,) or self.log_g.shape != (n,) or abns.shape[0] != n:
+            raise ValueError('names, teff, log_g and abns must all have one entry per model')
+        if len(set(self.names)) != n:
+            raise ValueError('Every model in a grid needs a unique name.')
+        if np.isnan(abns).any():
+            raise ValueError('abns contains NaN')
+        log = abns < 0
+        if log.any():
+            warnings.warn('abns must be in number space. Please do not use log[abn], though ParameterGrid tries to fix it.')
+            abns = np.where(log, 10**abns, abns)
+        self.abns = abns
+    
+    @classmethod
+    def from_parameters(cls, params_list, **kwargs):
+        """
+        Build a grid from a list of Parameters objects.
+        
+        kwargs:
+        n_elems = 30: int, number of elements in the abundance matrix
+        """
+        n_elems = kwargs.get('n_elems',30)
+        abns = np.zeros((len(params_list), n_elems))
+        for i, params in enumerate(params_list):
+            for elem in params.abns:
+                if elem > n_elems:
+                    raise ValueError('%s has element %i, more than n_elems=%i' % (params.name, elem, n_elems))
+                abns[i,elem-1] = params.abns[elem]
+        return cls([params.name for params in params_list],
+                   [params.teff for params in params_list],
+                   [params.log_g for params in params_list],
+                   abns)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __getitem__(self, i):
+        row = self.abns[i]
+        abns = {int(elem) + 1: float(row[elem]) for elem in np.nonzero(row)[0]}
+        return Parameters(self.names[i], self.teff[i], self.log_g[i], abns)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def ML(self):
+        """
+        Mixing length of every model, nan for the models without convection (Teff > 15000 K).
+        """
+        return np.where(self.teff <= 15000, calc_ML(self.teff, self.log_g), np.nan)
+    
+    def write_decks(self, root, **kwargs):
+        """
+        Write the input files of every model into root/<name>: fort.5, aux, and if w1 and w2 are given fort.55 and fort.56.
+        Files that are the same for many models (aux files, fort.55) are written once into root/shared and
+        linked into the model directories. The H I data is never copied, fort.5 points to it.
+        
+        root: str
+        
+        kwargs:
+        aux = 'aux': str, name of the aux file
+        w1 = None, w2 = None: wavelength range of the spectra in angstroms
+        fort5 = {}, fort55 = {}, fort56 = {}: dicts, kwargs passed to format_fort5, format_fort55 and format_fort56
+        
+        returns a list of the model directories
+        """
+        aux = kwargs.get('aux','aux')
+        w1 = kwargs.get('w1',None)
+        w2 = kwargs.get('w2',None)
+        fort5 = dict(kwargs.get('fort5',{}))
+        fort55 = kwargs.get('fort55',{})
+        fort56 = kwargs.get('fort56',{})
+        
+        root = os.path.abspath(root)
+        shared = os.path.join(root, 'shared')
+        os.makedirs(shared, exist_ok=True)
+        fort5.setdefault('path', get_path('data/%s' % config.h1_data))
+        
+        ML = self.ML()
+        aux_files = {} # contents -> file in shared
+        if w1 is not None and w2 is not None:
+            fort55_file = os.path.join(shared, 'fort.55')
+            with open(fort55_file, 'w') as file:
+                file.write(format_fort55(w1, w2, **fort55))
+        else:
+            fort55_file = None
+        
+        dirnames = []
+        for i in range(len(self)):
+            dirname = os.path.join(root, self.names[i])
+            os.makedirs(dirname, exist_ok=True)
+            
+            s = format_aux(self.teff[i], self.log_g[i], ML=ML[i])
+            if s not in aux_files:
+                aux_files[s] = os.path.join(shared, 'aux_%03i' % len(aux_files))
+                with open(aux_files[s], 'w') as file:
+                    file.write(s)
+            link(aux_files[s], os.path.join(dirname, aux))
+            
+            with open(os.path.join(dirname, 'fort.5'), 'w') as file:
+                file.write(format_fort5(self.teff[i], self.log_g[i], aux, **fort5))
+            if fort55_file is not None:
+                link(fort55_file, os.path.join(dirname, 'fort.55'))
+                row = self.abns[i]
+                abns = {int(elem) + 1: row[elem] for elem in np.nonzero(row)[0]}
+                with open(os.path.join(dirname, 'fort.56'), 'w') as file:
+                    file.write(format_fort56(abns, **fort56))
+            dirnames.append(dirname)
+        print('Finished writing the input files of %i models (%i aux files)' % (len(self), len(aux_files)))
+        return dirnames
+
+
+def calc_ML(teff, log_g, **kwargs):
     """
     Calculate the mixing length of a convective WD model given the Teff and the Log g using the formula given in Tremblay 2015. The constants are determined from a fitting.
+    teff and log_g can be numbers or arrays, which are broadcast against each other, so a whole grid takes one call.
     
     teff: effective temperature / [K]
     log_g: log10(g/[cm/s2])
+    
+    kwargs:
+    table = False: bool, interpolate in a precomputed table (see ML_table) instead of evaluating the formula.
+        Points outside the table still use the formula.
     """
+    table = kwargs.get('table',False)
+    
+    teff = np.asarray(teff, dtype='float64')
+    log_g = np.asarray(log_g, dtype='float64')
+    if table:
+        return ML_table().interp(teff, log_g)
+    
     g0 = log_g - 8
     T0 = (teff - 12000) / 1000 - 1.6 * g0
     #from a fitting
@@ -75,6 +216,54 @@ def calc_ML(teff, log_g):
     return ML
 
 
+class MLTable:
+    """
+    Mixing length tabulated on a regular (Teff, log g) grid over the convective regime, with bilinear interpolation.
+    """
+    def __init__(self, **kwargs):
+        """
+        kwargs:
+        teff = (5000, 15000, 25): (min, max, step) of the Teff axis in K
+        log_g = (7.0, 9.5, 0.02): (min, max, step) of the log g axis
+        """
+        t0, t1, dt = kwargs.get('teff',(5000, 15000, 25))
+        g0, g1, dg = kwargs.get('log_g',(7.0, 9.5, 0.02))
+        self.teff = np.linspace(t0, t1, int(round((t1 - t0) / dt)) + 1)
+        self.log_g = np.linspace(g0, g1, int(round((g1 - g0) / dg)) + 1)
+        self.ML = calc_ML(self.teff[:,None], self.log_g[None,:])
+    
+    def interp(self, teff, log_g):
+        """
+        Interpolate the mixing length at teff and log_g (numbers or arrays).
+        """
+        teff, log_g = np.broadcast_arrays(np.asarray(teff, dtype='float64'), np.asarray(log_g, dtype='float64'))
+        x = (teff - self.teff[0]) / (self.teff[1] - self.teff[0])
+        y = (log_g - self.log_g[0]) / (self.log_g[1] - self.log_g[0])
+        inside = (x >= 0) & (x <= len(self.teff) - 1) & (y >= 0) & (y <= len(self.log_g) - 1)
+        i = np.clip(np.floor(x).astype(int), 0, len(self.teff) - 2)
+        j = np.clip(np.floor(y).astype(int), 0, len(self.log_g) - 2)
+        fx = np.clip(x - i, 0, 1)
+        fy = np.clip(y - j, 0, 1)
+        ML = (self.ML[i,j] * (1 - fx) * (1 - fy) + self.ML[i+1,j] * fx * (1 - fy)
+              + self.ML[i,j+1] * (1 - fx) * fy + self.ML[i+1,j+1] * fx * fy)
+        if not np.all(inside):
+            ML = np.where(inside, ML, calc_ML(teff, log_g))
+        return ML
+
+
+_ML_table = None
+
+def ML_table():
+    """
+    The MLTable used by calc_ML(table=True). It is built the first time it is needed.
+    Assign files._ML_table = MLTable(...) to use a different range or resolution.
+    """
+    global _ML_table
+    if _ML_table is None:
+        _ML_table = MLTable()
+    return _ML_table
+
+
 def get_file(filename):
     """
     return the contents of a file in the tluspy.files directory
@@ -92,10 +281,8 @@ def get_path(filename):
     filename: str
     """
     
-    import tluspy
-    s = tluspy.__file__
-    to_pkg = s[:s.find('tluspy.py')]
-    path = to_pkg + filename
+    to_pkg = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(to_pkg, filename)
     return path
 
 def write_fort5(teff,log_g, aux, **kwargs):
@@ -125,18 +312,37 @@ def write_fort5(teff,log_g, aux, **kwargs):
     
     
     with open('fort.5','w') as file:
-        file.write('%i  %.3f\n' % (teff, log_g))#20546  7.910
-        file.write('%s  %s\n' % (str(lte)[0],str(ltgray)[0]))#T  T
-        file.write('\'%s\'\n' % aux)
-        file.write('%i\n' % frequencies)
-        file.write('1\n')
-        file.write('2 0 0\n')
-        file.write('1     0     %i      0    0      0    \' H 1\' \'%s\'\n' % (nlevels,path))
-        file.write('1     1     1      1      0      0    \' H 2\' \' \'\n')
-        file.write('0     0     0      -1    0      0    \' \' \' \'')
+        file.write(format_fort5(teff, log_g, aux, lte=lte, ltgray=ltgray, frequencies=frequencies, nlevels=nlevels, path=path))
     print('Finished writing fort.5')
     
 
+def format_fort5(teff, log_g, aux, **kwargs):
+    """
+    Return the contents of a fort.5 file as a str. The arguments are the same as for write_fort5.
+    
+    kwargs:
+    path = the H I data in config.h1_data: str, full path of the H I atomic data
+    """
+    lte = kwargs.get('lte',True)
+    ltgray = kwargs.get('ltgray',True)
+    frequencies = kwargs.get('frequencies',1000)
+    nlevels = kwargs.get('nlevels',9)
+    path = kwargs.get('path',None)
+    if path is None:
+        path = get_path('data/%s' % config.h1_data)
+    
+    s = '%i  %.3f\n' % (teff, log_g)#20546  7.910
+    s += '%s  %s\n' % (str(lte)[0],str(ltgray)[0])#T  T
+    s += '\'%s\'\n' % aux
+    s += '%i\n' % frequencies
+    s += '1\n'
+    s += '2 0 0\n'
+    s += '1     0     %i      0    0      0    \' H 1\' \'%s\'\n' % (nlevels,path)
+    s += '1     1     1      1      0      0    \' H 2\' \' \'\n'
+    s += '0     0     0      -1    0      0    \' \' \' \''
+    return s
+    
+
 def write_fort56(abns,**kwargs):
     """
     Write a fort.56 file to the current directory.
@@ -160,21 +366,32 @@ def write_fort56(abns,**kwargs):
     
     
     with open('fort.56','w') as file:
-        file.write('%i\n' % n_elems)
-        if 1 in abns:
-            file.write('%i\t%.3e' %(1,abns[1]))
-        else:
-            file.write('%i\t%i\n' % (1,1))
-        for i in range(2,n_elems+1):
-            if i in abns:
-                file.write('%i\t%.3e' %(i,abns[i]))
-            else:
-                file.write('%i\t%.1e' %(i,abn0))
-            if i < n_elems:
-                file.write('\n')
+        file.write(format_fort56(abns, n_elems=n_elems, abn0=abn0))
     print('Finished writing fort.56')
             
 
+def format_fort56(abns, **kwargs):
+    """
+    Return the contents of a fort.56 file as a str. The arguments are the same as for write_fort56.
+    """
+    n_elems = kwargs.get('n_elems',30)
+    abn0 = kwargs.get('abn0', 1e-50)
+    
+    s = '%i\n' % n_elems
+    if 1 in abns:
+        s += '%i\t%.3e\n' %(1,abns[1])
+    else:
+        s += '%i\t%i\n' % (1,1)
+    for i in range(2,n_elems+1):
+        if i in abns:
+            s += '%i\t%.3e' %(i,abns[i])
+        else:
+            s += '%i\t%.1e' %(i,abn0)
+        if i < n_elems:
+            s += '\n'
+    return s
+            
+
 def write_fort55(w1,w2,**kwargs):
     """
     Write a fort.55 file to the current directory. There are a lot of settings that can be changed in this file.
@@ -230,6 +447,15 @@ def write_fort55(w1,w2,**kwargs):
     space - spacing parameter, which represents the maximum distance of two neighboring wavelength points at the midpoint of the considered wavelength interval, that is, delta lambda <= space. The actual maximum spacing is proportional to the wavelength, delta lambda <= space * (alam0 + alam1)/(2lambda). For more details, see Appendix C.
     """
     
+    with open('fort.55', 'w') as file:
+        file.write(format_fort55(w1, w2, **kwargs))
+    print('Finshed writing fort.55')
+
+
+def format_fort55(w1,w2,**kwargs):
+    """
+    Return the contents of a fort.55 file as a str. The arguments are the same as for write_fort55.
+    """
     #parse kwargs
     
     imode = kwargs.get('imode',0)#1
@@ -257,21 +483,16 @@ def write_fort55(w1,w2,**kwargs):
     relop = kwargs.get('relop',0.0001)
     space = kwargs.get('space',0.01)
     
-    
-    
-    
-    #write file
-    with open('fort.55', 'w') as file:
-        file.write('%i\t%i\t%i\n'%(imode,idstd,iprin))
-        file.write('%i\t%i\t%i\t%i\n'%(inmod,intrpl,ichang,ichemc))
-        file.write('%i\t%i\t%i\t%i\t%i\n'%(iophli,nunalp,nunbet,nungam,nunbal))
-        file.write('%i\t%i\t%i\t%i\t%i\n'%(ifreq,inlte,icontl,inlist,ifhe2))
-        file.write('%i\t%i\t%i\n'%(ihydpr,ihe1pr,ihe2pr))
-        file.write('%i\t%i\t%f\t%i\t%f\t%f\n'%(w1,w2,cutof0,cutofs,relop,space))
-    print('Finshed writing fort.55')
+    s = '%i\t%i\t%i\n'%(imode,idstd,iprin)
+    s += '%i\t%i\t%i\t%i\n'%(inmod,intrpl,ichang,ichemc)
+    s += '%i\t%i\t%i\t%i\t%i\n'%(iophli,nunalp,nunbet,nungam,nunbal)
+    s += '%i\t%i\t%i\t%i\t%i\n'%(ifreq,inlte,icontl,inlist,ifhe2)
+    s += '%i\t%i\t%i\n'%(ihydpr,ihe1pr,ihe2pr)
+    s += '%i\t%i\t%f\t%i\t%f\t%f\n'%(w1,w2,cutof0,cutofs,relop,space)
+    return s
 
 
-def write_aux(filename,teff,log_g):
+def write_aux(filename,teff,log_g,**kwargs):
     """
     Write an aux file given a filename, teff, and log_g.
     There are two modes that depend on the teff. For warmer models there is no convection considered.
@@ -279,27 +500,37 @@ def write_aux(filename,teff,log_g):
     filename: str, name of the aux file
     teff: Teff/[K]
     log_g: log(g/[cm/s2])
-    """
-    if teff > 15000:
-        with open(filename,'w') as file:
-            for param in config.aux_no_convec:
-                if type(config.aux_no_convec[param]) == int:
-                    file.write('%s=%i\n' % (param,config.aux_no_convec[param]))
-                else:
-                    file.write('%s=%.3e\n' % (param,config.aux_no_convec[param]))
     
-    else:
-        ML = calc_ML(teff, log_g)
-        with open(filename, 'w') as file:
-            file.write('HMIX0=%.3f\n' % ML)
-            for param in config.aux_convec:
-                if type(config.aux_convec[param]) == int:
-                    file.write('%s=%i\n' % (param,config.aux_convec[param]))
-                else:
-                    file.write('%s=%.3e\n' % (param,config.aux_convec[param]))
+    kwargs:
+    ML = None: float, mixing length if it is already known, otherwise it is calculated with calc_ML
+    params = {}: dict, aux parameters that replace or add to the ones in config, e.g. {'ITEK': 80}
+    """
+    with open(filename,'w') as file:
+        file.write(format_aux(teff, log_g, **kwargs))
     print('Finished writing %s' % filename)
 
 
+def format_aux(teff, log_g, **kwargs):
+    """
+    Return the contents of an aux file as a str. The arguments are the same as for write_aux.
+    """
+    ML = kwargs.get('ML',None)
+    params = kwargs.get('params',{})
+    s = ''
+    if teff > 15000:
+        aux = dict(config.aux_no_convec, **params)
+    else:
+        if ML is None:
+            ML = calc_ML(teff, log_g)
+        s += 'HMIX0=%.3f\n' % ML
+        aux = dict(config.aux_convec, **params)
+    for param in aux:
+        if type(aux[param]) == int:
+            s += '%s=%i\n' % (param,aux[param])
+        else:
+            s += '%s=%.3e\n' % (param,aux[param])
+    return s
+
 
 def read_abn_file(filename, **kwargs):
     """
@@ -350,19 +581,87 @@ def read_abn_file(filename, **kwargs):
     abn_dict[1] = 1
     return abn_dict
 
-def get_linelist(filename):
+def get_linelist(filename, **kwargs):
     """
-    Get a linelist from tluspy/linelists/filename
+    Get a linelist from tluspy/linelists/filename, or from filename if it is a full path
     You can even make your own so long as you follow the file convention.
+    
+    If w1 and w2 are given only the lines within [w1 - cutof0, w2 + cutof0] are written to fort.19,
+    using a wavelength index of the linelist that is built the first time (see DAZspec.linelist).
+    
+    kwargs:
+    w1 = None: the starting wavelength in angstroms, as in write_fort55
+    w2 = None: the ending wavelength in angstroms, as in write_fort55
+    cutof0 = 3: line cutoff in angstroms, as in write_fort55
     """
-    path = get_path('linelists/%s' % filename)
-    copyfile(path,'fort.19')
-    print('Got linelist')
+    w1 = kwargs.get('w1',None)
+    w2 = kwargs.get('w2',None)
+    cutof0 = kwargs.get('cutof0',3)
+    
+    path = get_path(os.path.join('linelists', filename))
+    if w1 is None or w2 is None:
+        link(path,'fort.19') # Synspec only reads it
+        print('Got linelist')
+    else:
+        from .linelist import write_window
+        n = write_window(path, w1, w2, cutof0=cutof0)
+        print('Got %i lines from linelist' % n)
     
 
 
 
 
+def make_header(params, **kwargs):
+    """
+    Make the FITS-like header that add_header puts in front of a spectrum.
+    
+    params: Parameters object
+    
+    kwargs:
+    generated = now: str, time stamp yyyymmdd-hhmmss of when the spectrum was made
+    tl_version = config.tl_version: int
+    syn_version = config.syn_version: int
+    user = config.user: str
+    ML = None: float, mixing length if it is already known, otherwise it is calculated with calc_ML
+    
+    returns the header as a str
+    """
+    generated = kwargs.get('generated',datetime.now().strftime('%Y%m%d-%H%M%S'))
+    tl_version = kwargs.get('tl_version',config.tl_version)
+    syn_version = kwargs.get('syn_version',config.syn_version)
+    user = kwargs.get('user',config.user)
+    ML = kwargs.get('ML',None)
+    
+    #get convection string
+    conv_str = 'Convection: None'
+    
+    if params.teff <= 15000:
+        if ML is None:
+            ML = calc_ML(params.teff,params.log_g)
+        conv_str = 'Convection: ML2 = %.2f' % ML
+    
+    s = 'TEFF     = %i\n' % params.teff
+    s += 'LOG_G    = %.2f\n' % params.log_g
+    s += 'COMMENT    Tlusty version %i\n' % tl_version
+    s += 'COMMENT    Synspec version %i\n' % syn_version
+    s += 'COMMENT    Generated %s\n' % generated
+    s += 'COMMENT    User: %s\n' % user
+    s += 'COMMENT    Star Name %s\n' % params.name
+    s += 'COMMENT    %s\n' % conv_str
+    s += 'COMMENT    el  log[N/H]  [N/H]\n'
+    for elem in params.abns:
+        s += 'COMMENT    %02d   %.2f     %.2e\n' % (elem,log10(params.abns[elem]), params.abns[elem])
+    #now just default stuff to convert to fits
+    s += 'NAXIS    = 2\n'
+    s += 'TTYPE1   = \'wavelength\'\n'
+    s += 'TUNIT1   = \'Angstrom\'\n'
+    s += 'TTYPE2   = \'Flambda\'\n'
+    s += 'TUNIT2   = \'erg/cm2/s/Angstrom\'\n'
+    s += 'COMMENT    Air wavelengths > 200 nm\n'
+    s += 'END\n'
+    return s
+
+
 def add_header(filename, params, **kwargs):
     """
     Copy the data from fort.7 to a new file filename but put a header first so that you can run do_spec.do_model_linear_all()
@@ -372,44 +671,19 @@ def add_header(filename, params, **kwargs):
     
     kwargs:
     dt_suffix=False: bool append _yyymmdd-hhmm to end of filename
+    ML = None: float, mixing length if it is already known, otherwise it is calculated with calc_ML
     """
     
     dt_suffix = kwargs.get('dt_suffix',False)
+    ML = kwargs.get('ML',None)
     now = datetime.now()
     dt_s = now.strftime('%Y%m%d-%H%M%S')
     
     if dt_suffix:
         filename = filename +'_' + dt_s
     
-    
-    #get convection string
-    conv_str = 'Convection: None'
-    
-    if params.teff <= 15000:
-        ML = calc_ML(params.teff,params.log_g)
-        conv_str = 'Convection: ML2 = %.2f' % ML
-    
-    
     with open(filename + '.tl', 'w') as file:
-        file.write('TEFF     = %i\n' % params.teff)
-        file.write('LOG_G    = %.2f\n' % params.log_g)
-        file.write('COMMENT    Tlusty version %i\n' % config.tl_version)
-        file.write('COMMENT    Synspec version %i\n' % config.syn_version)
-        file.write('COMMENT    Generated %s\n' % dt_s)
-        file.write('COMMENT    User: %s\n' % config.user)
-        file.write('COMMENT    Star Name %s\n' % params.name)
-        file.write('COMMENT    %s\n' % conv_str)
-        file.write(    'COMMENT    el  log[N/H]  [N/H]\n')
-        for elem in params.abns:
-            file.write('COMMENT    %02d   %.2f     %.2e\n' % (elem,log10(params.abns[elem]), params.abns[elem]))
-        #now just default stuff to convert to fits
-        file.write('NAXIS    = 2\n')
-        file.write('TTYPE1   = \'wavelength\'\n')
-        file.write('TUNIT1   = \'Angstrom\'\n')
-        file.write('TTYPE2   = \'Flambda\'\n')
-        file.write('TUNIT2   = \'erg/cm2/s/Angstrom\'\n')
-        file.write('COMMENT    Air wavelengths > 200 nm\n')
-        file.write('END\n')
+        file.write(make_header(params, generated=dt_s, ML=ML))
         with open('fort.7', 'r') as infile:
             for line in infile:
                 file.write(line)
@@ -421,4 +695,17 @@ def move():
     """
     rename fort.7 to fort.8
     """
-    system('mv fort.7 fort.8')
+    os.replace('fort.7', 'fort.8')
+
+
+def link(src, dst):
+    """
+    Make dst a symbolic link to src instead of copying read only inputs. An existing dst is replaced.
+    
+    src: str, existing file
+    dst: str, name of the link
+    """
+    src = os.path.abspath(src)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.symlink(src, dst)
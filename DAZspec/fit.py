@@ -0,0 +1,273 @@
+"""
+Fit observed spectra for Teff, log g and metal abundances.
+
+Chi-square is computed for one observed spectrum against many models at once as matrix products, with the
+best flux scale of every model solved analytically (the distance and radius are not known). Models come
+from a GridInterpolator, which is searched on a lattice that is refined around the best point, or from any
+array of spectra such as SpectrumStore.fluxes. Many stars are fitted in parallel with fit_many.
+
+Synspec is only run at the end, by refine_abundances: the best atmosphere is kept and only the metal
+abundances are varied with sweep.abundance_sweep (fort.56 with ichemc=1), which is exact where the grid
+interpolation is approximate.
+"""
+import os
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .files import Parameters
+from .broaden import broaden
+from .sweep import abundance_sweep
+from .store import SpectrumStore
+
+
+def chi2(flux, err, models, **kwargs):
+    """
+    Chi-square of an observed spectrum against many models on the same wavelength grid.
+
+    flux: array (npts,), observed flux
+    err: array (npts,), 1 sigma uncertainties
+    models: array (n_models, npts)
+
+    kwargs:
+    mask = None: bool array (npts,), only fit where True. Points with err <= 0 or non finite values are always left out.
+    scale = True: bool, multiply every model by the factor that minimizes its chi-square
+
+    returns (chi2, scale), arrays of shape (n_models,)
+    """
+    mask = kwargs.get('mask',None)
+    scale = kwargs.get('scale',True)
+    flux = np.asarray(flux, dtype='float64')
+    err = np.asarray(err, dtype='float64')
+    models = np.atleast_2d(np.asarray(models, dtype='float64'))
+    good = np.isfinite(flux) & np.isfinite(err) & (err > 0)
+    if mask is not None:
+        good &= np.asarray(mask, dtype=bool)
+    if not good.any():
+        raise ValueError('No points to fit: every point is masked or has a non finite value or err <= 0')
+    weight = np.where(good, 1 / np.where(good, err, 1)**2, 0.)
+    flux = np.where(good, flux, 0.)
+    models = np.where(good, models, 0.)
+    # chi2(a) = sum w (f - a m)^2 = ff - 2 a fm + a^2 mm, minimized at a = fm / mm
+    ff = np.sum(weight * flux**2)
+    fm = models @ (weight * flux)
+    mm = (models**2) @ weight
+    if not scale:
+        return ff - 2 * fm + mm, np.ones(len(models))
+    a = fm / np.where(mm > 0, mm, 1)
+    return ff - a * fm, a
+
+
+def _lattice(center, half_width, n, lo, hi):
+    """
+    n points per axis within [center - half_width, center + half_width], clipped to [lo, hi]
+    """
+    axes = [np.unique(np.clip(np.linspace(c - h, c + h, n), l, u)) for c, h, l, u in zip(center, half_width, lo, hi)]
+    return np.array(list(itertools.product(*axes)))
+
+
+def fit(wave, flux, err, interpolator, **kwargs):
+    """
+    Fit one observed spectrum with a GridInterpolator.
+    The whole grid is searched on a lattice, which is then shrunk around the best point a few times.
+
+    wave, flux, err: arrays, the observed spectrum
+    interpolator: GridInterpolator
+
+    kwargs:
+    n = 5: int, lattice points per axis in every round
+    rounds = 4: int, number of refinement rounds, each halves the lattice around the best point
+    batch = 2000: int, models broadened and compared at once
+    mask, scale: see chi2
+    all other kwargs (resolution, vsini, fwhm, step, method) are passed to broaden.broaden
+
+    returns a dict with the best point (dict over interpolator.names, abundances as log10(N/H)), chi2, scale,
+    dof (number of points fitted minus free parameters) and the lattice and chi2 of the last round
+    """
+    n = kwargs.pop('n',5)
+    rounds = kwargs.pop('rounds',4)
+    batch = kwargs.pop('batch',2000)
+    mask = kwargs.pop('mask',None)
+    scale = kwargs.pop('scale',True)
+    wave = np.asarray(wave, dtype='float64')
+
+    def evaluate(points):
+        c = np.empty(len(points))
+        a = np.empty(len(points))
+        for start in range(0, len(points), batch):
+            models = interpolator.evaluate(points[start:start+batch])
+            models = broaden(interpolator.wave, models, wave, **kwargs)
+            c[start:start+batch], a[start:start+batch] = chi2(flux, err, models, mask=mask, scale=scale)
+        return c, a
+
+    lo = np.array([axis[0] for axis in interpolator.axes])
+    hi = np.array([axis[-1] for axis in interpolator.axes])
+    center = (lo + hi) / 2
+    half_width = (hi - lo) / 2
+    for r in range(rounds + 1):
+        points = _lattice(center, half_width, n, lo, hi)
+        c, a = evaluate(points)
+        best = np.argmin(c)
+        center = points[best]
+        half_width = half_width / 2
+
+    good = np.isfinite(flux) & np.isfinite(err) & (np.asarray(err) > 0)
+    if mask is not None:
+        good &= np.asarray(mask, dtype=bool)
+    return {
+        'best': {name: float(x) for name, x in zip(interpolator.names, points[best])},
+        'chi2': float(c[best]),
+        'scale': float(a[best]),
+        'dof': int(good.sum()) - len(interpolator.names) - int(scale),
+        'points': points,
+        'chi2_grid': c,
+        }
+
+
+def fit_models(wave, flux, err, model_wave, models, **kwargs):
+    """
+    Compare one observed spectrum with a set of precomputed models, e.g. from SpectrumStore.fluxes.
+
+    wave, flux, err: arrays, the observed spectrum
+    model_wave: array (npts,), wavelengths of the models
+    models: array (n_models, npts)
+
+    kwargs:
+    batch = 2000: int, models broadened and compared at once
+    mask, scale: see chi2
+    all other kwargs are passed to broaden.broaden
+
+    returns a dict with the index of the best model, its chi2 and scale and the arrays chi2 and scale of all models
+    """
+    batch = kwargs.pop('batch',2000)
+    mask = kwargs.pop('mask',None)
+    scale = kwargs.pop('scale',True)
+    c = np.empty(len(models))
+    a = np.empty(len(models))
+    for start in range(0, len(models), batch):
+        broadened = broaden(model_wave, models[start:start+batch], wave, **kwargs)
+        c[start:start+batch], a[start:start+batch] = chi2(flux, err, broadened, mask=mask, scale=scale)
+    best = int(np.argmin(c))
+    return {'best': best, 'chi2': float(c[best]), 'scale': float(a[best]), 'chi2_all': c, 'scale_all': a}
+
+
+def _fit_one(observation, interpolator, kwargs):
+    result = {'name': observation.get('name'), 'status': 'ok', 'error': None}
+    try:
+        result.update(fit(observation['wave'], observation['flux'], observation['err'], interpolator, **dict(kwargs)))
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    return result
+
+
+def fit_many(observations, interpolator, **kwargs):
+    """
+    Fit many observed spectra in parallel.
+
+    observations: list of dicts with the keys name, wave, flux and err
+    interpolator: GridInterpolator, sent to every worker once
+
+    kwargs:
+    processes = os.cpu_count(): int, number of worker processes
+    all other kwargs are passed to fit
+
+    returns a list of the results of fit (plus name, status and error) in the order of observations
+    """
+    processes = kwargs.pop('processes',os.cpu_count())
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(interpolator,)) as pool:
+        futures = [pool.submit(_fit_worker, observation, kwargs) for observation in observations]
+        results = [future.result() for future in futures]
+    n_failed = sum(result['status'] != 'ok' for result in results)
+    print('Fitted %i spectra (%i failed)' % (len(results), n_failed))
+    return results
+
+
+_interpolator = None
+
+def _init_worker(interpolator):
+    global _interpolator
+    _interpolator = interpolator
+
+def _fit_worker(observation, kwargs):
+    return _fit_one(observation, _interpolator, kwargs)
+
+
+def refine_abundances(params, atmosphere, wave, flux, err, elements, root, **kwargs):
+    """
+    Refine the abundances of a fit with exact Synspec spectra of the best atmosphere.
+    Every element is varied on its own around its current value, the spectra are computed in parallel by
+    sweep.abundance_sweep (ichemc=1, the atmosphere is not recomputed) and a parabola through the chi2
+    around the minimum gives the new abundance. The unchanged model is computed once and shared by all elements.
+
+    params: Parameters object of the best fit
+    atmosphere: str, the converged Tlusty atmosphere of params (fort.7 or fort.8)
+    wave, flux, err: arrays, the observed spectrum
+    elements: list of atomic numbers to refine, each needs a positive abundance in params
+    root: str, directory for the Synspec runs
+
+    kwargs:
+    offsets = (-0.3, -0.15, 0, 0.15, 0.3): offsets in dex from the current abundance
+    w1 = wave.min() - 10, w2 = wave.max() + 10: wavelength range of the Synspec runs in angstroms
+    linelist, fort5, fort55, fort56, processes: passed to abundance_sweep
+    mask, scale: see chi2
+    resolution, vsini, fwhm, step, method: passed to broaden.broaden
+
+    returns a dict with params (a new Parameters object with the refined abundances), chi2 (of the best
+    computed spectrum) and for every element the log abundances and chi2 that were computed
+    """
+    offsets = np.asarray(kwargs.pop('offsets',(-0.3, -0.15, 0, 0.15, 0.3)))
+    mask = kwargs.pop('mask',None)
+    scale = kwargs.pop('scale',True)
+    broaden_kwargs = {key: kwargs.pop(key) for key in ('resolution', 'vsini', 'epsilon', 'fwhm', 'step', 'method') if key in kwargs}
+    kwargs.setdefault('w1',int(np.floor(np.min(wave) - 10)))
+    kwargs.setdefault('w2',int(np.ceil(np.max(wave) + 10)))
+
+    missing = [z for z in elements if params.abns.get(z,0) <= 0]
+    if missing:
+        raise ValueError('%s has no abundance to refine for the elements %s' % (params.name, ', '.join(str(z) for z in missing)))
+
+    # variant 0 is the unchanged model, the offset 0 of every element
+    variants = [Parameters('%s_base' % params.name, params.teff, params.log_g, dict(params.abns))]
+    rows = np.zeros((len(elements), len(offsets)), dtype=int)
+    for k, z in enumerate(elements):
+        for j, offset in enumerate(offsets):
+            if offset == 0:
+                continue
+            abns = dict(params.abns)
+            abns[z] = params.abns[z] * 10**offset
+            rows[k,j] = len(variants)
+            variants.append(Parameters('%s_%i_%+.3f' % (params.name, z, offset), params.teff, params.log_g, abns))
+    root = os.path.abspath(root)
+    store = SpectrumStore(os.path.join(root, 'store'))
+    results = abundance_sweep(params, atmosphere, variants, root, store=store, **kwargs)
+    failed = [result for result in results if result['status'] != 'ok']
+    if failed:
+        raise RuntimeError('%i Synspec runs of the refinement failed, e.g. %s: %s' % (len(failed), failed[0]['name'], failed[0]['error']))
+
+    models = np.array([broaden(*store.spectrum(result['store_index']), wave, **broaden_kwargs) for result in results])
+    c, a = chi2(flux, err, models, mask=mask, scale=scale)
+    c = c[rows]
+
+    refined = dict(params.abns)
+    out = {'elements': {}}
+    for k, z in enumerate(elements):
+        log_abn = np.log10(params.abns[z]) + offsets
+        i = int(np.argmin(c[k]))
+        best = float(log_abn[i])
+        if np.ptp(c[k]) <= 1e-9 * abs(c[k].min()):
+            print('Warning: the spectrum does not depend on element %i in this range, its abundance is kept' % z)
+            best = float(np.log10(params.abns[z]))
+        elif 0 < i < len(offsets) - 1: # vertex of the parabola through the minimum and its neighbours
+            x = log_abn[i-1:i+2]
+            y = c[k,i-1:i+2]
+            p = np.polyfit(x, y, 2)
+            if p[0] > 0:
+                best = float(np.clip(-p[1] / (2 * p[0]), x[0], x[-1]))
+        else:
+            print('Warning: the chi2 of element %i is smallest at the edge of the offsets, widen them' % z)
+        refined[z] = 10**best
+        out['elements'][z] = {'log_abn': log_abn, 'chi2': c[k], 'best': best}
+    out['params'] = Parameters(params.name, params.teff, params.log_g, refined)
+    out['chi2'] = float(c.min())
+    return out
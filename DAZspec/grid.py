@@ -0,0 +1,327 @@
+"""
+Run whole grids of models at once. Every model gets its own working directory so that the fort.* files
+of one model never collide with another, and the Tlusty -> Synspec chain is spread over a pool of processes.
+"""
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+from . import config
+from .files import write_fort5
+from .files import write_fort55
+from .files import write_fort56
+from .files import write_aux
+from .files import get_linelist
+from .files import add_header
+from .files import move
+from .files import calc_ML
+from .tluspy import tlusty
+from .tluspy import synspec
+from .cache import ResultCache
+from .cache import atmosphere_key
+from .cache import spectrum_key
+from .warmstart import AtmosphereIndex
+from .pconv import converged
+from .monitor import run_tlusty
+from .store import SpectrumStore
+from .shard import synspec_sharded
+from .metrics import RunMetrics
+from .metrics import append_jsonl
+from .metrics import write_prometheus
+from .profiles import apply_profile
+from .scratch import Scratch
+from .scratch import clean_stale
+
+
+def run_model(params, dirname, **kwargs):
+    """
+    Run the full Tlusty -> Synspec chain for one model inside dirname.
+    The directory is created if it does not exist. Nothing is raised if a step fails, instead the
+    failure is recorded in the returned dictionary so that a grid can keep going.
+
+    params: Parameters object
+    dirname: str, working directory of this model
+
+    kwargs:
+    profile = None: str, name of a profile in config.profiles whose fort5, fort55 and aux settings are used.
+        Settings given in fort5, fort55 and aux_params win over the ones of the profile.
+    aux = 'aux': str, name of the aux file
+    aux_params = {}: dict, aux parameters that replace or add to the ones in config (see write_aux)
+    w1 = 3000: int, starting wavelength of the spectrum in angstroms
+    w2 = 7000: int, ending wavelength of the spectrum in angstroms
+    linelist = None: str, name of the linelist in DAZspec/linelists. If None, Synspec is not run.
+    fort5 = {}: dict, kwargs passed to write_fort5
+    fort55 = {}: dict, kwargs passed to write_fort55
+    fort56 = {}: dict, kwargs passed to write_fort56
+    cache = None: ResultCache or the path of one. Cached atmospheres and spectra are copied in instead of being recomputed.
+        Only converged atmospheres, and spectra computed from them, are cached.
+    index = None: AtmosphereIndex or the path of one. Tlusty is warm started from the closest converged atmosphere
+        and falls back to a gray start if that does not converge. Converged atmospheres are added to the index.
+    monitor = None: dict, if given Tlusty is run with monitor.run_tlusty(**monitor) and killed early when it
+        diverges or stagnates. The summary of the last Tlusty run is stored in result['monitor'].
+    store = None: SpectrumStore or the path of one. Spectra are appended to it and their index is stored in result['store_index'].
+    tl = True: bool, write the spectrum as a .tl text file with add_header
+    shards = None: int, split the spectrum into this many wavelength chunks run by parallel Synspec processes (see shard.py)
+    metrics = None: str or True, collect the metrics of the run (see metrics.py) into result['metrics'].
+        If a str, the record is also appended to that JSON-lines file.
+    scratch = None: True or str, run in a scratch directory under config.scratch_dir (or under this directory if a str)
+        and move only the files in config.scratch_keep and the aux file to dirname at the end (see scratch.py)
+
+    returns a dict with the keys name, dir, status ('ok' or 'failed'), stage, error, spectrum,
+    cached (None, 'atmosphere' or 'spectrum') and warm_start (name of the seed atmosphere or None)
+    """
+    kwargs = apply_profile(kwargs)
+    aux = kwargs.get('aux','aux')
+    aux_params = kwargs.get('aux_params',{})
+    w1 = kwargs.get('w1',3000)
+    w2 = kwargs.get('w2',7000)
+    linelist = kwargs.get('linelist',None)
+    fort5 = kwargs.get('fort5',{})
+    fort55 = kwargs.get('fort55',{})
+    fort56 = kwargs.get('fort56',{})
+    cache = kwargs.get('cache',None)
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    index = kwargs.get('index',None)
+    monitor = kwargs.get('monitor',None)
+    store = kwargs.get('store',None)
+    if isinstance(store, str):
+        store = SpectrumStore(store)
+    tl = kwargs.get('tl',True)
+    shards = kwargs.get('shards',None)
+    metrics_file = kwargs.get('metrics',None)
+    scratch = kwargs.get('scratch',None)
+    if isinstance(index, str):
+        index = AtmosphereIndex(index)
+
+    dirname = os.path.abspath(dirname)
+    result = {
+        'name': params.name,
+        'dir': dirname,
+        'status': 'ok',
+        'stage': None,
+        'error': None,
+        'spectrum': None,
+        'cached': None,
+        'warm_start': None,
+        }
+    metrics = RunMetrics(params)
+    workdir = None
+    original_cwd = os.getcwd()
+    try:
+        result['stage'] = 'setup'
+        os.makedirs(dirname, exist_ok=True)
+        if scratch:
+            workdir = Scratch(dirname, base=None if scratch is True else scratch, keep=config.scratch_keep + [aux])
+            os.chdir(workdir.open())
+        else:
+            os.chdir(dirname)
+
+        ML = calc_ML(params.teff, params.log_g) if params.teff <= 15000 else None
+        atm_key = spec_key = None
+        if cache is not None:
+            atm_key = atmosphere_key(params, **kwargs)
+            if linelist is not None:
+                spec_key = spectrum_key(params, **kwargs)
+
+        if spec_key is not None and cache.restore(spec_key):
+            # the whole chain was run before, only the header is missing
+            result['cached'] = 'spectrum'
+            with metrics.stage('store'):
+                _save_spectrum(params, dirname, store, tl, ML, result)
+            result['stage'] = 'done'
+            return result
+
+        result['stage'] = 'tlusty'
+        with metrics.stage('decks'):
+            write_aux(aux, params.teff, params.log_g, ML=ML, params=aux_params)
+        if atm_key is not None and cache.restore(atm_key):
+            with metrics.stage('decks'):
+                write_fort5(params.teff, params.log_g, aux, **fort5)
+            result['cached'] = 'atmosphere'
+            atm_converged = True # only converged atmospheres are cached
+        else:
+            with metrics.stage('tlusty'):
+                result['warm_start'] = _warm_start(params, aux, fort5, index, monitor, result, metrics)
+                if result['warm_start'] is None:
+                    write_fort5(params.teff, params.log_g, aux, **fort5)
+                    _check(_tlusty(monitor, result, metrics), 'fort.7', 'Tlusty')
+            if metrics_file is not None:
+                metrics.tlusty_outputs()
+            atm_converged = converged()
+            if index is not None and atm_converged:
+                index.add(params, lte=fort5.get('lte',True))
+            if atm_key is not None and atm_converged: # Tlusty also exits normally when it runs out of iterations
+                cache.put(atm_key, {'fort.7': 'fort.7', 'fort.9': 'fort.9'}, meta={'name': params.name, 'teff': params.teff, 'log_g': params.log_g})
+
+        if linelist is not None:
+            result['stage'] = 'synspec'
+            with metrics.stage('decks'):
+                move()
+                write_fort55(w1, w2, **fort55)
+                write_fort56(params.abns, **fort56)
+                if shards is None:
+                    get_linelist(linelist, w1=w1, w2=w2, cutof0=fort55.get('cutof0',3))
+            with metrics.stage('synspec'):
+                if shards is None:
+                    job = synspec(block=False, stdout='synspec.6') # fort.6 stays the output of Tlusty for pconv
+                    job.wait()
+                    metrics.job('synspec', job)
+                    _check(job.returncode, 'fort.7', 'Synspec')
+                else:
+                    synspec_sharded(w1, w2, linelist, n_chunks=shards, fort55=fort55)
+            if spec_key is not None and atm_converged:
+                cache.put(spec_key, {'fort.7': 'fort.7', 'fort.9': 'fort.9'}, meta={'name': params.name, 'teff': params.teff, 'log_g': params.log_g, 'abns': params.abns})
+            with metrics.stage('store'):
+                _save_spectrum(params, dirname, store, tl, ML, result)
+        result['stage'] = 'done'
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        os.chdir(original_cwd)
+        if workdir is not None:
+            try:
+                with metrics.stage('collect'):
+                    workdir.close()
+            except OSError as e:
+                result['status'] = 'failed'
+                result['error'] = 'Could not move the outputs to %s: %s' % (dirname, e)
+        if metrics_file is not None:
+            result['metrics'] = metrics.record(result)
+            if isinstance(metrics_file, str):
+                append_jsonl(result['metrics'], metrics_file)
+    return result
+
+
+def _save_spectrum(params, dirname, store, tl, ML, result):
+    """
+    Keep the spectrum in fort.7 as a .tl file and/or in a SpectrumStore.
+    """
+    result['stage'] = 'store'
+    if tl:
+        result['spectrum'] = os.path.join(dirname, add_header(params.name, params, ML=ML))
+    if store is not None:
+        result['store_index'] = store.append(params, ML=ML)
+
+
+def _tlusty(monitor, result, metrics):
+    """
+    Run Tlusty, watched by a ConvergenceMonitor if monitor kwargs are given, and add its usage to metrics.
+    Raises a RuntimeError if the monitor stopped a diverging or stagnating run.
+    """
+    if monitor is None:
+        job = tlusty(block=False)
+        job.wait()
+        metrics.job('tlusty', job)
+        return job.returncode
+    m = run_tlusty(**monitor)
+    metrics.job('tlusty', m.job)
+    result['monitor'] = m.summary()
+    if m.reason in ('diverged', 'stagnated'):
+        raise RuntimeError('Tlusty %s after %i iterations' % (m.reason, len(m.iters)))
+    return m.returncode
+
+
+def _warm_start(params, aux, fort5, index, monitor, result, metrics):
+    """
+    Try to run Tlusty from the closest converged atmosphere in index.
+    Returns the name of the seed atmosphere if the warm started model converged, otherwise None and the
+    caller has to do a gray start.
+    """
+    if index is None:
+        return None
+    meta = index.seed(params, lte=fort5.get('lte',True))
+    if meta is None:
+        return None
+    write_fort5(params.teff, params.log_g, aux, **dict(fort5, ltgray=False))
+    try:
+        if _tlusty(monitor, result, metrics) == 0 and os.path.exists('fort.7') and converged():
+            return meta['name']
+    except RuntimeError:
+        pass
+    print('Warm start from %s did not converge, falling back to a gray start' % meta['name'])
+    for filename in ('fort.7', 'fort.8'):
+        if os.path.exists(filename):
+            os.remove(filename)
+    return None
+
+
+def _check(status, output, program):
+    """
+    Raise a RuntimeError if a program exited badly or did not leave its output behind.
+    """
+    if status != 0:
+        raise RuntimeError('%s exited with status %i' % (program, status))
+    if not os.path.exists(output):
+        raise RuntimeError('%s did not write %s' % (program, output))
+
+
+def run_grid(params_list, root, **kwargs):
+    """
+    Run a list of models in parallel. Model i is run in root/params_list[i].name.
+    Failures are reported in the results but never stop the rest of the batch.
+
+    params_list: list of Parameters objects, names must be unique
+    root: str, directory that holds one subdirectory per model
+
+    kwargs:
+    processes = os.cpu_count(): int, number of worker processes
+    prometheus = None: str, write the metrics of all runs to this Prometheus textfile (.prom) at the end.
+        Turns on metrics in run_model if they are not on already.
+    all other kwargs are passed to run_model
+
+    returns a list of result dicts (see run_model) in the same order as params_list
+    """
+    processes = kwargs.pop('processes', os.cpu_count())
+    prometheus = kwargs.pop('prometheus', None)
+    if prometheus is not None:
+        kwargs.setdefault('metrics', True)
+    if kwargs.get('scratch',None):
+        clean_stale(base=None if kwargs['scratch'] is True else kwargs['scratch'])
+
+    names = [params.name for params in params_list]
+    if len(set(names)) != len(names):
+        raise ValueError('Every model in a grid needs a unique name, it is used as the name of its directory.')
+
+    root = os.path.abspath(root)
+    os.makedirs(root, exist_ok=True)
+
+    results = [None] * len(params_list)
+    n_failed = 0
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {}
+        for i, params in enumerate(params_list):
+            future = pool.submit(run_model, params, os.path.join(root, params.name), **kwargs)
+            futures[future] = i
+        for n, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e: # the worker itself died
+                results[i] = {
+                    'name': params_list[i].name,
+                    'dir': os.path.join(root, params_list[i].name),
+                    'status': 'failed',
+                    'stage': None,
+                    'error': '%s: %s' % (type(e).__name__, e),
+                    'spectrum': None,
+                    'cached': None,
+                    'warm_start': None,
+                    }
+            if results[i]['status'] != 'ok':
+                n_failed += 1
+                print('Model %s failed during %s: %s' % (results[i]['name'], results[i]['stage'], results[i]['error']))
+            print('Finished %i/%i models (%i failed)' % (n, len(params_list), n_failed))
+    if prometheus is not None:
+        write_prometheus([result['metrics'] for result in results if 'metrics' in result], prometheus)
+    return results
+
+
+def failed(results):
+    """
+    Return only the results of the models that failed.
+    """
+    return [result for result in results if result['status'] != 'ok']
@@ -0,0 +1,241 @@
+"""
+Approximate spectra from a precomputed grid, without running Synspec.
+
+A GridInterpolator holds the fluxes of a rectilinear grid of models (every combination of the Teff, log g
+and abundance values) on one wavelength grid, and interpolates multilinearly between the 2^d models around a
+point. Abundances are interpolated in log10(N/H) and, by default, fluxes in log10, which follows the shape
+of lines and of the continuum much better than linear flux. Many points are evaluated at once as arrays,
+so a fitting loop gets thousands of spectra in the time one Synspec run takes.
+"""
+import numpy as np
+
+from .store import SpectrumStore
+from .store import read_tl
+
+
+class GridInterpolator:
+    """
+    Multilinear interpolation over a grid of spectra.
+
+    Attributes:
+    names: list of the axes, 'teff', 'log_g' and the atomic numbers of the abundance axes
+    axes: list of the sorted values along each axis (log10(N/H) for abundances)
+    wave: wavelength grid of all the spectra
+    flux: array of shape (len(axes[0]), ..., len(axes[-1]), len(wave))
+    """
+    def __init__(self, names, axes, wave, flux, **kwargs):
+        """
+        names: list of axis names
+        axes: list of 1d arrays, the grid values along each axis
+        wave: array (npts,)
+        flux: array with one dimension per axis plus wavelength
+
+        kwargs:
+        log_flux = True: bool, interpolate log10 of the flux
+        """
+        self.names = list(names)
+        self.axes = [np.asarray(axis, dtype='float64') for axis in axes]
+        self.wave = np.asarray(wave, dtype='float64')
+        self.log_flux = kwargs.get('log_flux',True)
+        flux = np.asarray(flux, dtype='float32')
+        if flux.shape != tuple(len(axis) for axis in self.axes) + (len(self.wave),):
+            raise ValueError('flux has shape %s but the axes and wave need %s' % (flux.shape, tuple(len(axis) for axis in self.axes) + (len(self.wave),)))
+        for name, axis in zip(self.names, self.axes):
+            if np.any(np.diff(axis) <= 0):
+                raise ValueError('The values of axis %s must be increasing' % name)
+        if self.log_flux:
+            if np.any(flux <= 0):
+                raise ValueError('log_flux needs positive fluxes')
+            flux = np.log10(flux)
+        self.flux = flux
+
+    @classmethod
+    def from_points(cls, points, wave, flux, **kwargs):
+        """
+        Build the grid from models in any order.
+
+        points: array (n_models, n_axes) of the parameters of every model (log10(N/H) for abundances)
+        wave: array (npts,)
+        flux: array (n_models, npts)
+
+        kwargs:
+        names = ['teff', 'log_g', ...]: list of axis names
+        log_flux = True: bool, interpolate log10 of the flux
+
+        Raises a ValueError if the points do not fill every combination of the axis values exactly once.
+        """
+        points = np.asarray(points, dtype='float64')
+        flux = np.asarray(flux)
+        names = kwargs.get('names',['teff', 'log_g'] + ['axis%i' % i for i in range(2, points.shape[1])])
+        axes = []
+        index = []
+        for j in range(points.shape[1]):
+            axis, inverse = np.unique(points[:,j], return_inverse=True)
+            axes.append(axis)
+            index.append(inverse)
+        shape = tuple(len(axis) for axis in axes)
+        flat = np.ravel_multi_index(index, shape)
+        if len(np.unique(flat)) != len(flat):
+            raise ValueError('Some models appear more than once in the grid')
+        if len(flat) != np.prod(shape):
+            raise ValueError('The models do not fill the grid: %i of %i combinations of %s are missing'
+                             % (np.prod(shape) - len(flat), np.prod(shape), ', '.join('%i %s' % (n, name) for n, name in zip(shape, names))))
+        grid = np.empty(shape + (flux.shape[1],), dtype='float32')
+        grid.reshape(-1, flux.shape[1])[flat] = flux
+        return cls(names, axes, wave, grid, log_flux=kwargs.get('log_flux',True))
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """
+        Build the grid from the spectra in a SpectrumStore.
+
+        store: SpectrumStore or the path of one
+
+        kwargs:
+        indices = None: list of the spectra to use, None for all
+        elements = (): atomic numbers of the abundances that vary in the grid
+        wave = None: array, wavelength grid to resample every spectrum to. Needed if the spectra are on different grids.
+        log_flux = True: bool
+        """
+        if isinstance(store, str):
+            store = SpectrumStore(store)
+        indices = kwargs.get('indices',None)
+        elements = list(kwargs.get('elements',()))
+        wave = kwargs.get('wave',None)
+        if indices is None:
+            indices = np.arange(len(store))
+        indices = np.asarray(indices)
+        meta = store.meta[indices]
+        if wave is None:
+            wave, flux = store.fluxes(indices)
+        else:
+            flux = np.array([np.interp(wave, *store.spectrum(i)) for i in indices])
+        points = [meta['teff'], meta['log_g']] + [np.log10(meta['abns'][:,z-1]) for z in elements]
+        return cls.from_points(np.column_stack(points), wave, flux, names=['teff', 'log_g'] + elements, log_flux=kwargs.get('log_flux',True))
+
+    @classmethod
+    def from_tl(cls, filenames, **kwargs):
+        """
+        Build the grid from spectra written by add_header (.tl files).
+
+        filenames: list of str
+
+        kwargs:
+        elements = (): atomic numbers of the abundances that vary in the grid
+        wave = None: array, wavelength grid to resample to, the grid of the first file if None
+        log_flux = True: bool
+        """
+        elements = list(kwargs.get('elements',()))
+        wave = kwargs.get('wave',None)
+        points = []
+        fluxes = []
+        for filename in filenames:
+            params, w, f = read_tl(filename)
+            if wave is None:
+                wave = w
+            fluxes.append(f if len(w) == len(wave) and np.array_equal(w, wave) else np.interp(wave, w, f))
+            points.append([params.teff, params.log_g] + [np.log10(params.abns[z]) for z in elements])
+        return cls.from_points(points, wave, fluxes, names=['teff', 'log_g'] + elements, log_flux=kwargs.get('log_flux',True))
+
+    def _weights(self, points, extrapolate):
+        """
+        Lower corner and fractional position in the cell of every point along every axis.
+        """
+        lower = np.empty(points.shape, dtype='int64')
+        frac = np.empty(points.shape)
+        for j, axis in enumerate(self.axes):
+            x = points[:,j]
+            if len(axis) == 1:
+                if not extrapolate and np.any(x != axis[0]):
+                    raise ValueError('The grid has only %s = %g' % (self.names[j], axis[0]))
+                lower[:,j] = 0
+                frac[:,j] = 0.
+                continue
+            if not extrapolate and (np.any(x < axis[0]) or np.any(x > axis[-1])):
+                raise ValueError('%s outside the grid [%g, %g]' % (self.names[j], axis[0], axis[-1]))
+            i = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+            lower[:,j] = i
+            frac[:,j] = (x - axis[i]) / (axis[i+1] - axis[i])
+        return lower, frac
+
+    def evaluate(self, points, **kwargs):
+        """
+        Interpolate the spectra of many points at once.
+
+        points: array (n, n_axes) in the order of self.names, abundances as log10(N/H)
+
+        kwargs:
+        extrapolate = False: bool, extrapolate linearly from the edge cells instead of raising a ValueError
+
+        returns the fluxes as an array (n, len(wave))
+        """
+        extrapolate = kwargs.get('extrapolate',False)
+        points = np.atleast_2d(np.asarray(points, dtype='float64'))
+        if points.shape[1] != len(self.axes):
+            raise ValueError('points need %i columns (%s)' % (len(self.axes), ', '.join(str(name) for name in self.names)))
+        lower, frac = self._weights(points, extrapolate)
+        d = len(self.axes)
+        flat = self.flux.reshape(-1, len(self.wave))
+        shape = self.flux.shape[:-1]
+        result = np.zeros((len(points), len(self.wave)))
+        for corner in range(2**d):
+            offset = np.array([(corner >> j) & 1 for j in range(d)])
+            weight = np.prod(np.where(offset, frac, 1 - frac), axis=1)
+            idx = np.minimum(lower + offset, np.array(shape) - 1)
+            rows = np.ravel_multi_index(idx.T, shape)
+            result += weight[:,None] * flat[rows]
+        if self.log_flux:
+            result = 10**result
+        return result
+
+    def __call__(self, teff, log_g, abns=None, **kwargs):
+        """
+        Interpolated spectrum of one model.
+
+        teff, log_g: float
+        abns = None: dict {atomic number: N/H in number space} with a value for every abundance axis
+
+        returns the flux on self.wave
+        """
+        point = [teff, log_g] + [np.log10(abns[z]) for z in self.names[2:]]
+        return self.evaluate([point], **kwargs)[0]
+
+    def error_report(self, exact, **kwargs):
+        """
+        Compare interpolated spectra with exactly computed models that were not used to build the grid.
+
+        exact: SpectrumStore (or its path) with the held-out models, or a list of .tl files
+
+        kwargs:
+        indices = None: spectra of the store to compare, None for all
+        extrapolate = False: bool, see evaluate
+
+        returns a pandas DataFrame with one row per model: name, the parameters, and the largest and rms
+        relative difference |interpolated - exact| / exact
+        """
+        import pandas as pd
+        extrapolate = kwargs.get('extrapolate',False)
+        models = []
+        if isinstance(exact, (str, SpectrumStore)):
+            store = SpectrumStore(exact) if isinstance(exact, str) else exact
+            indices = kwargs.get('indices',None)
+            if indices is None:
+                indices = range(len(store))
+            for i in indices:
+                models.append((store.params(i),) + store.spectrum(i))
+        else:
+            models = [read_tl(filename) for filename in exact]
+
+        points = [[params.teff, params.log_g] + [np.log10(params.abns[z]) for z in self.names[2:]] for params, w, f in models]
+        interpolated = self.evaluate(points, extrapolate=extrapolate)
+        rows = []
+        for (params, wave, flux), approx in zip(models, interpolated):
+            flux = np.interp(self.wave, wave, flux)
+            rel = np.abs(approx - flux) / np.abs(flux)
+            row = {'name': params.name, 'teff': params.teff, 'log_g': params.log_g}
+            for z in self.names[2:]:
+                row[z] = np.log10(params.abns[z])
+            row['max_error'] = float(rel.max())
+            row['rms_error'] = float(np.sqrt(np.mean(rel**2)))
+            rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,374 @@
+"""
+Resumable queue of models kept in an SQLite database.
+
+Every model of a grid is a row with its state:
+    pending    not run yet
+    running    claimed by a worker
+    retrying   an attempt failed or did not converge, it will be run again
+    converged  done, Tlusty converged and the spectrum (if any) was made
+    failed     gave up after max_attempts
+Workers in several processes, or on several machines sharing the database file, claim jobs in a
+BEGIN IMMEDIATE transaction, so no model is run twice at once. A worker that dies leaves its job running
+with an old heartbeat and the job is handed out again. Restarting a queue only runs what is not done.
+
+Failed or unconverged Tlusty runs are retried automatically: first from the atmosphere of the previous attempt
+(files.move() and ltgray=False) if it did not diverge, then from a gray start with more iterations.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from . import config
+from .files import Parameters
+from .files import move
+from .grid import run_model
+from .pconv import iteration_max
+from .atmosphere import read_fort7
+
+
+STATES = ('pending', 'running', 'retrying', 'converged', 'failed')
+
+_schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    params TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    retry TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    heartbeat REAL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+
+def _params_to_json(params):
+    return json.dumps({'name': params.name, 'teff': int(params.teff), 'log_g': float(params.log_g),
+                       'abns': {str(elem): float(abn) for elem, abn in params.abns.items()}})
+
+
+def _params_from_json(s):
+    d = json.loads(s)
+    return Parameters(d['name'], d['teff'], d['log_g'], {int(elem): abn for elem, abn in d['abns'].items()})
+
+
+class JobQueue:
+    """
+    A queue of models in an SQLite file. Open the same file from any number of processes.
+    """
+    def __init__(self, path, **kwargs):
+        """
+        path: str, the database file. It is created if needed.
+
+        kwargs:
+        timeout = 60: float, seconds to wait for another process that holds the lock
+        """
+        self.path = os.path.abspath(path)
+        self.timeout = kwargs.get('timeout',60)
+        self._db = self._connect()
+        self._db.executescript(_schema)
+
+    def _connect(self):
+        # journal_mode stays the default DELETE: WAL needs shared memory, which network filesystems do not have
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Take the write lock right away (BEGIN IMMEDIATE), so read-then-update is atomic between processes.
+        """
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def close(self):
+        self._db.close()
+
+    def add(self, params_list, **kwargs):
+        """
+        Queue models. Models whose name is already in the queue are skipped, so adding the same grid
+        again after a restart only adds what is new.
+
+        params_list: list of Parameters objects (or a ParameterGrid)
+
+        kwargs:
+        max_attempts = 3: int, give up on a model after this many attempts
+        all other kwargs are stored with the jobs and passed to run_model (they have to be JSON serializable)
+
+        returns the number of models added
+        """
+        max_attempts = kwargs.pop('max_attempts',3)
+        run_kwargs = json.dumps(kwargs, sort_keys=True)
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany('INSERT OR IGNORE INTO jobs (name, params, kwargs, max_attempts) VALUES (?, ?, ?, ?)',
+                           [(params.name, _params_to_json(params), run_kwargs, max_attempts) for params in params_list])
+            added = db.total_changes - before
+        print('Added %i models to %s' % (added, self.path))
+        return added
+
+    def claim(self, **kwargs):
+        """
+        Atomically take the next job that is pending or waiting for a retry. Running jobs whose worker
+        stopped sending heartbeats are put back first.
+
+        kwargs:
+        worker = host:pid: str, name of the worker, stored with the job
+        stale = 600: float, seconds without a heartbeat after which a running job is taken to be dead
+
+        returns a dict with the keys id, params (Parameters object), kwargs (for run_model) and attempt, or None if there is nothing to do
+        """
+        worker = kwargs.get('worker','%s:%i' % (socket.gethostname(), os.getpid()))
+        stale = kwargs.get('stale',600)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN 'retrying' ELSE 'failed' END, "
+                       "error = 'worker ' || worker || ' stopped responding' WHERE state = 'running' AND heartbeat < ?", (now - stale,))
+            row = db.execute("SELECT id, params, kwargs, retry, attempts FROM jobs WHERE state IN ('pending', 'retrying') ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            job_id, params, run_kwargs, retry, attempts = row
+            db.execute("UPDATE jobs SET state = 'running', attempts = ?, worker = ?, heartbeat = ?, started = ? WHERE id = ?",
+                       (attempts + 1, worker, now, now, job_id))
+        run_kwargs = json.loads(run_kwargs)
+        for key, value in json.loads(retry).items():
+            if isinstance(value, dict):
+                run_kwargs[key] = dict(run_kwargs.get(key,{}), **value)
+            else:
+                run_kwargs[key] = value
+        return {'id': job_id, 'params': _params_from_json(params), 'kwargs': run_kwargs, 'attempt': attempts + 1}
+
+    def heartbeat(self, job_id):
+        """
+        Tell the queue the worker of a job is still alive.
+        """
+        self._db.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time(), job_id))
+
+    def finish(self, job, result, **kwargs):
+        """
+        Record the outcome of a claimed job and decide what happens next.
+
+        job: dict returned by claim
+        result: dict returned by run_model
+
+        kwargs:
+        tol = config.conv_tol: float, convergence tolerance of the largest relative change in the last Tlusty iteration
+
+        returns the new state of the job
+        """
+        tol = kwargs.get('tol',config.conv_tol)
+        ok = result['status'] == 'ok'
+        converged = ok and _converged(result, tol)
+        retry = {}
+        if converged:
+            state = 'converged'
+            error = None
+        else:
+            error = result['error'] if not ok else 'Tlusty did not converge'
+            state = 'retrying' if job['attempt'] < self._max_attempts(job['id']) else 'failed'
+            if state == 'retrying':
+                retry = _retry_kwargs(job, result)
+        result = {key: value for key, value in result.items() if key != 'traceback'}
+        with self._transaction() as db:
+            db.execute('UPDATE jobs SET state = ?, finished = ?, error = ?, result = ?, retry = ? WHERE id = ?',
+                       (state, time.time(), error, json.dumps(result, default=str), json.dumps(retry), job['id']))
+        return state
+
+    def _max_attempts(self, job_id):
+        return self._db.execute('SELECT max_attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+
+    def counts(self):
+        """
+        returns a dict {state: number of jobs}
+        """
+        counts = dict.fromkeys(STATES, 0)
+        for state, n in self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'):
+            counts[state] = n
+        return counts
+
+    def jobs(self, state=None):
+        """
+        returns a list of dicts with the name, state, attempts, worker, error and result of every job (in one state if given)
+        """
+        query = 'SELECT name, state, attempts, worker, error, result FROM jobs'
+        args = ()
+        if state is not None:
+            query += ' WHERE state = ?'
+            args = (state,)
+        rows = []
+        for name, state, attempts, worker, error, result in self._db.execute(query + ' ORDER BY id', args):
+            rows.append({'name': name, 'state': state, 'attempts': attempts, 'worker': worker, 'error': error,
+                         'result': None if result is None else json.loads(result)})
+        return rows
+
+    def reset(self, states=('failed',)):
+        """
+        Put jobs back to pending with no attempts, e.g. failed ones after fixing the problem.
+        returns the number of jobs reset
+        """
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET state = 'pending', attempts = 0, retry = '{}', error = NULL WHERE state IN (%s)"
+                                % ','.join('?' * len(states)), tuple(states))
+        return cursor.rowcount
+
+    def done(self):
+        """
+        True if no job is pending, running or waiting for a retry.
+        """
+        counts = self.counts()
+        return counts['pending'] + counts['running'] + counts['retrying'] == 0
+
+    def work(self, root, **kwargs):
+        """
+        Claim and run jobs until the queue is empty. Model <name> is run in root/<name>.
+        Call this from as many processes or machines as you like.
+
+        root: str
+
+        kwargs:
+        max_jobs = None: int, stop after this many jobs
+        heartbeat = 60: float, seconds between heartbeats of the running job
+        stale, worker: see claim
+        tol: see finish
+
+        returns the number of jobs run
+        """
+        max_jobs = kwargs.get('max_jobs',None)
+        interval = kwargs.get('heartbeat',60)
+        claim_kwargs = {key: kwargs[key] for key in ('worker', 'stale') if key in kwargs}
+        finish_kwargs = {key: kwargs[key] for key in ('tol',) if key in kwargs}
+        root = os.path.abspath(root)
+
+        n = 0
+        while max_jobs is None or n < max_jobs:
+            job = self.claim(**claim_kwargs)
+            if job is None:
+                break
+            params = job['params']
+            print('Running %s (attempt %i)' % (params.name, job['attempt']))
+            stop = threading.Event()
+            beat = threading.Thread(target=self._beat, args=(job['id'], interval, stop), daemon=True)
+            beat.start()
+            try:
+                result = run_model(params, os.path.join(root, params.name), **job['kwargs'])
+            finally:
+                stop.set()
+                beat.join()
+            state = self.finish(job, result, **finish_kwargs)
+            print('%s: %s' % (params.name, state))
+            n += 1
+        return n
+
+    def _beat(self, job_id, interval, stop):
+        db = self._connect() # sqlite connections can not be shared between threads
+        try:
+            while not stop.wait(interval):
+                db.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (time.time(), job_id))
+        finally:
+            db.close()
+
+
+def _converged(result, tol):
+    """
+    Whether the Tlusty run of a successful result converged, from the fort.9 in its directory.
+    Cache hits are checked the same way, the cache restores the fort.9 of the atmosphere along with it.
+    """
+    try:
+        iters, temp, maximum = iteration_max(os.path.join(result['dir'], 'fort.9'))
+    except (OSError, ValueError):
+        return False
+    return len(maximum) > 0 and bool(maximum[-1] < tol)
+
+
+def _retry_kwargs(job, result):
+    """
+    run_model kwargs for the next attempt of a job.
+    A Tlusty problem is retried once from the atmosphere of the last attempt if there is a usable one that did not
+    diverge, otherwise from a gray start with twice the iterations per attempt. Anything else is just run again.
+    """
+    params = job['params']
+    if result['status'] == 'ok' or result['stage'] == 'tlusty':
+        diverged = result.get('monitor',{}).get('reason') == 'diverged'
+        warm = job['kwargs'].get('fort5',{}).get('ltgray',True) is False
+        if not diverged and not warm and _keep_atmosphere(result['dir']):
+            print('Retrying %s from the atmosphere of attempt %i' % (params.name, job['attempt']))
+            return {'fort5': {'ltgray': False}}
+        if params.teff > 15000:
+            key, base = 'nITER', config.aux_no_convec['nITER']
+        else:
+            key, base = 'ITEK', config.aux_convec['ITEK']
+        iterations = base * 2**job['attempt']
+        print('Retrying %s from a gray start with %s=%i' % (params.name, key, iterations))
+        return {'fort5': {'ltgray': True}, 'aux_params': {key: iterations}}
+    return {}
+
+
+def _keep_atmosphere(dirname):
+    """
+    Leave the atmosphere of the last attempt in fort.8 as the starting model of the next one.
+    If Tlusty was the last program that ran it is still in fort.7 and is moved, otherwise run_model
+    already moved it before Synspec wrote the spectrum to fort.7.
+    returns True if there is an atmosphere that can be read
+    """
+    original_cwd = os.getcwd()
+    try:
+        os.chdir(dirname)
+        try:
+            read_fort7('fort.7')
+            move()
+        except (OSError, ValueError):
+            pass
+        read_fort7('fort.8')
+        return True
+    except (OSError, ValueError):
+        return False
+    finally:
+        os.chdir(original_cwd)
+
+
+def _work(path, root, kwargs):
+    queue = JobQueue(path)
+    try:
+        return queue.work(root, **kwargs)
+    finally:
+        queue.close()
+
+
+def run_queue(path, root, **kwargs):
+    """
+    Run the jobs of a queue with a pool of worker processes on this machine until it is empty.
+
+    path: str, the database file
+    root: str, directory that holds one subdirectory per model
+
+    kwargs:
+    processes = os.cpu_count(): int, number of workers
+    all other kwargs are passed to JobQueue.work
+
+    returns the counts of the queue at the end
+    """
+    processes = kwargs.pop('processes',os.cpu_count())
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_work, path, root, kwargs) for i in range(processes)]
+        n = sum(future.result() for future in futures)
+    queue = JobQueue(path)
+    counts = queue.counts()
+    queue.close()
+    print('Ran %i jobs: %s' % (n, ', '.join('%i %s' % (counts[state], state) for state in STATES)))
+    return counts
@@ -0,0 +1,130 @@
+"""
+Sorted wavelength index over Synspec linelists, so that a fort.19 with only the lines a run needs can be
+written instead of copying the whole list into every run directory.
+
+The index holds the wavelength and the byte range of every line and is saved next to the linelist
+(or in config.linelist_index_dir), so it is only built once per linelist.
+"""
+import os
+import numpy as np
+
+from . import config
+
+
+def _index_path(path):
+    dirname = config.linelist_index_dir
+    if dirname is None:
+        dirname = os.path.dirname(path)
+    return os.path.join(dirname, os.path.basename(path) + '.idx.npz')
+
+
+def build_index(path):
+    """
+    Scan a linelist and index it.
+    Lines whose first word is not a number are not indexed: at the top of the file they are kept as a header,
+    elsewhere they stay attached to the line before them.
+
+    path: str, full path of the linelist
+
+    returns a dict with the arrays wave, start and end (byte range of each line), whether wave is sorted,
+    the header size and the size and mtime of the linelist it was built from
+    """
+    waves = []
+    starts = []
+    offset = 0
+    with open(path,'rb') as file:
+        for line in file:
+            words = line.split(None, 1)
+            if words:
+                try:
+                    waves.append(float(words[0].replace(b'D', b'E')))
+                    starts.append(offset)
+                except ValueError:
+                    pass
+            offset += len(line)
+    stat = os.stat(path)
+    start = np.array(starts, dtype='int64')
+    wave = np.array(waves, dtype='float64')
+    return {
+        'wave': wave,
+        'sorted': bool(np.all(wave[1:] >= wave[:-1])),
+        'start': start,
+        'end': np.append(start[1:], offset).astype('int64'),
+        'header': start[0] if len(start) else offset,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        }
+
+
+def load_index(path):
+    """
+    Get the index of a linelist, building and saving it if there is none or the linelist changed.
+
+    path: str, full path of the linelist
+    """
+    stat = os.stat(path)
+    idx_path = _index_path(path)
+    try:
+        with np.load(idx_path) as data:
+            index = {name: data[name] for name in data.files}
+        if int(index['size']) == stat.st_size and int(index['mtime']) == stat.st_mtime_ns:
+            return index
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    print('Indexing linelist %s' % path)
+    index = build_index(path)
+    try:
+        tmp = idx_path + '.%i.tmp.npz' % os.getpid()
+        np.savez(tmp, **index)
+        os.replace(tmp, idx_path)
+    except OSError as e:
+        print('Could not save the linelist index (%s), set config.linelist_index_dir to a writable directory' % e)
+    return index
+
+
+def window(w1, w2, cutof0=3):
+    """
+    Wavelength range of the linelist a Synspec run between w1 and w2 can see, in the units of the linelist.
+    w2 < 0 only means vacuum wavelengths to Synspec, so absolute values are used.
+    """
+    lo = min(abs(w1), abs(w2)) - cutof0
+    hi = max(abs(w1), abs(w2)) + cutof0
+    return lo / config.linelist_wave_unit, hi / config.linelist_wave_unit
+
+
+def write_window(path, w1, w2, **kwargs):
+    """
+    Write the lines of a linelist that lie within [w1 - cutof0, w2 + cutof0].
+
+    path: str, full path of the linelist
+    w1, w2: wavelength range of the spectrum in angstroms, as in write_fort55
+
+    kwargs:
+    cutof0 = 3: float, line cutoff in angstroms, as in write_fort55
+    dest = 'fort.19': str, file to write
+
+    returns the number of lines written
+    """
+    cutof0 = kwargs.get('cutof0',3)
+    dest = kwargs.get('dest','fort.19')
+
+    index = load_index(path)
+    wave = index['wave']
+    lo, hi = window(w1, w2, cutof0)
+    if index['sorted']:
+        i = np.searchsorted(wave, lo, side='left')
+        j = np.searchsorted(wave, hi, side='right')
+        blocks = [(index['start'][i], index['end'][j-1])] if j > i else []
+    else: # Synspec wants sorted lines, so write the selected ones in order
+        order = np.argsort(wave, kind='stable')
+        i = np.searchsorted(wave[order], lo, side='left')
+        j = np.searchsorted(wave[order], hi, side='right')
+        blocks = [(index['start'][k], index['end'][k]) for k in order[i:j]]
+
+    with open(path,'rb') as infile, open(dest,'wb') as outfile:
+        outfile.write(infile.read(int(index['header'])))
+        for start, end in blocks:
+            infile.seek(start)
+            outfile.write(infile.read(end - start))
+    return j - i
+
@@ -0,0 +1,213 @@
+"""
+One structured metrics record per run.
+
+The numbers that tell how expensive a model was are spread over several files (fort.69 has the CPU time,
+fort.6 the flux conservation, fort.9 the iterations). RunMetrics times the stages of run_model, keeps the
+usage of every Tlusty and Synspec process and reads those files right after Tlusty, so every run ends up
+with a single dict that can be appended to a JSON-lines file and exported for Prometheus.
+"""
+import os
+import json
+import time
+import fcntl
+import socket
+import resource
+from contextlib import contextmanager
+
+from .pconv import iteration_max
+from .pconv import load_fort6
+from .pconv import load_fort69
+
+
+class RunMetrics:
+    """
+    Collects the metrics of one model. Wrap each stage in `with metrics.stage(name):`, pass the finished
+    execute.Job of every program to job() and call tlusty_outputs() in the model directory after Tlusty.
+    """
+    def __init__(self, params):
+        """
+        params: Parameters object of the model
+        """
+        self.params = params
+        self.stages = {}
+        self.programs = {}
+        self.iterations = None
+        self.max_change = None
+        self.flux_deviation = None
+        self.tlusty_time = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Add the wall time and the CPU time (of this process and of the programs it waited for) of the block to stage name.
+        """
+        wall = time.perf_counter()
+        cpu = _cpu_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'wall': 0., 'cpu': 0.})
+            stage['wall'] += time.perf_counter() - wall
+            stage['cpu'] += _cpu_time() - cpu
+
+    def job(self, program, job):
+        """
+        Add the usage of a finished execute.Job. Times of repeated runs (e.g. a warm start that fell back
+        to a gray start) are summed, max_rss is the largest of them.
+
+        program: str, 'tlusty' or 'synspec'
+        job: execute.Job
+        """
+        usage = self.programs.setdefault(program, {'runs': 0, 'wall_time': 0., 'user_time': 0., 'system_time': 0., 'max_rss': 0, 'returncode': None})
+        usage['runs'] += 1
+        for key in ('wall_time', 'user_time', 'system_time'):
+            usage[key] += getattr(job, key) or 0.
+        usage['max_rss'] = max(usage['max_rss'], job.max_rss or 0)
+        usage['returncode'] = job.returncode
+
+    def tlusty_outputs(self):
+        """
+        Read the iterations, the final largest relative change, the flux deviation and the Tlusty timing
+        from fort.9, fort.6 and fort.69 in the pwd. Has to be called before Synspec overwrites fort.6.
+        Missing or unreadable files leave the values at None.
+        """
+        try:
+            iters, temp, maximum = iteration_max()
+            if len(iters):
+                self.iterations = int(iters[-1])
+                self.max_change = float(maximum[-1])
+        except (OSError, ValueError, IndexError):
+            pass
+        try:
+            self.flux_deviation = float(load_fort6())
+        except Exception: # fort.6 of a failed run can be cut anywhere
+            pass
+        try:
+            self.tlusty_time = float(load_fort69())
+        except (OSError, ValueError, IndexError):
+            pass
+
+    def record(self, result=None):
+        """
+        returns the metrics as a dict that can be written as JSON
+
+        result = None: dict, result of run_model. Its name, status, stage, error, cached and warm_start are included.
+        """
+        record = {
+            'name': self.params.name,
+            'teff': int(self.params.teff),
+            'log_g': float(self.params.log_g),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': socket.gethostname(),
+            'stages': self.stages,
+            'programs': self.programs,
+            'iterations': self.iterations,
+            'max_change': self.max_change,
+            'flux_deviation': self.flux_deviation,
+            'tlusty_time': self.tlusty_time,
+            'max_rss': max([usage['max_rss'] for usage in self.programs.values()], default=None),
+            }
+        if result is not None:
+            for key in ('status', 'stage', 'error', 'cached', 'warm_start'):
+                record[key] = result.get(key)
+        return record
+
+
+def _cpu_time():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def append_jsonl(record, filename):
+    """
+    Append one record as a line of JSON. Safe to call from many processes at once.
+    """
+    line = json.dumps(record, sort_keys=True) + '\n'
+    with open(filename,'a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.write(line)
+
+
+def load_jsonl(filename):
+    """
+    Read all the records of a JSON-lines file. A half written last line is skipped.
+    """
+    records = []
+    with open(filename,'r') as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def to_frame(records):
+    """
+    Flatten metrics records (or the name of a JSON-lines file) into a DataFrame with one row per run,
+    e.g. to find the regions of a grid that are expensive.
+    Stage and program columns are named like tlusty_wall, synspec_max_rss.
+    """
+    import pandas as pd
+    if isinstance(records, str):
+        records = load_jsonl(records)
+    rows = []
+    for record in records:
+        row = {key: value for key, value in record.items() if not isinstance(value, dict)}
+        for stage, times in record.get('stages',{}).items():
+            for key, value in times.items():
+                row['%s_%s' % (stage, key)] = value
+        for program, usage in record.get('programs',{}).items():
+            for key, value in usage.items():
+                row['%s_%s' % (program, key)] = value
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+_prometheus_metrics = [
+    # name, help, function of a record that returns a list of (extra labels, value)
+    ('dazspec_run_stage_wall_seconds', 'Wall time of a stage of a DAZspec run',
+     lambda r: [({'stage': stage}, t['wall']) for stage, t in r.get('stages',{}).items()]),
+    ('dazspec_run_stage_cpu_seconds', 'CPU time of a stage of a DAZspec run, including the programs it ran',
+     lambda r: [({'stage': stage}, t['cpu']) for stage, t in r.get('stages',{}).items()]),
+    ('dazspec_run_program_max_rss_bytes', 'Peak resident memory of Tlusty or Synspec',
+     lambda r: [({'program': program}, u['max_rss'] * 1024) for program, u in r.get('programs',{}).items()]),
+    ('dazspec_run_iterations', 'Tlusty iterations',
+     lambda r: [({}, r.get('iterations'))]),
+    ('dazspec_run_max_change', 'Largest relative change of the state vector in the last Tlusty iteration',
+     lambda r: [({}, r.get('max_change'))]),
+    ('dazspec_run_flux_deviation_percent', 'Largest deviation from flux conservation in percent',
+     lambda r: [({}, r.get('flux_deviation'))]),
+    ('dazspec_run_failed', '1 if the run failed',
+     lambda r: [({}, int(r.get('status') not in (None, 'ok')))]),
+    ]
+
+
+def _labels(labels):
+    return ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels.items())
+
+
+def write_prometheus(records, filename):
+    """
+    Write metrics records in the Prometheus text format, for the textfile collector of the node exporter.
+    The file is replaced atomically, so the exporter never reads half of it.
+
+    records: list of dicts from RunMetrics.record, or the name of a JSON-lines file
+    filename: str, should end in .prom
+    """
+    if isinstance(records, str):
+        records = load_jsonl(records)
+    lines = []
+    for name, text, values in _prometheus_metrics:
+        lines.append('# HELP %s %s' % (name, text))
+        lines.append('# TYPE %s gauge' % name)
+        for record in records:
+            model = {'model': record['name'], 'teff': record['teff'], 'log_g': record['log_g']}
+            for labels, value in values(record):
+                if value is not None:
+                    lines.append('%s{%s} %r' % (name, _labels(dict(model, **labels)), float(value)))
+    tmp = '%s.%i.tmp' % (filename, os.getpid())
+    with open(tmp,'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    os.replace(tmp, filename)
@@ -0,0 +1,166 @@
+"""
+Watch the convergence log (fort.9) of a running Tlusty and stop it early.
+
+A diverging or stagnating model is killed as soon as it is obvious instead of after all nITER/ITEK iterations.
+Converging models are left alone: Tlusty stops by itself once it is converged, and killing it could leave
+fort.7 unwritten or half written. Tlusty has to write fort.9 as it goes for this
+to help, so run_tlusty() turns off the output buffering of gfortran builds with GFORTRAN_UNBUFFERED_ALL.
+"""
+import os
+import time
+import numpy as np
+
+from . import config
+from .files import get_path
+from .execute import submit
+
+
+class ConvergenceMonitor:
+    """
+    Incremental reader of fort.9 that keeps the largest absolute relative change of TEMP and MAXIMUM
+    for every completed iteration and decides whether the run should be stopped.
+    """
+    def __init__(self, **kwargs):
+        """
+        kwargs:
+        filename = 'fort.9': str, convergence log to follow
+        diverge = 10.0: float, stop if the largest relative change of the state vector goes above this
+        grow = 4: int, stop if the largest relative change grew for this many iterations in a row
+        stagnate = 10: int, stop if the largest relative change did not shrink by stagnate_factor in this many iterations
+        stagnate_factor = 0.5: float, see stagnate
+        min_iter = 3: int, never stop before this many iterations
+        """
+        self.filename = kwargs.get('filename','fort.9')
+        self.diverge = kwargs.get('diverge',10.)
+        self.grow = kwargs.get('grow',4)
+        self.stagnate = kwargs.get('stagnate',10)
+        self.stagnate_factor = kwargs.get('stagnate_factor',0.5)
+        self.min_iter = kwargs.get('min_iter',3)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything that was read so far.
+        """
+        self.iters = []
+        self.temp = []
+        self.maximum = []
+        self.reason = None
+        self.returncode = None
+        self._offset = 0
+        self._columns = None
+        self._rows = [] # rows of the iteration that is still being written
+
+    def update(self, **kwargs):
+        """
+        Read whatever was appended to fort.9 since the last call.
+
+        kwargs:
+        final = False: bool, the run is over, so the last iteration is complete as well
+
+        returns the number of newly completed iterations
+        """
+        final = kwargs.get('final',False)
+        n = len(self.iters)
+        try:
+            with open(self.filename, 'rb') as file:
+                file.seek(0, os.SEEK_END)
+                if file.tell() < self._offset: # a new run started writing the file
+                    self.reset()
+                file.seek(self._offset)
+                data = file.read()
+        except FileNotFoundError:
+            data = b''
+        end = data.rfind(b'\n') + 1 # only use complete lines
+        self._offset += end
+        for line in data[:end].decode(errors='replace').splitlines():
+            self._add_line(line)
+        if final and self._rows:
+            self._finish_iteration()
+        return len(self.iters) - n
+
+    def _add_line(self, line):
+        words = line.split()
+        if len(words) == 0:
+            return
+        if self._columns is None:
+            if 'ITER' in words and 'MAXIMUM' in words:
+                self._columns = (words.index('ITER'), words.index('TEMP'), words.index('MAXIMUM'))
+            return
+        try:
+            row = [float(words[i].replace('D','e')) for i in self._columns]
+        except (ValueError, IndexError):
+            return
+        if self._rows and row[0] != self._rows[-1][0]:
+            self._finish_iteration()
+        self._rows.append(row)
+
+    def _finish_iteration(self):
+        rows = np.abs(np.array(self._rows))
+        self.iters.append(int(rows[0,0]))
+        self.temp.append(float(rows[:,1].max()))
+        self.maximum.append(float(rows[:,2].max()))
+        self._rows = []
+
+    def check(self):
+        """
+        Decide whether the run should be stopped.
+        returns None to keep going or the reason to stop: 'diverged' or 'stagnated'
+        """
+        n = len(self.maximum)
+        if n < self.min_iter:
+            return None
+        change = np.array(self.maximum)
+        if not np.isfinite(change[-1]) or change[-1] > self.diverge:
+            return 'diverged'
+        if n > self.grow and np.all(np.diff(change[-self.grow-1:]) > 0):
+            return 'diverged'
+        if n > self.stagnate and change[-self.stagnate:].min() > self.stagnate_factor * change[-self.stagnate-1]:
+            return 'stagnated'
+        return None
+
+    def summary(self):
+        """
+        returns a dict with the stop reason, the exit status, the number of iterations and the final largest relative changes
+        """
+        return {
+            'reason': self.reason,
+            'returncode': self.returncode,
+            'iterations': len(self.iters),
+            'temp': self.temp[-1] if self.temp else None,
+            'maximum': self.maximum[-1] if self.maximum else None,
+            }
+
+
+def run_tlusty(**kwargs):
+    """
+    Run tlusty in the pwd like tluspy.tlusty() while following fort.9, and kill it early if the
+    ConvergenceMonitor says so. The reason the run ended is stored in monitor.reason:
+    'diverged', 'stagnated', 'finished' (exited by itself, converged or out of iterations) or 'failed' (bad exit status).
+
+    kwargs:
+    interval = 1.0: float, seconds between looks at fort.9
+    all other kwargs are passed to ConvergenceMonitor
+
+    returns the ConvergenceMonitor
+    """
+    interval = kwargs.pop('interval',1.)
+    monitor = ConvergenceMonitor(**kwargs)
+    if os.path.exists(monitor.filename):
+        os.remove(monitor.filename) # don't read the log of the last run
+
+    job = submit([get_path(config.tlpath)], timeout=config.tl_timeout, env={'GFORTRAN_UNBUFFERED_ALL': 'y'})
+    while not job.done():
+        time.sleep(interval)
+        if monitor.update():
+            monitor.reason = monitor.check()
+            if monitor.reason is not None:
+                print('Stopping tlusty after %i iterations: %s' % (len(monitor.iters), monitor.reason))
+                job.cancel()
+                break
+    monitor.returncode = job.wait()
+    monitor.job = job
+    if monitor.reason is None:
+        monitor.update(final=True)
+        monitor.reason = 'finished' if monitor.returncode == 0 else 'failed'
+    return monitor
@@ -1,51 +1,90 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import os
+import mmap
 import numpy as np
-import colorama
-from colorama import Fore
-from colorama import Style
+from . import config
+from .atmosphere import read_fort7
+from .atmosphere import _fortran_exp
 
-colorama.init()
+# pandas, matplotlib and colorama are slow to import, so they are only imported by the functions that need them.
 
 
 #load filedata
 
 def load_fort7():
     """
-    Parse the fort.7 file in the pwd and get an array of the depth points. This is the first block in the fort.7 file. Editing this code can allow one to get out the second block, named b2.
+    Parse the fort.7 file in the pwd and get an array of the depth points. This is the first block in the fort.7 file.
+    Use atmosphere.read_fort7() to get the second block, the state at each depth, as well.
     """
-    b1 = []
-    b2 = []
-    i = 0
-    temp = []
-    with open('fort.7','r') as file:
-        file.readline()
-        for line in file:
-            line = line.replace('D','e')
-            if line[1].isspace(): #block 2
-                i += 1
-                temp += line.split()
-                if i == 3:
-                    b2.append(temp)
-                    temp = []
-                    i = 0
-            else: # block 1
-                b1 += line.split()
-                i=0
-    mass = np.flip(np.array(b1,dtype='float32'))
+    dm, state, numpar = read_fort7('fort.7')
+    mass = np.flip(dm.astype('float32'))
     return mass
 
 
+def read_fort9(filename='fort.9'):
+    """
+    Parse a fort.9 convergence log in one pass. The D exponents are translated at the byte level and the
+    numbers are converted by numpy in C, which is much faster than a regex read for big NLTE runs.
+    returns (columns, data) where columns is a list of the column names and data is a float64 array with one row per line
+    """
+    with open(filename,'rb') as file:
+        file.readline() # title
+        columns = file.readline().decode().split()
+        data = file.read().translate(_fortran_exp)
+    if len(columns) == 0:
+        return columns, np.zeros((0, 0))
+    values = np.fromstring(data, dtype='float64', sep=' ')
+    n = len(values) // len(columns) # drop a half written last line
+    return columns, values[:n*len(columns)].reshape(n, len(columns))
+
 def load_fort9():
     """
     Parse the fort.9 file in the pwd and return the data stored as a Pandas DataFrame.
     """
-    df = pd.read_csv('fort.9',skiprows=1,delimiter='[ ]+',engine='python')
-    df = df.replace('D','e', regex=True)
-    for col in df.columns:
-        df[col] = np.array(df[col],dtype = 'float32')
+    import pandas as pd
+    columns, data = read_fort9()
+    df = pd.DataFrame(data.astype('float32'), columns=columns)
     return df
 
+def iteration_max(filename='fort.9'):
+    """
+    Get the largest absolute relative change of the temperature and of the state vector in each iteration of a fort.9.
+    returns (iters, temp, maximum) as arrays with one entry per iteration
+    """
+    columns, data = read_fort9(filename)
+    it = data[:,columns.index('ITER')]
+    if len(it) == 0:
+        return it, it, it
+    starts = np.flatnonzero(np.r_[True, it[1:] != it[:-1]]) # first row of every iteration
+    temp = np.maximum.reduceat(np.abs(data[:,columns.index('TEMP')]), starts)
+    maximum = np.maximum.reduceat(np.abs(data[:,columns.index('MAXIMUM')]), starts)
+    return it[starts], temp, maximum
+
+def max_change():
+    """
+    Get the largest absolute relative change of the temperature and of the state vector in each iteration from the fort.9 in the pwd.
+    returns a DataFrame indexed by ITER with the columns TEMP and MAXIMUM
+    """
+    import pandas as pd
+    iters, temp, maximum = iteration_max()
+    return pd.DataFrame({'TEMP': temp, 'MAXIMUM': maximum}, index=pd.Index(iters, name='ITER'))
+
+def converged(**kwargs):
+    """
+    Check the fort.9 in the pwd to see if the model converged, that is if the largest relative change of the state vector in the last iteration is below tol.
+    returns False if there is no fort.9
+    
+    kwargs:
+    tol = config.conv_tol: float, convergence tolerance
+    """
+    tol = kwargs.get('tol',config.conv_tol)
+    try:
+        iters, temp, maximum = iteration_max()
+    except (FileNotFoundError, ValueError):
+        return False
+    if len(maximum) == 0:
+        return False
+    return bool(maximum[-1] < tol)
+
 def load_fort69():
     """
     Parse fort.69 from pwd to get timing info.
@@ -59,6 +98,57 @@ def load_fort69():
     return t
 
 
+def read_fort6(filename='fort.6'):
+    """
+    Read the FINAL MODEL ATMOSPHERE table of a Tlusty standard output without reading the rest of it.
+    The file is memory mapped and searched from the end for the last table, so a fort.6 of hundreds of MB
+    costs about as much as a small one. The table ends at the first line that is not a row of numbers.
+    returns a dict {column name: array}, ID is an int array and the other columns are float64
+    
+    Updated to work for tlusty208
+    """
+    with open(filename,'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise ValueError('%s is empty' % filename)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = data.rfind(b'FINAL MODEL ATMOSPHERE')
+            if start < 0:
+                raise ValueError('%s has no FINAL MODEL ATMOSPHERE table' % filename)
+            data.seek(start)
+            data.readline()
+            columns = None
+            rows = []
+            for line in iter(data.readline, b''):
+                words = line.split()
+                if columns is None:
+                    if b'ID' in words:
+                        columns = [word.decode() for word in words]
+                    continue
+                if not words:
+                    if rows:
+                        break
+                    continue
+                if len(words) != len(columns):
+                    break
+                try:
+                    rows.append([float(word) for word in line.translate(_fortran_exp).split()])
+                except ValueError:
+                    break
+    if columns is None:
+        raise ValueError('%s has no header line after FINAL MODEL ATMOSPHERE' % filename)
+    values = np.array(rows, dtype='float64').reshape(-1, len(columns))
+    table = {name: values[:,i] for i, name in enumerate(columns)}
+    if 'ID' in table:
+        table['ID'] = table['ID'].astype(int)
+    return table
+
+def flux_deviation(table):
+    """
+    Largest deviation from flux conservation in percent, from the (RAD+CON)/TOT column of read_fort6.
+    """
+    flux = np.asarray(table['(RAD+CON)/TOT'], dtype='float32')
+    return abs(flux-flux.mean()).max()/flux.mean() * 100
+
 def load_fort6():
     """
     Parse the fort.6 file from pwd to check the conservation of flux. This should not be more than 1%.
@@ -66,17 +156,7 @@ def load_fort6():
     
     Updated to work for tlusty208
     """
-    
-    s=''
-    with open('fort.6', 'r') as file:
-        s = file.read()
-    s = s[s.find('FINAL MODEL ATMOSPHERE'):]
-    
-    cols = s[s.find('ID'):].split('\n')[0].split()
-    table = s[s.find('(RAD+CON)/TOT')+len('(RAD+CON)/TOT\n\n'):].replace('D','e')
-    df = pd.DataFrame([x.split() for x in table.split('\n')[:-1]], columns=cols)
-    flux = np.array(df['(RAD+CON)/TOT'],dtype='float32')
-    return abs(flux-flux.mean()).max()/flux.mean() * 100
+    return flux_deviation(read_fort6())
 
 
 
@@ -89,6 +169,12 @@ def pconv(**kwargs):
     s is a string that should contain some kind of description if many runs are being done at once.
     figsize is a tuple (w,h) in inches
     """
+    import matplotlib.pyplot as plt
+    import colorama
+    from colorama import Fore
+    from colorama import Style
+    colorama.init()
+    
     s = kwargs.get('s','')
     figsize = kwargs.get('figsize',(14,10))
     
@@ -115,8 +201,9 @@ def pconv(**kwargs):
         ax[4].plot(np.log(mass),np.log10(abs(df[idata]['MAXIMUM'])),c=colors[int(i-1)])
         ax[4].axhline(0,c='k',linestyle='--',lw=1)
     
-    ax[2].plot(np.array(list(set(df['ITER']))),np.array(df.groupby('ITER').apply(max)['TEMP']),'-Xk')
-    ax[5].plot(np.array(list(set(df['ITER']))),np.array(df.groupby('ITER').apply(max)['MAXIMUM']),'-Xk')
+    imax = df.groupby('ITER').max()
+    ax[2].plot(np.array(imax.index),np.array(imax['TEMP']),'-Xk')
+    ax[5].plot(np.array(imax.index),np.array(imax['MAXIMUM']),'-Xk')
     #labels
     ax[0].set_ylabel('Relative Change')
     ax[0].set_xlabel('Log Depth (Mass)')
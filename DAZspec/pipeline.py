@@ -0,0 +1,180 @@
+"""
+Run a model through a sequence of Tlusty stages, by default LTE-gray -> LTE -> NLTE, with checkpoints.
+
+Each stage starts from the atmosphere of the stage before it (what move() and write_fort5(ltgray=False)
+do by hand) and its converged atmosphere is kept in <dirname>/checkpoints/<stage>.7 together with a key
+made from everything that went into it: Teff, log g, the fort.5 settings and aux file of the stage and
+the hash of its starting atmosphere. A stage whose checkpoint has the same key is skipped, so
+    - after a failure the pipeline resumes from the last good checkpoint, and
+    - changing the aux settings of the NLTE stage reruns NLTE only, not the LTE work before it.
+"""
+import os
+import json
+import time
+import shutil
+import traceback
+
+from . import config
+from .files import write_fort5
+from .files import format_aux
+from .files import get_path
+from .tluspy import tlusty
+from .monitor import run_tlusty
+from .pconv import iteration_max
+from .cache import _hash
+from .cache import file_hash
+
+
+def stage_key(params, stage, start, **kwargs):
+    """
+    Hash of everything that determines the atmosphere of one stage.
+
+    params: Parameters object
+    stage: dict, see config.pipeline_stages
+    start: str or None, the starting atmosphere (checkpoint of the stage before), None for a gray start
+
+    kwargs:
+    fort5 = {}: dict, kwargs of write_fort5 shared by all stages
+    """
+    fort5 = dict(kwargs.get('fort5',{}), **stage.get('fort5',{}))
+    return _hash({
+        'teff': params.teff,
+        'log_g': params.log_g,
+        'fort5': fort5,
+        'aux': format_aux(params.teff, params.log_g, params=stage.get('aux_params',{})),
+        'start': None if fort5.get('ltgray',True) else file_hash(start),
+        'h1_hash': file_hash(get_path('data/%s' % config.h1_data)),
+        'tl_version': config.tl_version,
+        })
+
+
+def _checkpoint(checkpoints, stage):
+    return os.path.join(checkpoints, stage['name'] + '.7'), os.path.join(checkpoints, stage['name'] + '.json')
+
+
+def _valid(checkpoints, stage, key):
+    """
+    returns the meta dict of the checkpoint of a stage if it was made with the same key, otherwise None
+    """
+    atmosphere, meta = _checkpoint(checkpoints, stage)
+    try:
+        with open(meta,'r') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('key') != key or not os.path.exists(atmosphere):
+        return None
+    return meta
+
+
+def _save(checkpoints, stage, key, info):
+    """
+    Keep fort.7 as the checkpoint of a stage. The atmosphere is written first and the json last,
+    each through a rename, so a checkpoint is either complete or not there.
+    """
+    atmosphere, meta = _checkpoint(checkpoints, stage)
+    tmp = '%s.%i.tmp' % (atmosphere, os.getpid())
+    shutil.copyfile('fort.7', tmp)
+    os.replace(tmp, atmosphere)
+    tmp = '%s.%i.tmp' % (meta, os.getpid())
+    with open(tmp,'w') as file:
+        json.dump(dict(info, key=key), file, indent=1)
+    os.replace(tmp, meta)
+
+
+def run_pipeline(params, dirname, **kwargs):
+    """
+    Compute the atmosphere of a model stage by stage in dirname. At the end the last atmosphere is in
+    dirname/fort.7, ready for Synspec after move().
+
+    params: Parameters object
+    dirname: str, working directory of the model
+
+    kwargs:
+    stages = config.pipeline_stages: list of dicts with the keys name, fort5 (kwargs of write_fort5) and
+        optionally aux_params (aux settings for that stage) and monitor (kwargs of monitor.run_tlusty)
+    aux = 'aux': str, name of the aux file
+    fort5 = {}: dict, kwargs of write_fort5 shared by all stages, the ones of a stage take precedence
+    tol = config.conv_tol: float, a stage is only checkpointed if it converged to this, None to accept any finished run
+    force = (): names of stages to run even if their checkpoint is valid. The stages after one only run again if its atmosphere changed.
+
+    returns a dict with the keys name, dir, status ('ok' or 'failed'), stage (the one that failed), error
+    and stages, a list with the name, status ('ran', 'skipped' or 'failed'), key, iterations and max_change of every stage
+    """
+    stages = kwargs.get('stages',config.pipeline_stages)
+    aux = kwargs.get('aux','aux')
+    fort5 = kwargs.get('fort5',{})
+    tol = kwargs.get('tol',config.conv_tol)
+    force = kwargs.get('force',())
+
+    dirname = os.path.abspath(dirname)
+    checkpoints = os.path.join(dirname, 'checkpoints')
+    result = {'name': params.name, 'dir': dirname, 'status': 'ok', 'stage': None, 'error': None, 'stages': []}
+    original_cwd = os.getcwd()
+    try:
+        os.makedirs(checkpoints, exist_ok=True)
+        os.chdir(dirname)
+        start = None
+        for stage in stages:
+            result['stage'] = stage['name']
+            stage_fort5 = dict(fort5, **stage.get('fort5',{}))
+            if not stage_fort5.get('ltgray',True) and start is None:
+                raise ValueError('Stage %s needs a starting atmosphere (ltgray=False) but it is the first stage' % stage['name'])
+            key = stage_key(params, stage, start, fort5=fort5)
+            info = {'name': stage['name'], 'key': key, 'status': None, 'iterations': None, 'max_change': None}
+            result['stages'].append(info)
+            atmosphere = _checkpoint(checkpoints, stage)[0]
+
+            meta = None if stage['name'] in force else _valid(checkpoints, stage, key)
+            if meta:
+                info['status'] = 'skipped'
+                info['iterations'] = meta.get('iterations')
+                info['max_change'] = meta.get('max_change')
+                print('Stage %s of %s is unchanged, using its checkpoint' % (stage['name'], params.name))
+                start = atmosphere
+                continue
+
+            print('Running stage %s of %s' % (stage['name'], params.name))
+            with open(aux,'w') as file:
+                file.write(format_aux(params.teff, params.log_g, params=stage.get('aux_params',{})))
+            if start is not None and not stage_fort5.get('ltgray',True):
+                shutil.copyfile(start, 'fort.8')
+            for filename in ('fort.7', 'fort.9'):
+                if os.path.exists(filename):
+                    os.remove(filename)
+            write_fort5(params.teff, params.log_g, aux, **stage_fort5)
+            t = time.time()
+            if stage.get('monitor') is None:
+                status = tlusty()
+            else:
+                m = run_tlusty(**stage['monitor'])
+                status = 0 if m.reason == 'converged' else m.returncode
+            if status != 0 or not os.path.exists('fort.7'):
+                info['status'] = 'failed'
+                if status != 0:
+                    raise RuntimeError('Tlusty exited with status %i in stage %s' % (status, stage['name']))
+                raise RuntimeError('Tlusty did not write fort.7 in stage %s' % stage['name'])
+            try:
+                iters, temp, maximum = iteration_max()
+                info['iterations'] = int(iters[-1])
+                info['max_change'] = float(maximum[-1])
+            except (OSError, ValueError, IndexError):
+                pass
+            if tol is not None and not (info['max_change'] is not None and info['max_change'] < tol):
+                info['status'] = 'failed'
+                raise RuntimeError('Stage %s did not converge (largest relative change %s)' % (stage['name'], info['max_change']))
+            info['status'] = 'ran'
+            _save(checkpoints, stage, key, {'name': stage['name'], 'iterations': info['iterations'],
+                                            'max_change': info['max_change'], 'time': time.time() - t})
+            start = atmosphere
+
+        if start is not None:
+            shutil.copyfile(start, 'fort.7')
+        result['stage'] = 'done'
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        os.chdir(original_cwd)
+    return result
@@ -0,0 +1,155 @@
+"""
+Named profiles of the settings that trade accuracy for speed.
+
+The number of frequencies and H I levels in fort.5, the wavelength spacing, line rejection and line cutoff
+in fort.55, and the iteration limits of the aux file set both the runtime of a model and how close its
+spectrum is to the converged answer. config.profiles bundles them under names ('survey', 'standard',
+'publication'), which run_model and run_grid take as profile=name. calibrate runs a set of reference models
+with every profile and measures what each one costs and how far its spectra are from those of the most
+accurate profile, so a survey grid can be run knowing the error it makes.
+"""
+import os
+import json
+import copy
+import numpy as np
+
+from . import config
+from .store import SpectrumStore
+from .broaden import broaden
+
+
+setting_groups = ('fort5', 'fort55', 'aux_params')
+
+
+def get_profile(name):
+    """
+    returns a copy of the settings of a profile in config.profiles, a dict with the keys fort5, fort55 and aux_params
+    """
+    if name not in config.profiles:
+        raise ValueError('Unknown profile %r, the profiles are %s' % (name, ', '.join(config.profiles)))
+    profile = copy.deepcopy(config.profiles[name])
+    for group in setting_groups:
+        profile.setdefault(group, {})
+    return profile
+
+
+def apply_profile(kwargs):
+    """
+    Merge the profile named by kwargs['profile'] into the kwargs of run_model. Settings in kwargs win over
+    the ones of the profile, so e.g. fort5={'lte': False} keeps the frequencies of the profile.
+
+    kwargs: dict, kwargs of run_model
+
+    returns a new dict without the key profile (kwargs itself if it has no profile)
+    """
+    if kwargs.get('profile',None) is None:
+        return kwargs
+    kwargs = dict(kwargs)
+    profile = get_profile(kwargs.pop('profile'))
+    for group in setting_groups:
+        kwargs[group] = dict(profile[group], **kwargs.get(group,{}))
+    return kwargs
+
+
+def _model_time(result):
+    stages = result.get('metrics',{}).get('stages',{})
+    return (sum(stage['wall'] for stage in stages.values()), sum(stage['cpu'] for stage in stages.values()))
+
+
+def calibrate(params_list, root, linelist, **kwargs):
+    """
+    Measure the runtime and the spectral error of profiles on a set of reference models.
+    Every model is run with every profile in root/<profile>, and the spectra of each profile are compared
+    with those of the reference profile on the wavelengths of the reference.
+
+    params_list: list of Parameters objects, the reference models. They should span the grid the profiles are
+        meant for, e.g. a few Teff and log g at the corners and the middle.
+    root: str, working directory
+    linelist: str, name of the linelist in DAZspec/linelists
+
+    kwargs:
+    profiles = all of config.profiles: list of profile names
+    reference = config.reference_profile: str, the profile the others are compared with
+    resolution = None: float, compare the spectra after broadening them to this resolving power, as they
+        would be compared with data. If None they are compared as computed.
+    processes = 1: int, models run at once. More than one is faster but the runtimes then include the
+        contention between the runs.
+    all other kwargs (w1, w2, fort56, ...) are passed to run_grid
+
+    returns a pandas DataFrame with one row per profile and the columns profile, models, failed, time and
+    cpu_time (median seconds per model), speedup (time of the reference over time), max_error (largest
+    relative difference from the reference over all models and wavelengths) and rms_error (median over the
+    models of the rms relative difference). The table and the errors of every model are also saved to
+    root/calibration.json.
+    """
+    import pandas as pd
+    from .grid import run_grid
+    profiles = list(kwargs.pop('profiles',config.profiles))
+    reference = kwargs.pop('reference',config.reference_profile)
+    resolution = kwargs.pop('resolution',None)
+    kwargs.setdefault('processes',1)
+    for key in ('cache', 'index', 'store', 'profile'): # every profile has to compute its own models
+        kwargs.pop(key,None)
+    if reference not in profiles:
+        profiles.insert(0, reference)
+    else: # the reference is run first
+        profiles.remove(reference)
+        profiles.insert(0, reference)
+
+    root = os.path.abspath(root)
+    runs = {}
+    for name in profiles:
+        get_profile(name)
+        print('Calibrating profile %s' % name)
+        store = SpectrumStore(os.path.join(root, name, 'store'))
+        results = run_grid(params_list, os.path.join(root, name), linelist=linelist, profile=name, store=store, tl=False, metrics=True, **kwargs)
+        runs[name] = (store, results)
+
+    ref_store, ref_results = runs[reference]
+    rows = []
+    details = {}
+    for name in profiles:
+        store, results = runs[name]
+        times = []
+        cpu_times = []
+        errors = []
+        details[name] = []
+        for ref, result in zip(ref_results, results):
+            model = {'name': result['name'], 'status': result['status'], 'time': None, 'max_error': None, 'rms_error': None}
+            details[name].append(model)
+            if result['status'] != 'ok':
+                continue
+            model['time'], cpu_time = _model_time(result)
+            times.append(model['time'])
+            cpu_times.append(cpu_time)
+            if ref['status'] != 'ok':
+                continue
+            wave, flux = store.spectrum(result['store_index'])
+            ref_wave, ref_flux = ref_store.spectrum(ref['store_index'])
+            if resolution:
+                flux = broaden(wave, flux, ref_wave, resolution=resolution)
+                ref_flux = broaden(ref_wave, ref_flux, ref_wave, resolution=resolution)
+            else:
+                flux = np.interp(ref_wave, wave, flux)
+            rel = np.abs(flux - ref_flux) / np.abs(ref_flux)
+            model['max_error'] = float(rel.max())
+            model['rms_error'] = float(np.sqrt(np.mean(rel**2)))
+            errors.append(model)
+        rows.append({
+            'profile': name,
+            'models': len(results),
+            'failed': sum(result['status'] != 'ok' for result in results),
+            'time': float(np.median(times)) if times else None,
+            'cpu_time': float(np.median(cpu_times)) if cpu_times else None,
+            'max_error': max([model['max_error'] for model in errors], default=None),
+            'rms_error': float(np.median([model['rms_error'] for model in errors])) if errors else None,
+            })
+    ref_time = rows[0]['time']
+    for row in rows:
+        row['speedup'] = ref_time / row['time'] if ref_time and row['time'] else None
+
+    df = pd.DataFrame(rows, columns=['profile', 'models', 'failed', 'time', 'cpu_time', 'speedup', 'max_error', 'rms_error'])
+    with open(os.path.join(root, 'calibration.json'),'w') as file:
+        json.dump({'reference': reference, 'resolution': resolution, 'profiles': rows, 'models': details}, file, indent=1)
+    print(df.to_string(index=False))
+    return df
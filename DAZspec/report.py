@@ -0,0 +1,161 @@
+"""
+Convergence report over many run directories at once.
+
+pconv.pconv() draws six panels for the run in the pwd, which is fine for one model but not for a grid of
+hundreds. convergence_report() reads fort.9, fort.6 and fort.69 of every directory in parallel and returns
+one table with the numbers those plots show, and flags the models that did not converge. Plots can still be
+made for every model, rendered to files in the worker processes without a display.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import config
+from .pconv import read_fort9
+from .pconv import iteration_max
+from .pconv import read_fort6
+from .pconv import flux_deviation
+from .pconv import load_fort69
+from .atmosphere import read_fort7
+
+
+columns = ['name', 'dir', 'iterations', 'temp', 'maximum', 'flux_deviation', 'time', 'converged', 'error']
+
+
+def _summarize(dirname, tol, flux_tol, plots):
+    """
+    Numbers of one run directory. Runs in a worker process, so changing directory is safe.
+    """
+    row = dict.fromkeys(columns)
+    row['name'] = os.path.basename(os.path.normpath(dirname))
+    row['dir'] = dirname
+    row['converged'] = False
+    errors = []
+    try:
+        os.chdir(dirname)
+        iters, temp, maximum = iteration_max()
+        if len(iters):
+            row['iterations'] = int(iters[-1])
+            row['temp'] = float(temp[-1])
+            row['maximum'] = float(maximum[-1])
+        else:
+            errors.append('fort.9 has no iterations')
+    except (OSError, ValueError) as e:
+        errors.append('fort.9: %s' % e)
+    try:
+        row['flux_deviation'] = float(flux_deviation(read_fort6()))
+    except (OSError, ValueError, KeyError) as e:
+        errors.append('fort.6: %s' % e)
+    try:
+        row['time'] = float(load_fort69())
+    except (OSError, ValueError, IndexError) as e:
+        errors.append('fort.69: %s' % e)
+    row['converged'] = (row['maximum'] is not None and row['maximum'] < tol
+                        and row['flux_deviation'] is not None and row['flux_deviation'] < flux_tol)
+    if plots is not None and row['iterations'] is not None:
+        try:
+            row['plot'] = plot_convergence(os.path.join(plots, row['name'] + '.png'), title=row['name'])
+        except (OSError, ValueError) as e:
+            errors.append('plot: %s' % e)
+    row['error'] = '; '.join(errors) or None
+    return row
+
+
+def convergence_report(dirnames, **kwargs):
+    """
+    Summarize the convergence of many Tlusty runs.
+
+    dirnames: list of run directories, or the root of a grid (every subdirectory with a fort.9 is used)
+
+    kwargs:
+    tol = config.conv_tol: float, a model converged if the largest relative change of the state vector
+        in the last iteration is below this...
+    flux_tol = 1.0: float, ...and the largest departure from flux conservation is below this many percent
+    processes = os.cpu_count(): int, number of worker processes
+    plots = None: str, directory to save a convergence plot of every model to (<name>.png)
+
+    returns a pandas DataFrame with one row per directory and the columns name, dir, iterations,
+    temp and maximum (largest relative change of TEMP and of the state vector in the last iteration),
+    flux_deviation (percent), time (s, from fort.69), converged and error (what could not be read),
+    plus plot if plots were made
+    """
+    import pandas as pd
+    tol = kwargs.get('tol',config.conv_tol)
+    flux_tol = kwargs.get('flux_tol',1.0)
+    processes = kwargs.get('processes',os.cpu_count())
+    plots = kwargs.get('plots',None)
+
+    if isinstance(dirnames, str):
+        root = dirnames
+        dirnames = sorted(os.path.join(root, name) for name in os.listdir(root)
+                          if os.path.exists(os.path.join(root, name, 'fort.9')))
+    dirnames = [os.path.abspath(dirname) for dirname in dirnames]
+    if plots is not None:
+        plots = os.path.abspath(plots)
+        os.makedirs(plots, exist_ok=True)
+
+    n = len(dirnames)
+    args = ([tol] * n, [flux_tol] * n, [plots] * n)
+    chunksize = max(1, n // (4 * (processes or 1)))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        rows = list(pool.map(_summarize, dirnames, *args, chunksize=chunksize))
+    df = pd.DataFrame(rows, columns=columns + (['plot'] if plots is not None else []))
+    print('%i of %i models converged' % (df['converged'].sum(), n))
+    return df
+
+
+def plot_convergence(filename, **kwargs):
+    """
+    Save a convergence plot of the run in the pwd to a file. It is drawn with the Agg canvas directly,
+    so it works without a display and does not touch the pyplot state or backend.
+
+    filename: str, image file to write
+
+    kwargs:
+    title = '': str
+    figsize = (12,8): tuple (w,h) in inches
+
+    returns filename
+    """
+    import numpy as np
+    from matplotlib import cm
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    title = kwargs.get('title','')
+    figsize = kwargs.get('figsize',(12,8))
+
+    cols, data = read_fort9()
+    it = data[:,cols.index('ITER')]
+    iters, temp, maximum = iteration_max()
+    dm = None
+    for atmosphere in ('fort.7', 'fort.8'): # after Synspec fort.7 is the spectrum and the atmosphere is in fort.8
+        try:
+            dm = read_fort7(atmosphere)[0]
+            break
+        except (OSError, ValueError):
+            pass
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots(2, 2).ravel()
+    colors = cm.viridis(np.linspace(0, 1, max(len(iters), 1)))
+    for k, i in enumerate(iters):
+        rows = it == i
+        x = np.log10(np.flip(dm)) if dm is not None and len(dm) == rows.sum() else np.arange(rows.sum())
+        ax[0].plot(x, np.log10(np.abs(data[rows,cols.index('TEMP')]) + 1e-300), c=colors[k])
+        ax[2].plot(x, np.log10(np.abs(data[rows,cols.index('MAXIMUM')]) + 1e-300), c=colors[k])
+    ax[1].semilogy(iters, temp, '-Xk')
+    ax[3].semilogy(iters, maximum, '-Xk')
+    for a in (ax[0], ax[2]):
+        a.set_xlabel('Log Depth (Mass)' if dm is not None else 'Depth point')
+        a.set_ylabel('log |Relative Change|')
+    for a in (ax[1], ax[3]):
+        a.set_xlabel('Iteration')
+        a.set_ylabel('max |Relative Change|')
+    ax[0].set_title('Temperature')
+    ax[1].set_title('Temperature')
+    ax[2].set_title('Maximum in State Vector')
+    ax[3].set_title('Maximum in State Vector')
+    fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(filename)
+    return filename
@@ -0,0 +1,174 @@
+"""
+Run models in fast local scratch directories instead of on the shared filesystem.
+
+Tlusty and Synspec write, read and rewrite a dozen fort.* files per model. With many models running at once
+on network storage, the metadata and I/O load of those files is what limits the grid. A Scratch directory
+lives on tmpfs (/dev/shm) or a local disk; read-only inputs are symbolic links to their originals and only
+the outputs worth keeping (config.scratch_keep) are moved to the model directory, all at once when the run
+is over. The scratch directory is removed even if the run fails, and clean_stale removes the ones left
+behind by processes that were killed.
+"""
+import os
+import glob
+import errno
+import shutil
+import tempfile
+
+from . import config
+from .files import link
+
+
+prefix = 'dazspec_'
+
+
+def default_base():
+    """
+    returns config.scratch_dir, or /dev/shm if it is a writable directory, or the system temporary directory
+    """
+    if config.scratch_dir is not None:
+        return config.scratch_dir
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class Scratch:
+    """
+    A temporary working directory for one model whose results belong in dirname.
+
+        with Scratch(dirname) as path:
+            os.chdir(path)
+            ...
+        # the outputs are in dirname and path is gone
+
+    Attributes:
+    dirname: str, the persistent directory of the model
+    path: str, the scratch directory while it is open, None otherwise
+    """
+    def __init__(self, dirname, **kwargs):
+        """
+        dirname: str, persistent directory of the model, created if it does not exist
+
+        kwargs:
+        base = default_base(): str, directory to make the scratch directory in
+        keep = config.scratch_keep: list of file names or glob patterns to move to dirname at the end
+        inputs = config.scratch_inputs: list of file names in dirname to link into the scratch directory if they exist
+        links = {}: dict {name: path}, more read-only files to link into the scratch directory
+        """
+        self.dirname = os.path.abspath(dirname)
+        self.base = kwargs.get('base',None) or default_base()
+        self.keep = list(kwargs.get('keep',config.scratch_keep))
+        self.inputs = list(kwargs.get('inputs',config.scratch_inputs))
+        self.links = dict(kwargs.get('links',{}))
+        self.path = None
+
+    def open(self):
+        """
+        Make the scratch directory and link the inputs into it.
+        returns the path of the scratch directory
+        """
+        os.makedirs(self.dirname, exist_ok=True)
+        os.makedirs(self.base, exist_ok=True)
+        name = os.path.basename(self.dirname)
+        self.path = tempfile.mkdtemp(prefix='%s%i_%s_' % (prefix, os.getpid(), name), dir=self.base)
+        try:
+            for filename in self.inputs:
+                if os.path.exists(os.path.join(self.dirname, filename)):
+                    link(os.path.join(self.dirname, filename), os.path.join(self.path, filename))
+            for filename in self.links:
+                link(self.links[filename], os.path.join(self.path, filename))
+        except OSError:
+            self.close(collect=False)
+            raise
+        return self.path
+
+    def collect(self):
+        """
+        Move the files that match self.keep to dirname. Links (the inputs) are left alone.
+        returns the list of file names that were moved
+        """
+        names = []
+        for pattern in self.keep:
+            for filename in sorted(glob.glob(os.path.join(self.path, pattern))):
+                if os.path.islink(filename) or not os.path.isfile(filename) or os.path.basename(filename) in names:
+                    continue
+                _move(filename, os.path.join(self.dirname, os.path.basename(filename)))
+                names.append(os.path.basename(filename))
+        return names
+
+    def close(self, **kwargs):
+        """
+        Move the outputs to dirname and remove the scratch directory. The directory is removed even if the
+        outputs could not be moved, and the error is raised after that.
+
+        kwargs:
+        collect = True: bool, move the outputs to dirname first
+
+        returns the list of file names that were moved
+        """
+        if self.path is None:
+            return []
+        try:
+            return self.collect() if kwargs.get('collect',True) else []
+        finally:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+def _move(src, dst):
+    """
+    Move a file, also across filesystems. A copy to another filesystem is renamed into place when it is
+    complete, so dst is never half written.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = dst + '.part'
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+
+
+def clean_stale(**kwargs):
+    """
+    Remove the scratch directories of processes on this machine that no longer exist, which were killed
+    before they could clean up after themselves.
+
+    kwargs:
+    base = default_base(): str, directory the scratch directories were made in
+
+    returns the list of directories that were removed
+    """
+    base = kwargs.get('base',None) or default_base()
+    removed = []
+    for path in glob.glob(os.path.join(base, prefix + '*')):
+        try:
+            pid = int(os.path.basename(path)[len(prefix):].split('_')[0])
+        except ValueError:
+            continue
+        if _alive(pid):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    if removed:
+        print('Removed %i stale scratch directories from %s' % (len(removed), base))
+    return removed
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # exists, owned by someone else
+        return True
+    return True
@@ -0,0 +1,178 @@
+"""
+Run one broad Synspec spectrum as several narrower Synspec runs in parallel and stitch them together.
+
+The wavelength range is cut into chunks. Every chunk runs in its own subdirectory against the same
+atmosphere, with its range widened by the line cutoff on both sides so that every line that reaches into
+the chunk is included, and with a windowed fort.19. The overlaps are dropped when the chunks are merged.
+fort.55 takes whole angstroms, so the chunk edges are whole angstroms and the widened ranges are rounded
+outwards. compare_sharded checks that a sharded run matches a single full range run.
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .files import write_fort55
+from .files import get_linelist
+from .files import link
+from .tluspy import synspec
+from .store import read_spectrum
+
+# files a chunk writes itself, everything else in the run directory is linked into the chunks
+_own_files = ('fort.6', 'fort.7', 'fort.17', 'fort.19', 'fort.55')
+
+
+def chunk_edges(w1, w2, n_chunks):
+    """
+    Cut [w1, w2] into n_chunks ranges of nearly equal width with edges at whole angstroms.
+    returns an array of n_chunks + 1 int edges
+    """
+    w1 = int(round(abs(w1)))
+    w2 = int(round(abs(w2)))
+    if n_chunks < 1 or w2 - w1 < n_chunks:
+        raise ValueError('Can not cut %i-%i A into %i chunks of at least 1 A' % (w1, w2, n_chunks))
+    return np.round(np.linspace(w1, w2, n_chunks + 1)).astype(int)
+
+
+def _run_chunk(dirname, w1, w2, vacuum, linelist, overlap, fort55):
+    """
+    Run Synspec for one chunk. Runs in a worker process, so changing directory is safe.
+    """
+    os.chdir(dirname)
+    a = int(np.floor(w1 - overlap))
+    b = int(np.ceil(w2 + overlap))
+    write_fort55(a, -b if vacuum else b, **fort55)
+    get_linelist(linelist, w1=a, w2=b, cutof0=fort55.get('cutof0',3))
+    status = synspec()
+    if status != 0 or not os.path.exists('fort.7'):
+        raise RuntimeError('Synspec failed for the chunk %i-%i A (status %i)' % (w1, w2, status))
+    return dirname
+
+
+def stitch(filenames, edges, **kwargs):
+    """
+    Merge the spectra of neighbouring chunks into one. From chunk i only the points with
+    edges[i] <= wavelength < edges[i+1] are kept (the last chunk keeps its upper edge too).
+    The lines are copied as Synspec wrote them, so nothing is lost to reformatting.
+
+    filenames: list of str, spectra of the chunks in order
+    edges: array of the chunk edges (see chunk_edges)
+
+    kwargs:
+    dest = 'fort.7': str, file to write
+
+    returns the number of points in the merged spectrum
+    """
+    dest = kwargs.get('dest','fort.7')
+    n = 0
+    with open(dest,'w') as outfile:
+        for i, filename in enumerate(filenames):
+            wave, flux = read_spectrum(filename)
+            with open(filename,'r') as infile:
+                lines = [line for line in infile if line.strip()]
+            keep = (wave >= edges[i]) & ((wave < edges[i+1]) | ((i == len(filenames) - 1) & (wave <= edges[i+1])))
+            outfile.writelines(np.array(lines, dtype=object)[keep])
+            n += keep.sum()
+    return int(n)
+
+
+def synspec_sharded(w1, w2, linelist, **kwargs):
+    """
+    Compute the spectrum between w1 and w2 with several Synspec processes in parallel.
+    The pwd has to be ready for Synspec (fort.5, fort.8, the aux file, and fort.56 if ichemc=1)
+    apart from fort.55 and fort.19, which are written for every chunk. The merged spectrum is written to fort.7
+    and the merged continuum to fort.17 if Synspec wrote one.
+
+    w1: int, the starting wavelength in angstroms
+    w2: int, the ending wavelength in angstroms -- if <0 then wavelengths are all in vacuum
+    linelist: str, name of the linelist in DAZspec/linelists
+
+    kwargs:
+    n_chunks = os.cpu_count(): int, number of chunks
+    processes = n_chunks: int, number of Synspec processes running at once
+    overlap = cutof0: float, angstroms each chunk is widened by on both sides
+    fort55 = {}: dict, kwargs passed to write_fort55
+
+    returns the list of chunk directories
+    """
+    n_chunks = kwargs.get('n_chunks',os.cpu_count())
+    processes = kwargs.get('processes',n_chunks)
+    fort55 = kwargs.get('fort55',{})
+    overlap = kwargs.get('overlap',fort55.get('cutof0',3))
+    if overlap < 0:
+        raise ValueError('overlap must be at least 0, not %g' % overlap)
+
+    edges = chunk_edges(w1, w2, n_chunks)
+    shared = [f for f in os.listdir('.') if os.path.isfile(f) and f not in _own_files]
+    dirnames = []
+    for i in range(n_chunks):
+        dirname = os.path.abspath('shard_%02i' % i)
+        os.makedirs(dirname, exist_ok=True)
+        for filename in shared:
+            link(filename, os.path.join(dirname, filename))
+        dirnames.append(dirname)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_run_chunk, dirnames[i], edges[i], edges[i+1], w2 < 0, linelist, overlap, fort55) for i in range(n_chunks)]
+        for future in futures:
+            future.result()
+
+    n = stitch([os.path.join(dirname, 'fort.7') for dirname in dirnames], edges)
+    continua = [os.path.join(dirname, 'fort.17') for dirname in dirnames]
+    if all(os.path.exists(filename) for filename in continua):
+        stitch(continua, edges, dest='fort.17')
+    print('Stitched %i chunks into %i points' % (n_chunks, n))
+    return dirnames
+
+
+def max_relative_difference(wave, flux, wave_ref, flux_ref):
+    """
+    Largest relative difference between a spectrum and a reference spectrum, e.g. a stitched and a single full range run.
+    The spectrum is interpolated onto the wavelengths of the reference where they overlap.
+    """
+    inside = (wave_ref >= wave.min()) & (wave_ref <= wave.max())
+    interp = np.interp(wave_ref[inside], wave, flux)
+    return float(np.max(np.abs(interp - flux_ref[inside]) / np.abs(flux_ref[inside])))
+
+
+def compare_sharded(w1, w2, linelist, **kwargs):
+    """
+    Check that a sharded run gives the same spectrum as a single full range run.
+    Both are run in subdirectories of the pwd (compare_full and compare_sharded), which has to be ready for
+    Synspec as for synspec_sharded.
+
+    w1, w2, linelist: as for synspec_sharded
+
+    kwargs:
+    tol = None: float, raise a RuntimeError if the largest relative difference is above this
+    all other kwargs are passed to synspec_sharded
+
+    returns the largest relative difference of the stitched spectrum from the full range one
+    """
+    tol = kwargs.pop('tol',None)
+    fort55 = kwargs.get('fort55',{})
+    shared = [f for f in os.listdir('.') if os.path.isfile(f) and f not in _own_files]
+    spectra = {}
+    original_cwd = os.getcwd()
+    for name in ('full', 'sharded'):
+        dirname = os.path.abspath('compare_%s' % name)
+        os.makedirs(dirname, exist_ok=True)
+        for filename in shared:
+            link(filename, os.path.join(dirname, filename))
+        try:
+            os.chdir(dirname)
+            if name == 'full':
+                write_fort55(w1, w2, **fort55)
+                get_linelist(linelist, w1=w1, w2=abs(w2), cutof0=fort55.get('cutof0',3))
+                status = synspec()
+                if status != 0 or not os.path.exists('fort.7'):
+                    raise RuntimeError('Synspec failed for the full range (status %i)' % status)
+            else:
+                synspec_sharded(w1, w2, linelist, **kwargs)
+            spectra[name] = read_spectrum('fort.7')
+        finally:
+            os.chdir(original_cwd)
+    diff = max_relative_difference(*spectra['sharded'], *spectra['full'])
+    print('Largest relative difference between the sharded and the full range spectrum: %.3g' % diff)
+    if tol is not None and diff > tol:
+        raise RuntimeError('The sharded spectrum differs from the full range one by up to %.3g (tol %.3g)' % (diff, tol))
+    return diff
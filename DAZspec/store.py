@@ -0,0 +1,266 @@
+"""
+Append-only binary store of Synspec spectra.
+
+A store is a directory with three flat files:
+    meta.bin  one fixed size record per spectrum with the header information add_header writes
+    flux.f32  the fluxes of all spectra one after the other as float32
+    wave.f64  the wavelength grids as float64, every distinct grid is stored only once
+All of them are memory mapped, so any spectrum of a grid of thousands can be read without parsing text,
+and spectra can be exported to the .tl format of add_header when needed.
+"""
+import os
+import fcntl
+import hashlib
+import numpy as np
+from datetime import datetime
+
+from . import config
+from .files import Parameters
+from .files import calc_ML
+from .files import make_header
+from .atmosphere import _fortran_exp
+
+N_ELEMS = 30
+
+meta_dtype = np.dtype([
+    ('name', 'S128'),
+    ('teff', 'i4'),
+    ('log_g', 'f8'),
+    ('ml2', 'f4'), # nan if the model has no convection
+    ('tl_version', 'i2'),
+    ('syn_version', 'i2'),
+    ('generated', 'S15'),
+    ('user', 'S64'),
+    ('abns', 'f8', (N_ELEMS,)), # N/H of elements 1..N_ELEMS in number space, 0 if not given
+    ('flux_offset', 'i8'),
+    ('wave_offset', 'i8'),
+    ('npts', 'i8'),
+    ('wave_hash', 'S16'),
+    ])
+
+
+def read_spectrum(filename='fort.7'):
+    """
+    Read a spectrum written by Synspec.
+    returns (wavelength, flux) as float64 arrays
+    """
+    with open(filename,'rb') as file:
+        data = file.read().translate(_fortran_exp)
+    values = np.fromstring(data, dtype='float64', sep=' ').reshape(-1, 2)
+    return values[:,0], values[:,1]
+
+
+def read_tl(filename):
+    """
+    Read a spectrum with the header of add_header (a .tl file).
+    returns (params, wave, flux) where params is the Parameters object rebuilt from the header
+    """
+    teff = log_g = name = None
+    abns = {}
+    header = 0
+    with open(filename,'rb') as file:
+        for line in file:
+            header += len(line)
+            words = line.decode().split()
+            if not words:
+                continue
+            if words[0] == 'END':
+                break
+            if words[0] == 'TEFF':
+                teff = int(words[2])
+            elif words[0] == 'LOG_G':
+                log_g = float(words[2])
+            elif words[:3] == ['COMMENT', 'Star', 'Name']:
+                name = ' '.join(words[3:])
+            elif words[0] == 'COMMENT' and len(words) == 4 and words[1].isdigit():
+                abns[int(words[1])] = float(words[3])
+        data = file.read().translate(_fortran_exp)
+    if teff is None or log_g is None:
+        raise ValueError('%s has no TEFF or LOG_G in its header' % filename)
+    values = np.fromstring(data, dtype='float64', sep=' ').reshape(-1, 2)
+    if name is None:
+        name = os.path.splitext(os.path.basename(filename))[0]
+    return Parameters(name, teff, log_g, abns), values[:,0], values[:,1]
+
+
+class SpectrumStore:
+    """
+    Memory mapped, append-only collection of spectra. Several processes can append to the same store.
+    """
+    def __init__(self, root):
+        """
+        root: str, directory of the store. It is created if needed.
+        """
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        for name in ('meta.bin', 'flux.f32', 'wave.f64'):
+            open(self._path(name), 'ab').close()
+        self._size = None
+        self._meta = None
+        self._flux = None
+        self._wave = None
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _refresh(self):
+        """
+        Remap the files if something was appended since the last read.
+        """
+        size = os.path.getsize(self._path('meta.bin'))
+        if size == self._size:
+            return
+        n = size // meta_dtype.itemsize
+        self._meta = np.memmap(self._path('meta.bin'), dtype=meta_dtype, mode='r', shape=(n,)) if n else np.zeros(0, meta_dtype)
+        nflux = os.path.getsize(self._path('flux.f32')) // 4
+        nwave = os.path.getsize(self._path('wave.f64')) // 8
+        self._flux = np.memmap(self._path('flux.f32'), dtype='float32', mode='r', shape=(nflux,)) if nflux else np.zeros(0, 'float32')
+        self._wave = np.memmap(self._path('wave.f64'), dtype='float64', mode='r', shape=(nwave,)) if nwave else np.zeros(0, 'float64')
+        self._size = size
+
+    @property
+    def meta(self):
+        """
+        Structured array with one record per spectrum, see meta_dtype.
+        """
+        self._refresh()
+        return self._meta
+
+    def __len__(self):
+        return len(self.meta)
+
+    def append(self, params, **kwargs):
+        """
+        Add a spectrum to the store.
+
+        params: Parameters object of the model
+
+        kwargs:
+        filename = 'fort.7': str, spectrum written by Synspec. Ignored if wave and flux are given.
+        wave = None, flux = None: arrays, the spectrum itself
+        ML = None: float, mixing length if it is already known, otherwise it is calculated with calc_ML
+
+        returns the index of the new spectrum. Raises a ValueError if the name is longer than the store can hold.
+        """
+        name = params.name.encode()
+        if len(name) > meta_dtype['name'].itemsize:
+            raise ValueError('The name %s is longer than the %i bytes the store holds' % (params.name, meta_dtype['name'].itemsize))
+        wave = kwargs.get('wave',None)
+        flux = kwargs.get('flux',None)
+        if wave is None or flux is None:
+            wave, flux = read_spectrum(kwargs.get('filename','fort.7'))
+        wave = np.ascontiguousarray(wave, dtype='float64')
+        flux = np.ascontiguousarray(flux, dtype='float32')
+        if wave.shape != flux.shape:
+            raise ValueError('wave and flux must have the same shape')
+        wave_hash = hashlib.sha256(wave.tobytes()).digest()[:16]
+
+        row = np.zeros(1, meta_dtype)
+        row['name'] = name
+        row['teff'] = params.teff
+        row['log_g'] = params.log_g
+        ML = kwargs.get('ML',None)
+        if params.teff > 15000:
+            ML = np.nan
+        elif ML is None:
+            ML = calc_ML(params.teff, params.log_g)
+        row['ml2'] = ML
+        row['tl_version'] = config.tl_version
+        row['syn_version'] = config.syn_version
+        row['generated'] = datetime.now().strftime('%Y%m%d-%H%M%S').encode()
+        row['user'] = config.user.encode()[:64]
+        for elem in params.abns:
+            if 1 <= elem <= N_ELEMS:
+                row['abns'][0, elem-1] = params.abns[elem]
+        row['npts'] = len(wave)
+        row['wave_hash'] = wave_hash
+
+        with open(self._path('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+            same = np.nonzero(self._meta['wave_hash'] == wave_hash)[0]
+            if len(same):
+                row['wave_offset'] = self._meta['wave_offset'][same[0]]
+            else:
+                row['wave_offset'] = os.path.getsize(self._path('wave.f64')) // 8
+                with open(self._path('wave.f64'), 'ab') as file:
+                    file.write(wave.tobytes())
+            row['flux_offset'] = os.path.getsize(self._path('flux.f32')) // 4
+            with open(self._path('flux.f32'), 'ab') as file:
+                file.write(flux.tobytes())
+            # the record goes last, so a spectrum only shows up once all its data is on disk
+            with open(self._path('meta.bin'), 'ab') as file:
+                file.write(row.tobytes())
+            index = os.path.getsize(self._path('meta.bin')) // meta_dtype.itemsize - 1
+        return index
+
+    def wave(self, i):
+        """
+        Wavelengths of spectrum i in angstroms (a read only view, nothing is copied).
+        """
+        row = self.meta[i]
+        return self._wave[row['wave_offset']:row['wave_offset'] + row['npts']]
+
+    def flux(self, i):
+        """
+        Flux of spectrum i in erg/cm2/s/angstrom (a read only view, nothing is copied).
+        """
+        row = self.meta[i]
+        return self._flux[row['flux_offset']:row['flux_offset'] + row['npts']]
+
+    def spectrum(self, i):
+        """
+        returns (wave, flux) of spectrum i
+        """
+        return self.wave(i), self.flux(i)
+
+    def fluxes(self, indices=None):
+        """
+        Stack the fluxes of many spectra that share a wavelength grid.
+
+        indices = None: list of indices, None for all spectra
+
+        returns (wave, flux) where flux has shape (len(indices), npts)
+        """
+        meta = self.meta
+        if indices is None:
+            indices = np.arange(len(meta))
+        indices = np.asarray(indices)
+        rows = meta[indices]
+        if len(set(rows['wave_hash'])) > 1:
+            raise ValueError('The spectra are on different wavelength grids, resample them first.')
+        npts = rows['npts'][0]
+        flux = self._flux[rows['flux_offset'][:,None] + np.arange(npts)]
+        return self.wave(indices[0]), flux
+
+    def find(self, name):
+        """
+        Indices of all spectra called name.
+        """
+        return np.nonzero(self.meta['name'] == name.encode())[0]
+
+    def params(self, i):
+        """
+        Rebuild the Parameters object of spectrum i.
+        """
+        row = self.meta[i]
+        abns = {int(elem) + 1: float(row['abns'][elem]) for elem in np.nonzero(row['abns'])[0]}
+        return Parameters(row['name'].decode(), int(row['teff']), float(row['log_g']), abns)
+
+    def to_tl(self, i, filename):
+        """
+        Export spectrum i to filename + '.tl' in the same format as add_header.
+        returns the name of the file
+        """
+        row = self.meta[i]
+        params = self.params(i)
+        with open(filename + '.tl', 'w') as file:
+            file.write(make_header(params,
+                                   generated=row['generated'].decode(),
+                                   tl_version=row['tl_version'],
+                                   syn_version=row['syn_version'],
+                                   user=row['user'].decode(),
+                                   ML=float(row['ml2']))) # nan for hot models, where it is not used
+            np.savetxt(file, np.column_stack(self.spectrum(i)), fmt=['%10.3f', '%12.4E'])
+        print('Exported spectrum %i to %s' % (i, filename + '.tl'))
+        return filename + '.tl'
@@ -0,0 +1,115 @@
+"""
+Compute many abundance variants of one model against the same converged atmosphere.
+
+Tlusty only sees hydrogen, so changing metal abundances only needs a new fort.56 and a Synspec run
+(ichemc=1 in write_fort55). The atmosphere, fort.5, aux file, fort.55 and the windowed linelist are
+written once into a shared directory and linked into every variant, and the Synspec runs go in parallel.
+"""
+import os
+import shutil
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from .files import Parameters
+from .files import write_fort5
+from .files import write_fort55
+from .files import write_fort56
+from .files import write_aux
+from .files import get_linelist
+from .files import link
+from .tluspy import synspec
+from .store import SpectrumStore
+
+
+def _run_variant(params, dirname, shared, fort56, store):
+    """
+    Run Synspec for one abundance variant. Runs in a worker process, so changing directory is safe.
+    """
+    result = {'name': params.name, 'dir': dirname, 'status': 'ok', 'error': None, 'store_index': None}
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        os.chdir(dirname)
+        for filename in os.listdir(shared):
+            link(os.path.join(shared, filename), filename)
+        write_fort56(params.abns, **fort56)
+        status = synspec()
+        if status != 0 or not os.path.exists('fort.7'):
+            raise RuntimeError('Synspec exited with status %i' % status)
+        result['store_index'] = store.append(params)
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+        result['traceback'] = traceback.format_exc()
+    return result
+
+
+def abundance_sweep(params, atmosphere, abn_list, root, **kwargs):
+    """
+    Compute the spectrum of one atmosphere for many sets of abundances.
+
+    params: Parameters object of the model (name, teff and log_g are used)
+    atmosphere: str, the converged Tlusty atmosphere (a fort.7 or fort.8)
+    abn_list: list of abundance dicts {atomic number: N/H} as returned by read_abn_file, or of Parameters objects
+    root: str, directory for the runs. Variant i runs in root/<name>_<iii> (i with three digits, e.g. root/model_007),
+        or in root/<its name> if it is a Parameters object. Names must be unique and can not be shared or store,
+        the directories the sweep uses itself.
+
+    kwargs:
+    w1 = 3000, w2 = 7000: wavelength range of the spectra in angstroms
+    linelist: str, name of the linelist in DAZspec/linelists
+    aux = 'aux': str, name of the aux file
+    fort5 = {}, fort55 = {}, fort56 = {}: dicts, kwargs passed to the writers. ichemc is always 1.
+    store = root/store: SpectrumStore or the path of one that collects all the spectra
+    processes = os.cpu_count(): int, number of Synspec processes running at once
+
+    returns a list of result dicts with the keys name, dir, status, error and store_index
+    """
+    variants = []
+    for i, abns in enumerate(abn_list):
+        if isinstance(abns, Parameters):
+            variants.append(Parameters(abns.name, params.teff, params.log_g, abns.abns))
+        else:
+            variants.append(Parameters('%s_%03i' % (params.name, i), params.teff, params.log_g, abns))
+    names = [variant.name for variant in variants]
+    if len(set(names)) != len(names):
+        raise ValueError('Every abundance variant needs a unique name, it is used as the name of its directory.')
+    reserved = set(names) & {'shared', 'store'}
+    if reserved:
+        raise ValueError('%s can not be the name of a variant, the sweep uses that directory itself.' % reserved.pop())
+
+    w1 = kwargs.get('w1',3000)
+    w2 = kwargs.get('w2',7000)
+    linelist = kwargs['linelist']
+    aux = kwargs.get('aux','aux')
+    fort5 = kwargs.get('fort5',{})
+    fort55 = dict(kwargs.get('fort55',{}), ichemc=1)
+    fort56 = kwargs.get('fort56',{})
+    processes = kwargs.get('processes',os.cpu_count())
+
+    root = os.path.abspath(root)
+    store = kwargs.get('store',os.path.join(root, 'store'))
+    if isinstance(store, str):
+        store = SpectrumStore(store)
+
+    # everything the variants have in common
+    shared = os.path.join(root, 'shared')
+    os.makedirs(shared, exist_ok=True)
+    shutil.copyfile(atmosphere, os.path.join(shared, 'fort.8'))
+    original_cwd = os.getcwd()
+    try:
+        os.chdir(shared)
+        write_aux(aux, params.teff, params.log_g)
+        write_fort5(params.teff, params.log_g, aux, **fort5)
+        write_fort55(w1, w2, **fort55)
+        get_linelist(linelist, w1=w1, w2=w2, cutof0=fort55.get('cutof0',3))
+    finally:
+        os.chdir(original_cwd)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_run_variant, variant, os.path.join(root, variant.name), shared, fort56, store) for variant in variants]
+        for future in futures:
+            results.append(future.result())
+    n_failed = sum(result['status'] != 'ok' for result in results)
+    print('Finished %i abundance variants (%i failed)' % (len(results), n_failed))
+    return results
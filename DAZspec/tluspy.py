@@ -2,10 +2,9 @@
 #DISCLAIMER - this should only be used for White Dwarfs. For full versitility use the real code.
 #This is built to interact with Tlusty and Synspec, but is nothing more than a shell around them.
 
-import os
-import numpy as np
 from .files import get_path
-import config
+from .execute import submit
+from . import config
 
     
 
@@ -14,16 +13,35 @@ import config
 
 
 
-def tlusty():
+def tlusty(**kwargs):
     """
     Run tlusty with file name defined in tluspy.config.
+    Returns the exit status, 0 on success, or the execute.Job if block=False.
+    
+    kwargs:
+    cwd = None: str, directory to run in, the pwd if None
+    timeout = config.tl_timeout: float, kill tlusty after this many seconds
+    block = True: bool, wait for tlusty to finish
     """
-    path = get_path(config.tlpath)
-    os.system('%s < fort.5 > fort.6' % path)
+    kwargs.setdefault('timeout',config.tl_timeout)
+    return _run(config.tlpath, **kwargs)
     
-def synspec():
+def synspec(**kwargs):
     """
     Run synspec with file name defined in tluspy.config.
+    Returns the exit status, 0 on success, or the execute.Job if block=False.
+    
+    kwargs:
+    cwd = None: str, directory to run in, the pwd if None
+    timeout = config.syn_timeout: float, kill synspec after this many seconds
+    block = True: bool, wait for synspec to finish
     """
-    path = get_path(config.synpath)
-    os.system('%s < fort.5 > fort.6' % path)
+    kwargs.setdefault('timeout',config.syn_timeout)
+    return _run(config.synpath, **kwargs)
+
+def _run(program, **kwargs):
+    block = kwargs.pop('block',True)
+    job = submit([get_path(program)], **kwargs)
+    if not block:
+        return job
+    return job.wait()
@@ -0,0 +1,146 @@
+"""
+Index of converged Tlusty atmospheres used to warm start new models.
+
+Instead of starting every model from a gray atmosphere, the closest converged model in (Teff, log g)
+is copied in as fort.8 and Tlusty is run with ltgray=False. Tlusty only sees hydrogen, so by default
+abundances are not part of the distance, but key elements can be added with the elements kwarg.
+"""
+import os
+import json
+import shutil
+import numpy as np
+
+
+class AtmosphereIndex:
+    """
+    A directory of converged atmospheres. Each atmosphere is stored as <name>.7 next to a <name>.json
+    holding its parameters, so several processes can add to the same index at once.
+    Lookups are a vectorized nearest neighbour search over scaled coordinates.
+    """
+    def __init__(self, root, **kwargs):
+        """
+        root: str, directory of the index
+
+        kwargs:
+        teff_scale = 1000: float, Teff difference in K that makes one unit of distance
+        log_g_scale = 0.25: float, log g difference that makes one unit of distance
+        elements = (): tuple of atomic numbers whose log abundances are part of the distance
+        abn_scale = 1.0: float, log abundance difference in dex that makes one unit of distance
+        """
+        self.root = os.path.abspath(root)
+        self.teff_scale = kwargs.get('teff_scale',1000.)
+        self.log_g_scale = kwargs.get('log_g_scale',0.25)
+        self.elements = tuple(kwargs.get('elements',()))
+        self.abn_scale = kwargs.get('abn_scale',1.)
+        os.makedirs(self.root, exist_ok=True)
+        self._mtime = None
+        self._metas = []
+        self._points = np.zeros((0, 2 + len(self.elements)))
+
+    def _point(self, teff, log_g, abns):
+        point = [teff / self.teff_scale, log_g / self.log_g_scale]
+        for elem in self.elements:
+            point.append(np.log10(abns.get(elem, 1e-50)) / self.abn_scale)
+        return point
+
+    def _load(self):
+        """
+        (Re)read the index if the directory changed since the last lookup.
+        """
+        mtime = os.stat(self.root).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        metas = []
+        for filename in sorted(os.listdir(self.root)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(self.root, filename), 'r') as file:
+                meta = json.load(file)
+            meta['abns'] = {int(elem): meta['abns'][elem] for elem in meta['abns']}
+            metas.append(meta)
+        self._metas = metas
+        self._points = np.array([self._point(m['teff'], m['log_g'], m['abns']) for m in metas]).reshape(len(metas), 2 + len(self.elements))
+        self._mtime = mtime
+
+    def __len__(self):
+        self._load()
+        return len(self._metas)
+
+    def add(self, params, **kwargs):
+        """
+        Add a converged atmosphere to the index.
+
+        params: Parameters object of the model
+
+        kwargs:
+        filename = 'fort.7': str, the converged atmosphere
+        lte = True: bool, whether the atmosphere is an LTE model
+        """
+        filename = kwargs.get('filename','fort.7')
+        lte = kwargs.get('lte',True)
+
+        name = '%s_%i_%.3f_%s' % (params.name, params.teff, params.log_g, 'LTE' if lte else 'NLTE')
+        meta = {
+            'name': name,
+            'teff': params.teff,
+            'log_g': params.log_g,
+            'abns': params.abns,
+            'lte': bool(lte),
+            }
+        # write the atmosphere before the json so that readers never find a json without its atmosphere
+        tmp = os.path.join(self.root, '.%s.tmp' % name)
+        shutil.copyfile(filename, tmp)
+        os.replace(tmp, os.path.join(self.root, name + '.7'))
+        with open(tmp, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp, os.path.join(self.root, name + '.json'))
+
+    def nearest(self, params, **kwargs):
+        """
+        Find the converged atmosphere closest to params.
+
+        params: Parameters object
+
+        kwargs:
+        lte = None: bool, only consider LTE (True) or NLTE (False) atmospheres. None considers both.
+        max_distance = None: float, ignore atmospheres further than this (in scaled units)
+
+        returns a tuple (path of the atmosphere, distance, meta dict) or None if nothing qualifies
+        """
+        lte = kwargs.get('lte',None)
+        max_distance = kwargs.get('max_distance',None)
+
+        self._load()
+        if len(self._metas) == 0:
+            return None
+        d = np.sqrt(((self._points - np.array(self._point(params.teff, params.log_g, params.abns)))**2).sum(axis=1))
+        if lte is not None:
+            d[np.array([m['lte'] != lte for m in self._metas])] = np.inf
+        if max_distance is not None:
+            d[d > max_distance] = np.inf
+        i = int(np.argmin(d))
+        if not np.isfinite(d[i]):
+            return None
+        meta = self._metas[i]
+        return os.path.join(self.root, meta['name'] + '.7'), float(d[i]), meta
+
+    def seed(self, params, **kwargs):
+        """
+        Copy the closest converged atmosphere into the pwd as fort.8 so that Tlusty can be run with ltgray=False.
+
+        params: Parameters object
+
+        kwargs:
+        dest = 'fort.8': str, where to copy the atmosphere
+        all other kwargs are passed to nearest()
+
+        returns the meta dict of the atmosphere that was used or None if there was none
+        """
+        dest = kwargs.pop('dest','fort.8')
+        found = self.nearest(params, **kwargs)
+        if found is None:
+            return None
+        path, d, meta = found
+        shutil.copyfile(path, dest)
+        print('Warm starting from %s' % meta['name'])
+        return meta
@@ -0,0 +1,54 @@
+"""
+Fixtures shared by the tests. Tlusty and Synspec are the stand-ins of DAZspec.fake, so the tests need
+neither the Fortran codes nor their run times.
+"""
+import os
+import pytest
+
+os.environ.setdefault('DAZSPEC_BANNER','0')
+
+from DAZspec import config
+from DAZspec import fake
+from DAZspec.files import Parameters
+
+
+@pytest.fixture
+def install_fake(tmp_path, monkeypatch):
+    """
+    Install the fake executables and point config.tlpath and config.synpath to them for one test.
+    Call it again with other kwargs to change how they behave, e.g. tlusty={'niter': 1}.
+    returns a function taking the kwargs of fake.install and returning (tlpath, synpath)
+    """
+    count = [0]
+    def install(**kwargs):
+        tlusty = dict({'delay': 0}, **kwargs.get('tlusty',{}))
+        synspec = dict({'delay': 0}, **kwargs.get('synspec',{}))
+        count[0] += 1
+        tlpath, synpath = fake.install(str(tmp_path / ('bin%i' % count[0])), tlusty=tlusty, synspec=synspec)
+        monkeypatch.setattr(config, 'tlpath', tlpath)
+        monkeypatch.setattr(config, 'synpath', synpath)
+        return tlpath, synpath
+    return install
+
+
+@pytest.fixture
+def fakes(install_fake):
+    """
+    The fake executables with their defaults (a converged Tlusty run), without delays.
+    """
+    return install_fake()
+
+
+@pytest.fixture
+def linelist(tmp_path):
+    """
+    A synthetic linelist covering 3900-4300 A. returns its full path
+    """
+    filename = str(tmp_path / 'lines.dat')
+    fake.write_linelist(filename, 3900, 4300, n=500)
+    return filename
+
+
+@pytest.fixture
+def params():
+    return Parameters('model', 12000, 8.0, {2: 1e-5, 6: 1e-8, 12: 1e-8, 20: 1e-8, 26: 1e-8})
@@ -0,0 +1,115 @@
+import os
+import time
+
+from DAZspec.cache import ResultCache
+from DAZspec.cache import atmosphere_key
+from DAZspec.cache import spectrum_key
+from DAZspec.cache import file_hash
+from DAZspec.files import Parameters
+from DAZspec.grid import run_model
+
+
+def _file(path, size):
+    with open(path,'wb') as file:
+        file.write(b'x' * size)
+    return str(path)
+
+
+def _used(cache, key, t):
+    meta = os.path.join(cache.root, key, 'meta.json')
+    os.utime(meta, (t, t))
+
+
+def test_file_hash(tmp_path):
+    filename = _file(tmp_path / 'a', 10)
+    assert file_hash(filename) == file_hash(filename)
+    assert file_hash(str(tmp_path / 'missing')) is None
+
+
+def test_keys(params):
+    other = Parameters('other', params.teff, params.log_g, {**params.abns, 26: 1e-7})
+    assert atmosphere_key(params) == atmosphere_key(other) # name and metals do not change the atmosphere
+    assert atmosphere_key(params) != atmosphere_key(params, aux_params={'nITER': 30})
+    assert spectrum_key(params) != spectrum_key(other)
+    assert spectrum_key(params) != spectrum_key(params, shards=4)
+
+
+def test_put_get_restore(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cache.put('k', {'fort.7': _file(tmp_path / 'f', 100)})
+    assert 'k' in cache
+    assert os.path.getsize(cache.get('k')['fort.7']) == 100
+    out = tmp_path / 'out'
+    out.mkdir()
+    assert cache.restore('k', str(out))
+    assert (out / 'fort.7').read_bytes() == b'x' * 100
+    assert not cache.restore('missing', str(out))
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_prune_lru(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=None)
+    now = time.time()
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.put(key, {'f': _file(tmp_path / key, 100)})
+        _used(cache, key, now - 100 + i)
+    cache.get('a') # a is now the most recently used
+    assert cache.prune(max_size=200) == ['b']
+    assert cache.prune(max_size=100) == ['c']
+    assert [info['key'] for info in cache.info()] == ['a']
+    assert cache.size() == 100
+
+
+def test_prune_max_age(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=None)
+    cache.put('old', {'f': _file(tmp_path / 'f', 10)})
+    cache.put('new', {'f': _file(tmp_path / 'f', 10)})
+    _used(cache, 'old', time.time() - 3600)
+    assert cache.prune(max_age=60) == ['old']
+    assert 'new' in cache
+
+
+def test_put_prunes_over_max_size(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=250, prune_interval=3600)
+    now = time.time()
+    for i, key in enumerate(('a', 'b')):
+        cache.put(key, {'f': _file(tmp_path / key, 100)})
+        _used(cache, key, now - 100 + i)
+    scanned = cache._scanned
+    assert cache._size == 200
+    cache.put('c', {'f': _file(tmp_path / 'c', 100)}) # over max_size, so the oldest entry goes
+    assert 'a' not in cache and 'b' in cache and 'c' in cache
+    assert cache._scanned > scanned
+    assert cache._size == 200
+
+
+def test_put_does_not_rescan_under_max_size(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_size=10**6, prune_interval=3600)
+    cache.put('a', {'f': _file(tmp_path / 'a', 100)})
+    scanned = cache._scanned
+    cache.put('b', {'f': _file(tmp_path / 'b', 100)})
+    assert cache._scanned == scanned
+    assert cache._size == 200
+
+
+def test_run_model_caches_converged_only(tmp_path, install_fake, linelist, params):
+    cache = str(tmp_path / 'cache')
+    kwargs = {'linelist': linelist, 'w1': 4000, 'w2': 4100, 'cache': cache, 'tl': False}
+
+    install_fake(tlusty={'niter': 1}) # stops before converging
+    result = run_model(params, str(tmp_path / 'a'), **kwargs)
+    assert result['status'] == 'ok' and result['cached'] is None
+    assert ResultCache(cache).info() == []
+
+    install_fake()
+    result = run_model(params, str(tmp_path / 'b'), **kwargs)
+    assert result['status'] == 'ok' and result['cached'] is None
+    assert len(ResultCache(cache).info()) == 2 # the atmosphere and the spectrum
+
+    result = run_model(params, str(tmp_path / 'c'), **kwargs)
+    assert result['cached'] == 'spectrum'
+    assert os.path.exists(tmp_path / 'c' / 'fort.9')
+
+    variant = Parameters('variant', params.teff, params.log_g, {**params.abns, 26: 1e-7})
+    result = run_model(variant, str(tmp_path / 'd'), **kwargs)
+    assert result['cached'] == 'atmosphere'
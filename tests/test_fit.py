@@ -0,0 +1,108 @@
+import os
+import itertools
+import numpy as np
+import pytest
+
+from DAZspec import fake
+from DAZspec.files import Parameters
+from DAZspec.fit import chi2
+from DAZspec.fit import fit
+from DAZspec.fit import fit_models
+from DAZspec.fit import fit_many
+from DAZspec.fit import refine_abundances
+from DAZspec.interpolate import GridInterpolator
+
+
+wave = np.linspace(4000, 4100, 201)
+
+
+def _flux(teff, log_g):
+    depth = 0.2 + 0.5 * (log_g - 7) / 2
+    width = 2 + 6 * (teff - 10000) / 10000
+    return (teff / 1e4)**4 * (1 - depth * np.exp(-((wave - 4050) / width)**2))
+
+
+def _interpolator():
+    points = np.array(list(itertools.product(np.linspace(10000, 20000, 11), np.linspace(7, 9, 9))))
+    return GridInterpolator.from_points(points, wave, [_flux(*p) for p in points])
+
+
+def test_chi2_scale():
+    flux = _flux(12000, 8.0)
+    err = np.full_like(flux, 0.01)
+    models = np.array([flux / 3, flux, 2 * flux + 0.1])
+    c, a = chi2(flux, err, models)
+    np.testing.assert_allclose(a[:2], [3, 1])
+    np.testing.assert_allclose(c[:2], 0, atol=1e-12 * np.sum((flux / err)**2)) # ff - a fm cancels
+    assert c[2] > 0
+    # the scale minimizes chi2: a small change of it only makes chi2 larger
+    for factor in (0.99, 1.01):
+        assert np.sum(((flux - factor * a[2] * models[2]) / err)**2) > c[2]
+
+
+def test_chi2_without_scale():
+    flux = np.array([1., 2., 3.])
+    err = np.array([1., 1., 2.])
+    c, a = chi2(flux, err, [flux + 1], scale=False)
+    np.testing.assert_allclose(c, [1 + 1 + 0.25])
+    np.testing.assert_array_equal(a, [1])
+
+
+def test_chi2_mask():
+    flux = np.array([1., 2., 3., np.nan])
+    err = np.array([1., 1., -1., 1.]) # the last two points are left out
+    c, a = chi2(flux, err, [[1., 2., 100., 5.]], scale=False)
+    assert c[0] == 0
+    c, a = chi2(flux, err, [[5., 2., 3., 4.]], mask=[False, True, True, True], scale=False)
+    assert c[0] == 0
+    with pytest.raises(ValueError):
+        chi2(flux, -np.abs(err), [flux])
+
+
+def test_fit_recovers_parameters():
+    flux = 2.5 * _flux(13700, 8.35)
+    err = np.full_like(flux, 0.01)
+    result = fit(wave, flux, err, _interpolator(), n=5, rounds=6)
+    assert abs(result['best']['teff'] - 13700) < 50
+    assert abs(result['best']['log_g'] - 8.35) < 0.02
+    assert abs(result['scale'] - 2.5) < 0.01
+    assert result['dof'] == len(wave) - 3
+
+
+def test_fit_models():
+    models = np.array([_flux(teff, 8.0) for teff in (11000, 12000, 13000)])
+    result = fit_models(wave, 0.5 * models[1], np.full(len(wave), 0.01), wave, models)
+    assert result['best'] == 1
+    assert abs(result['scale'] - 0.5) < 1e-6
+
+
+def test_fit_many():
+    interpolator = _interpolator()
+    err = np.full(len(wave), 0.01)
+    observations = [{'name': 'a', 'wave': wave, 'flux': _flux(15000, 7.5), 'err': err},
+                    {'name': 'bad', 'wave': wave, 'flux': _flux(15000, 7.5), 'err': -err},
+                    {'name': 'b', 'wave': wave, 'flux': _flux(11000, 8.5), 'err': err}]
+    results = fit_many(observations, interpolator, processes=2, rounds=6)
+    assert [result['name'] for result in results] == ['a', 'bad', 'b']
+    assert [result['status'] for result in results] == ['ok', 'failed', 'ok']
+    assert 'ValueError' in results[1]['error']
+    assert abs(results[0]['best']['teff'] - 15000) < 50
+    assert abs(results[2]['best']['log_g'] - 8.5) < 0.02
+
+
+def test_refine_abundances(tmp_path, fakes, linelist):
+    atmosphere = str(tmp_path / 'atm.7')
+    fake.write_fort7(atmosphere, 12000)
+    params = Parameters('star', 12000, 8.0, {2: 1e-5, 12: 1e-8, 20: 1e-8})
+    w = np.linspace(4050, 4150, 200)
+    flux = np.ones_like(w)
+    root = str(tmp_path / 'root')
+    result = refine_abundances(params, atmosphere, w, flux, 0.01 * flux, [20, 12], root, processes=1, linelist=linelist, resolution=3000)
+    # the fake Synspec does not depend on the metals, so the abundances are kept
+    assert result['params'].abns == params.abns
+    assert sorted(result['elements']) == [12, 20]
+    # one run of the unchanged model and four offsets per element
+    assert len([name for name in os.listdir(root) if name.startswith('star_')]) == 9
+
+    with pytest.raises(ValueError):
+        refine_abundances(params, atmosphere, w, flux, 0.01 * flux, [20, 14], str(tmp_path / 'root2'), linelist=linelist)
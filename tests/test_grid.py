@@ -0,0 +1,40 @@
+import os
+import pytest
+
+from DAZspec.files import Parameters
+from DAZspec.grid import run_model
+from DAZspec.grid import run_grid
+from DAZspec.grid import failed
+from DAZspec.store import SpectrumStore
+
+
+def _grid():
+    return [Parameters('m%i' % teff, teff, 8.0, {20: 1e-8}) for teff in (10000, 12000, 14000)]
+
+
+def test_run_model(tmp_path, fakes, linelist, params):
+    result = run_model(params, str(tmp_path / 'model'), linelist=linelist, w1=4000, w2=4100)
+    assert result['status'] == 'ok' and result['stage'] == 'done'
+    assert os.path.exists(result['spectrum'])
+    assert os.path.exists(tmp_path / 'model' / 'fort.8') # the atmosphere, moved before Synspec ran
+
+
+def test_run_grid(tmp_path, fakes, linelist):
+    store = str(tmp_path / 'store')
+    results = run_grid(_grid(), str(tmp_path / 'grid'), linelist=linelist, w1=4000, w2=4100, store=store, processes=2)
+    assert [result['name'] for result in results] == ['m10000', 'm12000', 'm14000']
+    assert failed(results) == []
+    assert all(result['dir'] == str(tmp_path / 'grid' / result['name']) for result in results)
+    assert sorted(SpectrumStore(store).params(result['store_index']).name for result in results) == ['m10000', 'm12000', 'm14000']
+
+
+def test_run_grid_failures(tmp_path, install_fake):
+    install_fake(tlusty={'fail': 11000}) # Tlusty fails below 11000 K
+    results = run_grid(_grid(), str(tmp_path / 'grid'), processes=2)
+    assert [result['name'] for result in failed(results)] == ['m10000']
+    assert results[0]['stage'] == 'tlusty'
+
+
+def test_run_grid_unique_names(tmp_path):
+    with pytest.raises(ValueError):
+        run_grid(_grid() * 2, str(tmp_path / 'grid'))
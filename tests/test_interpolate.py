@@ -0,0 +1,78 @@
+import itertools
+import numpy as np
+import pytest
+
+from DAZspec.files import Parameters
+from DAZspec.interpolate import GridInterpolator
+from DAZspec.store import SpectrumStore
+
+
+wave = np.linspace(4000, 4100, 51)
+teffs = [10000, 12000, 15000]
+log_gs = [7.75, 8.1, 8.5]
+log_abns = [-9., -8., -7.]
+
+
+def _flux(teff, log_g, log_abn=-8.):
+    # log10 of the flux is linear in every parameter, so interpolating it is exact
+    return 10**(teff / 1e4 - 0.3 * log_g + 0.05 * log_abn + wave / 1e4)
+
+
+def _points():
+    return np.array(list(itertools.product(teffs, log_gs, log_abns)))
+
+
+def _interpolator(**kwargs):
+    points = _points()
+    order = np.random.default_rng(1).permutation(len(points)) # any order
+    flux = np.array([_flux(*p) for p in points])
+    return GridInterpolator.from_points(points[order], wave, flux[order], names=['teff', 'log_g', 20], **kwargs)
+
+
+def test_nodes():
+    interpolator = _interpolator()
+    assert [len(axis) for axis in interpolator.axes] == [3, 3, 3]
+    points = _points()
+    np.testing.assert_allclose(interpolator.evaluate(points), [_flux(*p) for p in points], rtol=1e-5)
+
+
+def test_log_linear_is_exact():
+    interpolator = _interpolator()
+    points = np.array([[11000, 7.9, -8.5], [14321, 8.4, -7.1], [10000, 8.5, -9.]])
+    np.testing.assert_allclose(interpolator.evaluate(points), [_flux(*p) for p in points], rtol=1e-5)
+    np.testing.assert_allclose(interpolator(11000, 7.9, {20: 10**-8.5}), _flux(11000, 7.9, -8.5), rtol=1e-5)
+
+
+def test_linear_flux():
+    interpolator = _interpolator(log_flux=False)
+    flux = interpolator.evaluate([[11000, 8.1, -8.]])[0]
+    np.testing.assert_allclose(flux, (_flux(10000, 8.1) + _flux(12000, 8.1)) / 2, rtol=1e-5)
+
+
+def test_outside_the_grid():
+    interpolator = _interpolator()
+    with pytest.raises(ValueError):
+        interpolator.evaluate([[9000, 8.0, -8.]])
+    flux = interpolator.evaluate([[16000, 8.0, -8.]], extrapolate=True)[0]
+    np.testing.assert_allclose(flux, _flux(16000, 8.0), rtol=1e-4)
+
+
+def test_incomplete_grid():
+    points = _points()
+    flux = np.array([_flux(*p) for p in points])
+    with pytest.raises(ValueError):
+        GridInterpolator.from_points(points[1:], wave, flux[1:])
+    with pytest.raises(ValueError):
+        GridInterpolator.from_points(np.vstack([points, points[:1]]), wave, np.vstack([flux, flux[:1]]))
+
+
+def test_from_store(tmp_path):
+    store = SpectrumStore(str(tmp_path / 'store'))
+    for i, (teff, log_g, log_abn) in enumerate(_points()):
+        params = Parameters('m%i' % i, teff, log_g, {20: 10**log_abn})
+        store.append(params, wave=wave, flux=_flux(teff, log_g, log_abn), ML=0.8)
+    interpolator = GridInterpolator.from_store(store, elements=[20])
+    # log g is kept as stored, so the axes are exactly the values of the models
+    assert list(interpolator.axes[1]) == log_gs
+    np.testing.assert_allclose(interpolator.axes[2], log_abns)
+    np.testing.assert_allclose(interpolator(13000, 8.3, {20: 1e-8}), _flux(13000, 8.3, -8.), rtol=1e-5)
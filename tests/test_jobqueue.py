@@ -0,0 +1,138 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from DAZspec import fake
+from DAZspec.files import Parameters
+from DAZspec.jobqueue import JobQueue
+from DAZspec.jobqueue import run_queue
+
+
+def _grid(n):
+    return [Parameters('m%02i' % i, 10000 + 500 * i, 8.0, {}) for i in range(n)]
+
+
+def _queue(tmp_path, n, **kwargs):
+    queue = JobQueue(str(tmp_path / 'queue.db'))
+    queue.add(_grid(n), **kwargs)
+    return queue
+
+
+def _claim_all(path, worker):
+    queue = JobQueue(path)
+    names = []
+    try:
+        while True:
+            job = queue.claim(worker=worker)
+            if job is None:
+                return names
+            names.append(job['params'].name)
+    finally:
+        queue.close()
+
+
+def _age(queue, seconds):
+    queue._db.execute("UPDATE jobs SET heartbeat = heartbeat - ? WHERE state = 'running'", (seconds,))
+
+
+def test_add_skips_existing(tmp_path):
+    queue = _queue(tmp_path, 3)
+    assert queue.add(_grid(5)) == 2
+    assert queue.counts()['pending'] == 5
+
+
+def test_claim(tmp_path):
+    queue = _queue(tmp_path, 2, w1=4000, max_attempts=2)
+    job = queue.claim(worker='w')
+    assert job['params'].name == 'm00' and job['attempt'] == 1
+    assert job['kwargs'] == {'w1': 4000}
+    assert queue.claim(worker='w')['params'].name == 'm01'
+    assert queue.claim(worker='w') is None
+    assert queue.counts()['running'] == 2
+    assert not queue.done()
+
+
+def test_concurrent_claims(tmp_path):
+    queue = _queue(tmp_path, 40)
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(_claim_all, queue.path, 'w%i' % i) for i in range(4)]
+        claimed = [name for future in futures for name in future.result()]
+    assert sorted(claimed) == ['m%02i' % i for i in range(40)] # every job exactly once
+    assert queue.counts()['running'] == 40
+
+
+def test_stale_job_is_claimed_again(tmp_path):
+    queue = _queue(tmp_path, 1)
+    first = queue.claim(worker='dead')
+    _age(queue, 1000)
+    job = queue.claim(worker='alive', stale=600)
+    assert job['id'] == first['id'] and job['attempt'] == 2
+    assert queue.jobs()[0]['worker'] == 'alive'
+
+
+def test_heartbeat_keeps_job(tmp_path):
+    queue = _queue(tmp_path, 1)
+    job = queue.claim(worker='w')
+    _age(queue, 1000)
+    queue.heartbeat(job['id'])
+    assert queue.claim(worker='other', stale=600) is None
+
+
+def test_stale_job_fails_after_max_attempts(tmp_path):
+    queue = _queue(tmp_path, 1, max_attempts=1)
+    queue.claim(worker='dead')
+    _age(queue, 1000)
+    assert queue.claim(stale=600) is None
+    job = queue.jobs()[0]
+    assert job['state'] == 'failed' and 'dead' in job['error']
+
+
+def test_finish(tmp_path):
+    queue = _queue(tmp_path, 2, max_attempts=2)
+    dirname = tmp_path / 'm00'
+    dirname.mkdir()
+    fake.write_fort9(str(dirname / 'fort.9'))
+    job = queue.claim()
+    assert queue.finish(job, {'status': 'ok', 'dir': str(dirname), 'stage': 'done'}) == 'converged'
+
+    failed = {'status': 'failed', 'dir': str(tmp_path / 'm01'), 'stage': 'synspec', 'error': 'RuntimeError: x'}
+    job = queue.claim()
+    assert queue.finish(job, failed) == 'retrying'
+    job = queue.claim()
+    assert job['attempt'] == 2
+    assert queue.finish(job, failed) == 'failed'
+    assert queue.done()
+    assert queue.reset() == 1
+    assert queue.counts()['pending'] == 1
+
+
+def test_retry_from_last_atmosphere(tmp_path):
+    queue = _queue(tmp_path, 1, fort5={'frequencies': 300})
+    dirname = tmp_path / 'm00'
+    dirname.mkdir()
+    fake.write_fort7(str(dirname / 'fort.7'), 10000)
+    fake.write_fort9(str(dirname / 'fort.9'), niter=1) # not converged
+    job = queue.claim()
+    assert queue.finish(job, {'status': 'ok', 'dir': str(dirname), 'stage': 'done'}) == 'retrying'
+    assert os.path.exists(dirname / 'fort.8')
+    job = queue.claim()
+    assert job['kwargs']['fort5'] == {'frequencies': 300, 'ltgray': False}
+
+
+def test_run_queue(tmp_path, fakes):
+    path = str(tmp_path / 'queue.db')
+    queue = JobQueue(path)
+    queue.add(_grid(4))
+    counts = run_queue(path, str(tmp_path / 'runs'), processes=2, heartbeat=0.05)
+    assert counts['converged'] == 4
+    # a restart has nothing left to do
+    assert run_queue(path, str(tmp_path / 'runs'), processes=1)['converged'] == 4
+
+
+def test_run_queue_gives_up(tmp_path, install_fake):
+    install_fake(tlusty={'niter': 1}) # never converges
+    path = str(tmp_path / 'queue.db')
+    queue = JobQueue(path)
+    queue.add(_grid(1), max_attempts=3)
+    counts = run_queue(path, str(tmp_path / 'runs'), processes=1)
+    assert counts['failed'] == 1
+    assert queue.jobs()[0]['attempts'] == 3
@@ -0,0 +1,49 @@
+from DAZspec.monitor import ConvergenceMonitor
+from DAZspec.grid import run_model
+
+
+header = ' CONVERGENCE LOG\n ITER   ID      TEMP         NE        MAXIMUM\n'
+
+
+def _iteration(it, change, nd=3):
+    return ''.join(('%5i%5i%12.3E%12.3E%12.3E\n' % (it, d, change / 2, 0., change)).replace('E', 'D') for d in range(1, nd + 1))
+
+
+def _monitor(tmp_path, changes, **kwargs):
+    filename = str(tmp_path / 'fort.9')
+    with open(filename,'w') as file:
+        file.write(header + ''.join(_iteration(it, change) for it, change in enumerate(changes, 1)))
+    monitor = ConvergenceMonitor(filename=filename, **kwargs)
+    monitor.update(final=True)
+    return monitor
+
+
+def test_update_is_incremental(tmp_path):
+    filename = str(tmp_path / 'fort.9')
+    monitor = ConvergenceMonitor(filename=filename)
+    assert monitor.update() == 0 # no file yet
+    with open(filename,'w') as file:
+        file.write(header + _iteration(1, 0.5) + _iteration(2, 0.1)[:30])
+    assert monitor.update() == 0 # iteration 1 is only complete once iteration 2 starts
+    with open(filename,'a') as file:
+        file.write(_iteration(2, 0.1)[30:])
+    assert monitor.update() == 1
+    assert monitor.update(final=True) == 1
+    assert monitor.iters == [1, 2]
+    assert monitor.maximum == [0.5, 0.1]
+    assert monitor.temp == [0.25, 0.05]
+
+
+def test_check(tmp_path):
+    assert _monitor(tmp_path, [1e-1, 1e-2, 1e-3, 1e-4]).check() is None # converging runs are never stopped
+    assert _monitor(tmp_path, [1e-1, 1e-2]).check() is None # fewer than min_iter
+    assert _monitor(tmp_path, [1., 2., 50.]).check() == 'diverged'
+    assert _monitor(tmp_path, [0.1, 0.2, 0.3, 0.4, 0.5], grow=4).check() == 'diverged'
+    assert _monitor(tmp_path, [0.1] + [0.08] * 10, stagnate=10).check() == 'stagnated'
+
+
+def test_run_model(tmp_path, fakes, params):
+    result = run_model(params, str(tmp_path / 'model'), monitor={'interval': 0.01})
+    assert result['status'] == 'ok'
+    assert result['monitor']['reason'] == 'finished'
+    assert result['monitor']['iterations'] == 8
@@ -0,0 +1,68 @@
+import numpy as np
+
+from DAZspec import fake
+from DAZspec.pconv import read_fort9
+from DAZspec.pconv import iteration_max
+from DAZspec.pconv import converged
+
+
+def test_read_fort9(tmp_path):
+    filename = str(tmp_path / 'fort.9')
+    fake.write_fort9(filename, nd=5, niter=3)
+    columns, data = read_fort9(filename)
+    assert columns == ['ITER', 'ID', 'TEMP', 'NE', 'MAXIMUM']
+    assert data.shape == (15, 5)
+    np.testing.assert_allclose(data[:5,2], 0.1 * (1 + np.arange(1, 6) / 5), rtol=1e-3) # D exponents
+
+
+def test_read_fort9_half_written_line(tmp_path):
+    filename = str(tmp_path / 'fort.9')
+    fake.write_fort9(filename, nd=5, niter=2)
+    with open(filename,'a') as file:
+        file.write('    3    1  1.000D-03')
+    columns, data = read_fort9(filename)
+    assert data.shape == (10, 5)
+
+
+def test_iteration_max(tmp_path):
+    # iterations with different numbers of rows and changes of both signs
+    rows = [(1, 1, 0.5, 0., -2.0), (1, 2, -0.7, 0., 1.0), (2, 1, 0.1, 0., 0.3),
+            (3, 1, -1e-4, 0., 2e-4), (3, 2, 1e-5, 0., -5e-4), (3, 3, 2e-5, 0., 1e-4)]
+    filename = str(tmp_path / 'fort.9')
+    with open(filename,'w') as file:
+        file.write(' CONVERGENCE LOG\n ITER   ID      TEMP         NE        MAXIMUM\n')
+        for row in rows:
+            file.write(('%5i%5i%12.3E%12.3E%12.3E\n' % row).replace('E', 'D'))
+    iters, temp, maximum = iteration_max(filename)
+    np.testing.assert_array_equal(iters, [1, 2, 3])
+    np.testing.assert_allclose(temp, [0.7, 0.1, 1e-4])
+    np.testing.assert_allclose(maximum, [2.0, 0.3, 5e-4])
+
+
+def test_iteration_max_matches_loop(tmp_path):
+    filename = str(tmp_path / 'fort.9')
+    fake.write_fort9(filename, nd=70, niter=8)
+    columns, data = read_fort9(filename)
+    iters, temp, maximum = iteration_max(filename)
+    for i, it in enumerate(iters):
+        rows = data[data[:,0] == it]
+        assert temp[i] == np.abs(rows[:,2]).max()
+        assert maximum[i] == np.abs(rows[:,4]).max()
+
+
+def test_iteration_max_empty(tmp_path):
+    filename = str(tmp_path / 'fort.9')
+    with open(filename,'w') as file:
+        file.write(' CONVERGENCE LOG\n ITER   ID      TEMP         NE        MAXIMUM\n')
+    iters, temp, maximum = iteration_max(filename)
+    assert len(iters) == len(temp) == len(maximum) == 0
+
+
+def test_converged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert not converged() # no fort.9
+    fake.write_fort9('fort.9', niter=2)
+    assert not converged()
+    assert converged(tol=0.1)
+    fake.write_fort9('fort.9', niter=8)
+    assert converged()
@@ -0,0 +1,33 @@
+import pytest
+
+from DAZspec import config
+from DAZspec.profiles import get_profile
+from DAZspec.profiles import apply_profile
+from DAZspec.profiles import calibrate
+
+
+def test_get_profile():
+    profile = get_profile('survey')
+    assert set(profile) >= {'fort5', 'fort55', 'aux_params'}
+    profile['fort5']['frequencies'] = 1 # a copy
+    assert config.profiles['survey']['fort5']['frequencies'] != 1
+    with pytest.raises(ValueError):
+        get_profile('missing')
+
+
+def test_apply_profile():
+    kwargs = {'w1': 4000}
+    assert apply_profile(kwargs) is kwargs
+    kwargs = apply_profile({'profile': 'survey', 'fort5': {'lte': False}, 'fort55': {'space': 0.1}})
+    assert 'profile' not in kwargs
+    assert kwargs['fort5'] == dict(config.profiles['survey']['fort5'], lte=False)
+    assert kwargs['fort55']['space'] == 0.1 # explicit settings win
+    assert kwargs['aux_params'] == config.profiles['survey']['aux_params']
+
+
+def test_calibrate(tmp_path, fakes, linelist, params):
+    df = calibrate([params], str(tmp_path), linelist, profiles=['survey', 'standard'], w1=4000, w2=4100)
+    assert list(df['profile']) == ['publication', 'survey', 'standard'] # the reference is run first
+    assert list(df['failed']) == [0, 0, 0]
+    assert df['max_error'][0] == 0
+    assert (tmp_path / 'calibration.json').exists()
@@ -0,0 +1,70 @@
+import os
+import pytest
+
+from DAZspec.scratch import Scratch
+from DAZspec.scratch import clean_stale
+from DAZspec.scratch import prefix
+from DAZspec.grid import run_model
+from DAZspec.grid import run_grid
+from DAZspec.files import Parameters
+
+
+def test_scratch(tmp_path):
+    base = str(tmp_path / 'base')
+    dirname = tmp_path / 'model'
+    dirname.mkdir()
+    (dirname / 'fort.8').write_text('atmosphere')
+    source = tmp_path / 'lines.dat'
+    source.write_text('lines')
+    with Scratch(str(dirname), base=base, keep=['fort.7', '*.tl'], inputs=['fort.8'], links={'fort.19': str(source)}) as path:
+        assert os.path.dirname(path) == base
+        assert os.path.islink(os.path.join(path, 'fort.8')) or os.path.samefile(os.path.join(path, 'fort.8'), dirname / 'fort.8')
+        assert open(os.path.join(path, 'fort.19')).read() == 'lines'
+        for name in ('fort.7', 'model.tl', 'fort.12'):
+            with open(os.path.join(path, name),'w') as file:
+                file.write(name)
+    assert not os.path.exists(path)
+    assert sorted(os.listdir(dirname)) == ['fort.7', 'fort.8', 'model.tl']
+    assert (dirname / 'fort.8').read_text() == 'atmosphere'
+    assert os.listdir(base) == []
+
+
+def test_scratch_removed_on_error(tmp_path):
+    base = str(tmp_path / 'base')
+    with pytest.raises(KeyError):
+        with Scratch(str(tmp_path / 'model'), base=base, keep=['fort.7']) as path:
+            open(os.path.join(path, 'fort.7'),'w').close()
+            raise KeyError('boom')
+    assert os.listdir(base) == []
+    assert os.listdir(tmp_path / 'model') == ['fort.7'] # the outputs are kept for debugging
+
+
+def test_clean_stale(tmp_path):
+    base = tmp_path / 'base'
+    dead = base / ('%s999999999_model_x' % prefix)
+    alive = base / ('%s%i_model_x' % (prefix, os.getpid()))
+    other = base / 'unrelated'
+    for path in (dead, alive, other):
+        path.mkdir(parents=True)
+    assert clean_stale(base=str(base)) == [str(dead)]
+    assert alive.exists() and other.exists()
+
+
+def test_run_model(tmp_path, fakes, linelist, params):
+    base = str(tmp_path / 'base')
+    result = run_model(params, str(tmp_path / 'model'), linelist=linelist, w1=4000, w2=4100, scratch=base, metrics=True)
+    assert result['status'] == 'ok'
+    names = os.listdir(tmp_path / 'model')
+    assert {'fort.7', 'fort.8', 'fort.9', 'aux', 'model.tl'} <= set(names)
+    assert 'fort.19' not in names # inputs and scratch files stay behind
+    assert os.listdir(base) == []
+    assert 'collect' in result['metrics']['stages']
+
+
+def test_run_grid_failure(tmp_path, install_fake):
+    install_fake(tlusty={'fail': 11000})
+    base = str(tmp_path / 'base')
+    results = run_grid([Parameters('m10000', 10000, 8.0, {})], str(tmp_path / 'grid'), scratch=base, processes=1)
+    assert results[0]['status'] == 'failed'
+    assert os.listdir(base) == []
+    assert 'fort.5' in os.listdir(tmp_path / 'grid' / 'm10000')
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pytest
+
+from DAZspec import fake
+from DAZspec.files import write_fort5
+from DAZspec.files import write_fort56
+from DAZspec.files import write_aux
+from DAZspec.shard import chunk_edges
+from DAZspec.shard import stitch
+from DAZspec.shard import synspec_sharded
+from DAZspec.shard import compare_sharded
+from DAZspec.store import read_spectrum
+
+
+def test_chunk_edges():
+    edges = chunk_edges(4000, 4101, 4)
+    assert edges.dtype.kind == 'i'
+    assert edges[0] == 4000 and edges[-1] == 4101
+    assert len(edges) == 5 and np.all(np.diff(edges) >= 25)
+    np.testing.assert_array_equal(chunk_edges(-4000, -4003, 3), [4000, 4001, 4002, 4003]) # vacuum
+
+
+def test_chunk_edges_too_narrow():
+    with pytest.raises(ValueError):
+        chunk_edges(4000, 4002, 3)
+    with pytest.raises(ValueError):
+        chunk_edges(4000, 4100, 0)
+
+
+def _spectrum(filename, wave):
+    np.savetxt(filename, np.column_stack([wave, wave * 2]), fmt=['%10.3f', '%12.4E'])
+    return filename
+
+
+def test_stitch(tmp_path):
+    edges = [4000, 4010, 4020]
+    # both chunks reach 2 A into the other one
+    a = _spectrum(str(tmp_path / 'a'), np.arange(3998, 4012.01, 0.5))
+    b = _spectrum(str(tmp_path / 'b'), np.arange(4008, 4022.01, 0.5))
+    dest = str(tmp_path / 'fort.7')
+    assert stitch([a, b], edges, dest=dest) == 41
+    wave, flux = read_spectrum(dest)
+    np.testing.assert_allclose(wave, np.arange(4000, 4020.01, 0.5))
+    np.testing.assert_allclose(flux, wave * 2)
+
+
+@pytest.fixture
+def synspec_dir(tmp_path, monkeypatch, fakes, params):
+    """
+    A directory that is ready for Synspec apart from fort.55 and fort.19
+    """
+    dirname = tmp_path / 'run'
+    dirname.mkdir()
+    monkeypatch.chdir(dirname)
+    fake.write_fort7('fort.8', params.teff)
+    write_aux('aux', params.teff, params.log_g)
+    write_fort5(params.teff, params.log_g, 'aux')
+    write_fort56(params.abns)
+    return dirname
+
+
+def test_synspec_sharded(synspec_dir, linelist):
+    dirnames = synspec_sharded(4000, 4101, linelist, n_chunks=4, processes=2, overlap=0.3, fort55={'space': 0.05})
+    assert len(dirnames) == 4
+    wave, flux = read_spectrum('fort.7')
+    assert np.all(np.diff(wave) > 0) # no point twice
+    assert wave[0] == 4000 and wave[-1] == 4101
+    assert os.path.exists('fort.17')
+
+
+def test_compare_sharded(synspec_dir, linelist):
+    diff = compare_sharded(4000, 4101, linelist, n_chunks=3, processes=1, overlap=0.3, fort55={'space': 0.05}, tol=1e-6)
+    assert diff < 1e-6
+
+
+def test_negative_overlap(synspec_dir, linelist):
+    with pytest.raises(ValueError):
+        synspec_sharded(4000, 4101, linelist, n_chunks=2, overlap=-1)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from DAZspec.files import Parameters
+from DAZspec.store import SpectrumStore
+from DAZspec.store import read_tl
+
+
+wave = np.linspace(4000, 4100, 101)
+
+
+def test_append_and_read(tmp_path):
+    store = SpectrumStore(str(tmp_path / 'store'))
+    assert len(store) == 0
+    params = Parameters('model', 12000, 7.95, {2: 1e-5, 20: 1e-8})
+    i = store.append(params, wave=wave, flux=wave * 2, ML=0.8)
+    j = store.append(Parameters('other', 20000, 8.0, {}), wave=wave, flux=wave * 3)
+    assert (i, j) == (0, 1)
+    assert len(store) == 2
+    np.testing.assert_array_equal(store.wave(1), wave)
+    np.testing.assert_allclose(store.flux(1), wave * 3, rtol=1e-6)
+    assert store.meta['wave_offset'][1] == store.meta['wave_offset'][0] # the shared grid is stored once
+    restored = store.params(0)
+    assert (restored.name, restored.teff, restored.log_g, restored.abns) == ('model', 12000, 7.95, params.abns)
+    assert list(store.find('other')) == [1]
+    w, flux = store.fluxes()
+    assert flux.shape == (2, len(wave))
+
+
+def test_reopen(tmp_path):
+    SpectrumStore(str(tmp_path / 'store')).append(Parameters('model', 12000, 8.0, {}), wave=wave, flux=wave)
+    store = SpectrumStore(str(tmp_path / 'store'))
+    assert len(store) == 1
+    np.testing.assert_allclose(store.flux(0), wave)
+
+
+def test_different_grids(tmp_path):
+    store = SpectrumStore(str(tmp_path / 'store'))
+    store.append(Parameters('a', 12000, 8.0, {}), wave=wave, flux=wave)
+    store.append(Parameters('b', 12000, 8.0, {}), wave=wave[::2], flux=wave[::2])
+    with pytest.raises(ValueError):
+        store.fluxes()
+
+
+def test_long_name(tmp_path):
+    store = SpectrumStore(str(tmp_path / 'store'))
+    with pytest.raises(ValueError):
+        store.append(Parameters('x' * 200, 12000, 8.0, {}), wave=wave, flux=wave)
+    assert len(store) == 0
+
+
+def test_to_tl(tmp_path):
+    store = SpectrumStore(str(tmp_path / 'store'))
+    store.append(Parameters('model', 12000, 8.0, {20: 1e-8}), wave=wave, flux=wave * 2, ML=0.8)
+    filename = store.to_tl(0, str(tmp_path / 'model'))
+    params, w, flux = read_tl(filename)
+    assert (params.name, params.teff, params.log_g) == ('model', 12000, 8.0)
+    np.testing.assert_allclose(w, wave, atol=1e-3)
+    np.testing.assert_allclose(flux, wave * 2, rtol=1e-4)
+    with open(filename) as file:
+        assert 'ML2 = 0.80' in file.read() # the stored ML2, not a recomputed one